@@ -48,7 +48,7 @@ def create_app():
     init_db()
     
     # Enregistrer les blueprints
-    from app.routes import downloader, merger, analyzer, logs, contact, jurisprudence, library
+    from app.routes import downloader, merger, analyzer, logs, contact, jurisprudence, library, jobs
     app.register_blueprint(downloader.bp)
     app.register_blueprint(merger.bp)
     app.register_blueprint(analyzer.bp)
@@ -56,8 +56,17 @@ def create_app():
     app.register_blueprint(contact.bp)
     app.register_blueprint(jurisprudence.bp)
     app.register_blueprint(library.bp)
+    app.register_blueprint(jobs.bp)
     
     from app.routes import main
     app.register_blueprint(main.bp)
     
+    # Démarrer les workers de la file de jobs (handlers enregistrés par les blueprints)
+    from app.utils.jobs import start_job_workers
+    start_job_workers(app)
+    
+    # Nettoyage de fond de TEMP_FOLDER et de la progression (index d'expiration)
+    from app.utils.storage import start_temp_janitor
+    start_temp_janitor(app)
+    
     return app
@@ -7,22 +7,66 @@ www.myoneart.com
 """
 
 from datetime import datetime
-import sqlite3
 import os
 import json
+import sqlite3
+import time
+import queue
+import atexit
+import threading
+from app.utils.sqlite import get_connection
+from config import Config
 
 DATABASE_PATH = os.path.join(os.getcwd(), 'instance', 'logs.db')
 
+# Version du schéma (PRAGMA user_version), voir _migrate()
+SCHEMA_VERSION = 3
+
+# Logs supprimés par transaction lors du nettoyage (les écritures concurrentes ne sont pas bloquées longtemps)
+CLEAR_LOGS_CHUNK = 5000
+
+# Nouvelles tentatives d'écriture d'un lot de logs en échec (délai doublé à chaque fois)
+LOG_WRITE_RETRIES = 3
+LOG_RETRY_DELAY = 0.5
+
+# Attente entre deux tentatives d'init_db() quand un autre processus migre la base
+INIT_DB_RETRY_DELAY = 2
+
+def _rollback():
+    """Annule la transaction laissée ouverte par une erreur (la connexion du thread est réutilisée)"""
+    try:
+        get_connection(DATABASE_PATH).rollback()
+    except Exception:
+        pass
+
 def init_db():
-    """Initialise la base de données des logs et sessions"""
-    os.makedirs(os.path.dirname(DATABASE_PATH), exist_ok=True)
-    conn = sqlite3.connect(DATABASE_PATH)
+    """
+    Initialise la base de données des logs et sessions
+    
+    La migration d'une grosse base peut dépasser le busy_timeout: les autres
+    workers gunicorn qui démarrent en même temps attendent alors la fin de la
+    migration au lieu d'échouer au boot. En production, lancer plutôt
+    `python migrate_db.py` avant gunicorn (voir deploy_vps.sh).
+    """
+    conn = get_connection(DATABASE_PATH)
+    while True:
+        try:
+            _create_schema(conn)
+            return
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            conn.rollback()
+            print(f"Base {DATABASE_PATH} verrouillée (migration en cours ?), nouvelle tentative dans {INIT_DB_RETRY_DELAY}s")
+            time.sleep(INIT_DB_RETRY_DELAY)
+
+def _create_schema(conn):
     cursor = conn.cursor()
     
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS logs (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT NOT NULL,
+            timestamp INTEGER NOT NULL,
             type TEXT NOT NULL,
             action TEXT NOT NULL,
             details TEXT,
@@ -38,7 +82,6 @@ def init_db():
             target_total INTEGER NOT NULL,
             current_count INTEGER NOT NULL,
             folder TEXT NOT NULL,
-            files TEXT NOT NULL,
             created_at TEXT NOT NULL
         )
     ''')
@@ -69,7 +112,117 @@ def init_db():
     ''')
     
     conn.commit()
-    conn.close()
+    _migrate(conn)
+    
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_logs_type_status_id ON logs (type, status, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_logs_status_id ON logs (status, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs (timestamp)')
+    conn.commit()
+
+def _create_log_rollups(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS log_rollups (
+            hour INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            status TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (hour, type, status)
+        ) WITHOUT ROWID
+    ''')
+
+def _create_upload_session_files(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS upload_session_files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            original_name TEXT NOT NULL,
+            stored_name TEXT NOT NULL,
+            path TEXT NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_upload_session_files_session ON upload_session_files (session_id, id)')
+
+def _migrate(conn):
+    """
+    Met à jour le schéma d'une base existante jusqu'à SCHEMA_VERSION
+    
+    1: logs.timestamp passe d'une date ISO (heure locale) à un entier epoch (secondes),
+       comparable directement et indexable
+    2: compteurs horaires log_rollups (heure, type, statut), calculés sur les logs existants
+    3: les fichiers d'une session d'upload passent de la colonne JSON upload_sessions.files
+       à la table upload_session_files (une ligne par PDF)
+    """
+    if conn.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+        return
+    try:
+        # Plusieurs workers démarrent en même temps: un seul applique la migration,
+        # les autres attendent le verrou (init_db réessaie) puis relisent user_version
+        conn.execute('BEGIN IMMEDIATE')
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if version < 1:
+            columns = {row['name']: row['type'] for row in conn.execute('PRAGMA table_info(logs)')}
+            if columns.get('timestamp', '').upper() == 'TEXT':
+                conn.execute('''
+                    CREATE TABLE logs_epoch (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        timestamp INTEGER NOT NULL,
+                        type TEXT NOT NULL,
+                        action TEXT NOT NULL,
+                        details TEXT,
+                        user_info TEXT,
+                        status TEXT NOT NULL
+                    )
+                ''')
+                # 'utc': les dates ISO étaient enregistrées en heure locale
+                conn.execute('''
+                    INSERT INTO logs_epoch (id, timestamp, type, action, details, user_info, status)
+                    SELECT id, CAST(strftime('%s', timestamp, 'utc') AS INTEGER), type, action, details, user_info, status
+                    FROM logs
+                ''')
+                conn.execute('DROP TABLE logs')
+                conn.execute('ALTER TABLE logs_epoch RENAME TO logs')
+        if version < 2:
+            _create_log_rollups(conn)
+            conn.execute('''
+                INSERT OR REPLACE INTO log_rollups (hour, type, status, count)
+                SELECT timestamp / 3600 * 3600, type, status, COUNT(*)
+                FROM logs
+                GROUP BY timestamp / 3600, type, status
+            ''')
+        if version < 3:
+            _create_upload_session_files(conn)
+            columns = [row['name'] for row in conn.execute('PRAGMA table_info(upload_sessions)')]
+            if 'files' in columns:
+                for row in conn.execute('SELECT session_id, files FROM upload_sessions').fetchall():
+                    conn.executemany('''
+                        INSERT INTO upload_session_files (session_id, original_name, stored_name, path)
+                        VALUES (?, ?, ?, ?)
+                    ''', [
+                        (row['session_id'], f['original_name'], f['stored_name'], f['path'])
+                        for f in json.loads(row['files'])
+                    ])
+                conn.execute('''
+                    CREATE TABLE upload_sessions_v3 (
+                        session_id TEXT PRIMARY KEY,
+                        name TEXT NOT NULL,
+                        target_total INTEGER NOT NULL,
+                        current_count INTEGER NOT NULL,
+                        folder TEXT NOT NULL,
+                        created_at TEXT NOT NULL
+                    )
+                ''')
+                conn.execute('''
+                    INSERT INTO upload_sessions_v3 (session_id, name, target_total, current_count, folder, created_at)
+                    SELECT session_id, name, target_total, current_count, folder, created_at
+                    FROM upload_sessions
+                ''')
+                conn.execute('DROP TABLE upload_sessions')
+                conn.execute('ALTER TABLE upload_sessions_v3 RENAME TO upload_sessions')
+        conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
 
 def add_log(type, action, details=None, user_info=None, status='success'):
     """
@@ -81,42 +234,153 @@ def add_log(type, action, details=None, user_info=None, status='success'):
         details: Détails supplémentaires (optionnel)
         user_info: Information utilisateur (IP, etc.) (optionnel)
         status: Statut (success, error, warning, info)
+    
+    Le log est mis en file et écrit par le thread de log_writer; il n'est écrit
+    directement que si l'écriture asynchrone est désactivée ou la file pleine.
+    """
+    record = (
+        int(time.time()),
+        type,
+        action,
+        details,
+        user_info,
+        status
+    )
+    if Config.LOG_ASYNC and log_writer.submit(record):
+        return True
+    return _insert_logs([record])
+
+def _insert_logs(records):
+    """
+    Écrit des logs (tuples timestamp epoch, type, action, details, user_info, status) en une transaction
+    
+    Les compteurs horaires de log_rollups sont incrémentés dans la même transaction.
     """
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
+        conn = get_connection(DATABASE_PATH)
         cursor = conn.cursor()
         
-        cursor.execute('''
+        cursor.executemany('''
             INSERT INTO logs (timestamp, type, action, details, user_info, status)
             VALUES (?, ?, ?, ?, ?, ?)
-        ''', (
-            datetime.now().isoformat(),
-            type,
-            action,
-            details,
-            user_info,
-            status
-        ))
+        ''', records)
+        
+        rollups = {}
+        for timestamp, type, _, _, _, status in records:
+            key = (timestamp // 3600 * 3600, type, status)
+            rollups[key] = rollups.get(key, 0) + 1
+        cursor.executemany('''
+            INSERT INTO log_rollups (hour, type, status, count) VALUES (?, ?, ?, ?)
+            ON CONFLICT (hour, type, status) DO UPDATE SET count = count + excluded.count
+        ''', [(*key, count) for key, count in rollups.items()])
         
         conn.commit()
-        conn.close()
         return True
     except Exception as e:
+        _rollback()
         print(f"Erreur lors de l'ajout du log: {e}")
         return False
 
-def get_logs(limit=100, type_filter=None, status_filter=None):
+class LogWriter:
+    """Écriture des logs en arrière-plan, par lots
+    
+    Les appelants déposent les logs dans une file bornée; un thread par processus
+    les écrit en une transaction par lot de batch_size logs ou toutes les
+    flush_interval secondes. flush() attend l'écriture des logs déjà en file
+    (appelé par get_logs et à l'arrêt du processus). Un lot en échec (base
+    verrouillée au-delà du busy_timeout...) est retenté, puis écrit log par log.
+    """
+    
+    def __init__(self, batch_size=100, flush_interval=0.2, max_queue=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.thread_pid = None
+    
+    def _ensure_thread(self):
+        # Un thread par processus (après un fork gunicorn, le thread du parent n'existe plus)
+        if self.thread is not None and self.thread_pid == os.getpid() and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.thread is None or self.thread_pid != os.getpid() or not self.thread.is_alive():
+                self.thread_pid = os.getpid()
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+    
+    def submit(self, record):
+        """Met un log en file; False si la file est pleine"""
+        self._ensure_thread()
+        try:
+            self.queue.put_nowait(record)
+            return True
+        except queue.Full:
+            return False
+    
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            records = []
+            flushed = []
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if isinstance(item, threading.Event):
+                    flushed.append(item)
+                    # Un flush() n'attend pas la fin de l'intervalle
+                    deadline = 0
+                else:
+                    records.append(item)
+                if len(records) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            if records:
+                self._write(records)
+            for event in flushed:
+                event.set()
+    
+    def _write(self, records):
+        for attempt in range(LOG_WRITE_RETRIES):
+            if _insert_logs(records):
+                return
+            time.sleep(LOG_RETRY_DELAY * 2 ** attempt)
+        # Dernier recours: un log invalide ne doit pas faire perdre les autres du lot
+        for record in records:
+            if not _insert_logs([record]):
+                print(f"Log non enregistré: {record}")
+    
+    def flush(self, timeout=5):
+        """Attend que les logs en file soient écrits (au plus timeout secondes)"""
+        if self.thread is None or self.thread_pid != os.getpid() or not self.thread.is_alive():
+            return False
+        done = threading.Event()
+        try:
+            self.queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+log_writer = LogWriter(Config.LOG_BATCH_SIZE, Config.LOG_FLUSH_INTERVAL, Config.LOG_QUEUE_SIZE)
+atexit.register(log_writer.flush)
+
+def get_logs(limit=100, type_filter=None, status_filter=None, before_id=None):
     """
-    Récupère les logs de la base de données
+    Récupère les logs de la base de données, du plus récent au plus ancien
     
     Args:
         limit: Nombre maximum de logs à récupérer
         type_filter: Filtrer par type (optionnel)
         status_filter: Filtrer par statut (optionnel)
+        before_id: Curseur de pagination, seuls les logs d'id inférieur sont retournés (optionnel)
     """
+    # Les logs encore en file de ce processus sont écrits avant la lecture
+    log_writer.flush()
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = sqlite3.Row
+        conn = get_connection(DATABASE_PATH)
         cursor = conn.cursor()
         
         query = 'SELECT * FROM logs WHERE 1=1'
@@ -130,6 +394,10 @@ def get_logs(limit=100, type_filter=None, status_filter=None):
             query += ' AND status = ?'
             params.append(status_filter)
         
+        if before_id:
+            query += ' AND id < ?'
+            params.append(before_id)
+        
         query += ' ORDER BY id DESC LIMIT ?'
         params.append(limit)
         
@@ -140,7 +408,7 @@ def get_logs(limit=100, type_filter=None, status_filter=None):
         for row in rows:
             logs.append({
                 'id': row['id'],
-                'timestamp': row['timestamp'],
+                'timestamp': datetime.fromtimestamp(row['timestamp']).isoformat(),
                 'type': row['type'],
                 'action': row['action'],
                 'details': row['details'],
@@ -148,103 +416,202 @@ def get_logs(limit=100, type_filter=None, status_filter=None):
                 'status': row['status']
             })
         
-        conn.close()
         return logs
     except Exception as e:
+        _rollback()
         print(f"Erreur lors de la récupération des logs: {e}")
         return []
 
 def clear_old_logs(days=30):
-    """Supprime les logs de plus de X jours"""
+    """Supprime les logs de plus de X jours (par tranches, via l'index sur timestamp)"""
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
+        conn = get_connection(DATABASE_PATH)
         cursor = conn.cursor()
         
-        cutoff_date = datetime.now().timestamp() - (days * 24 * 60 * 60)
-        
-        cursor.execute('''
-            DELETE FROM logs
-            WHERE datetime(timestamp) < datetime(?, 'unixepoch')
-        ''', (cutoff_date,))
+        cutoff_date = int(time.time()) - (days * 24 * 60 * 60)
         
-        deleted_count = cursor.rowcount
-        conn.commit()
-        conn.close()
+        deleted_count = 0
+        while True:
+            cursor.execute('''
+                DELETE FROM logs
+                WHERE id IN (SELECT id FROM logs WHERE timestamp < ? LIMIT ?)
+            ''', (cutoff_date, CLEAR_LOGS_CHUNK))
+            deleted_count += cursor.rowcount
+            conn.commit()
+            if cursor.rowcount < CLEAR_LOGS_CHUNK:
+                break
         
         return deleted_count
     except Exception as e:
+        _rollback()
         print(f"Erreur lors du nettoyage des logs: {e}")
         return 0
 
-def save_upload_session(session_id, name, target_total, current_count, folder, files):
-    """Sauvegarde ou met à jour une session d'upload"""
+def get_log_stats(since, until=None, bucket='day', type_filter=None, status_filter=None):
+    """
+    Nombre de logs par période, type et statut, lu dans les compteurs horaires
+    
+    Le coût dépend du nombre d'heures couvertes, pas du nombre de logs. Les compteurs
+    sont conservés par clear_old_logs: l'historique reste disponible après purge.
+    
+    Args:
+        since: Début de la période (epoch, secondes)
+        until: Fin de la période (epoch, optionnel: maintenant)
+        bucket: 'hour' ou 'day' (jour en heure locale)
+        type_filter: Filtrer par type (optionnel)
+        status_filter: Filtrer par statut (optionnel)
+    """
+    log_writer.flush()
+    try:
+        conn = get_connection(DATABASE_PATH)
+        cursor = conn.cursor()
+        
+        if bucket == 'hour':
+            period = "strftime('%Y-%m-%dT%H:00', hour, 'unixepoch', 'localtime')"
+        else:
+            period = "strftime('%Y-%m-%d', hour, 'unixepoch', 'localtime')"
+        
+        query = f'SELECT {period} AS period, type, status, SUM(count) AS count FROM log_rollups WHERE hour >= ?'
+        params = [since // 3600 * 3600]
+        
+        if until is not None:
+            query += ' AND hour < ?'
+            params.append(until)
+        
+        if type_filter:
+            query += ' AND type = ?'
+            params.append(type_filter)
+        
+        if status_filter:
+            query += ' AND status = ?'
+            params.append(status_filter)
+        
+        query += ' GROUP BY period, type, status ORDER BY period'
+        
+        cursor.execute(query, params)
+        return [
+            {'period': row['period'], 'type': row['type'], 'status': row['status'], 'count': row['count']}
+            for row in cursor.fetchall()
+        ]
+    except Exception as e:
+        _rollback()
+        print(f"Erreur lors de la récupération des statistiques de logs: {e}")
+        return []
+
+def create_upload_session(session_id, name, target_total, folder):
+    """Crée une session d'upload vide"""
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
+        conn = get_connection(DATABASE_PATH)
         cursor = conn.cursor()
         
         cursor.execute('''
-            INSERT OR REPLACE INTO upload_sessions 
-            (session_id, name, target_total, current_count, folder, files, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO upload_sessions (session_id, name, target_total, current_count, folder, created_at)
+            VALUES (?, ?, ?, 0, ?, ?)
         ''', (
             session_id,
             name,
             target_total,
-            current_count,
             folder,
-            json.dumps(files),
             datetime.now().isoformat()
         ))
         
         conn.commit()
-        conn.close()
         return True
     except Exception as e:
-        print(f"Erreur lors de la sauvegarde de la session d'upload: {e}")
+        _rollback()
+        print(f"Erreur lors de la création de la session d'upload: {e}")
         return False
 
-def get_upload_session(session_id):
-    """Récupère une session d'upload"""
+def add_upload_session_file(session_id, original_name, stored_name, path):
+    """
+    Ajoute un fichier à une session d'upload
+    
+    Le compteur est incrémenté et le fichier inséré dans une même transaction, sans
+    relire la liste des fichiers: des uploads simultanés sur une session ne
+    s'écrasent pas et ne dépassent pas target_total.
+    
+    Returns:
+        {'success': True, 'current_count': ...}, ou {'success': False, 'error': ...}
+        si la session est inexistante ou pleine. Une erreur de base de données est
+        levée (et non confondue avec une session pleine).
+    """
+    conn = get_connection(DATABASE_PATH)
+    cursor = conn.cursor()
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = sqlite3.Row
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('''
+            UPDATE upload_sessions SET current_count = current_count + 1
+            WHERE session_id = ? AND current_count < target_total
+        ''', (session_id,))
+        if cursor.rowcount == 0:
+            cursor.execute('SELECT 1 FROM upload_sessions WHERE session_id = ?', (session_id,))
+            exists = cursor.fetchone() is not None
+            conn.rollback()
+            if not exists:
+                return {'success': False, 'error': 'Session invalide'}
+            return {'success': False, 'error': 'Nombre maximum de PDFs atteint'}
+        
+        cursor.execute('''
+            INSERT INTO upload_session_files (session_id, original_name, stored_name, path)
+            VALUES (?, ?, ?, ?)
+        ''', (session_id, original_name, stored_name, path))
+        cursor.execute('SELECT current_count FROM upload_sessions WHERE session_id = ?', (session_id,))
+        current_count = cursor.fetchone()['current_count']
+        
+        conn.commit()
+        return {'success': True, 'current_count': current_count}
+    except Exception:
+        _rollback()
+        raise
+
+def get_upload_session(session_id, include_files=True):
+    """Récupère une session d'upload (et la liste de ses fichiers si include_files)"""
+    try:
+        conn = get_connection(DATABASE_PATH)
         cursor = conn.cursor()
         
         cursor.execute('SELECT * FROM upload_sessions WHERE session_id = ?', (session_id,))
         row = cursor.fetchone()
-        conn.close()
         
         if row:
-            return {
+            session = {
                 'id': row['session_id'],
                 'name': row['name'],
                 'target_total': row['target_total'],
                 'current_count': row['current_count'],
-                'folder': row['folder'],
-                'files': json.loads(row['files'])
+                'folder': row['folder']
             }
+            if include_files:
+                cursor.execute('''
+                    SELECT original_name, stored_name, path FROM upload_session_files
+                    WHERE session_id = ? ORDER BY id
+                ''', (session_id,))
+                session['files'] = [dict(f) for f in cursor.fetchall()]
+            return session
         return None
     except Exception as e:
+        _rollback()
         print(f"Erreur lors de la récupération de la session d'upload: {e}")
         return None
 
 def delete_upload_session(session_id):
-    """Supprime une session d'upload"""
+    """Supprime une session d'upload et ses fichiers"""
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
+        conn = get_connection(DATABASE_PATH)
         cursor = conn.cursor()
+        cursor.execute('DELETE FROM upload_session_files WHERE session_id = ?', (session_id,))
         cursor.execute('DELETE FROM upload_sessions WHERE session_id = ?', (session_id,))
         conn.commit()
-        conn.close()
         return True
     except Exception as e:
+        _rollback()
         print(f"Erreur lors de la suppression de la session d'upload: {e}")
         return False
 
 def save_jurisprudence_session(session_id, excel_path, csv_path, excel_filename, csv_filename, total, successful, failed):
     """Sauvegarde une session de résultats jurisprudence"""
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
+        conn = get_connection(DATABASE_PATH)
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -264,22 +631,20 @@ def save_jurisprudence_session(session_id, excel_path, csv_path, excel_filename,
         ))
         
         conn.commit()
-        conn.close()
         return True
     except Exception as e:
+        _rollback()
         print(f"Erreur lors de la sauvegarde de la session jurisprudence: {e}")
         return False
 
 def get_jurisprudence_session(session_id):
     """Récupère une session de résultats jurisprudence"""
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = sqlite3.Row
+        conn = get_connection(DATABASE_PATH)
         cursor = conn.cursor()
         
         cursor.execute('SELECT * FROM jurisprudence_sessions WHERE session_id = ?', (session_id,))
         row = cursor.fetchone()
-        conn.close()
         
         if row:
             return {
@@ -293,13 +658,14 @@ def get_jurisprudence_session(session_id):
             }
         return None
     except Exception as e:
+        _rollback()
         print(f"Erreur lors de la récupération de la session jurisprudence: {e}")
         return None
 
 def add_library_pdf(original_name, stored_name, file_path, file_size):
     """Ajoute un PDF à la bibliothèque"""
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
+        conn = get_connection(DATABASE_PATH)
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -315,22 +681,20 @@ def add_library_pdf(original_name, stored_name, file_path, file_size):
         
         pdf_id = cursor.lastrowid
         conn.commit()
-        conn.close()
         return pdf_id
     except Exception as e:
+        _rollback()
         print(f"Erreur lors de l'ajout du PDF: {e}")
         return None
 
 def get_library_pdfs():
     """Récupère tous les PDFs de la bibliothèque"""
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = sqlite3.Row
+        conn = get_connection(DATABASE_PATH)
         cursor = conn.cursor()
         
         cursor.execute('SELECT * FROM library_pdfs ORDER BY uploaded_at DESC')
         rows = cursor.fetchall()
-        conn.close()
         
         pdfs = []
         for row in rows:
@@ -345,19 +709,18 @@ def get_library_pdfs():
         
         return pdfs
     except Exception as e:
+        _rollback()
         print(f"Erreur lors de la récupération des PDFs: {e}")
         return []
 
 def get_library_pdf_by_id(pdf_id):
     """Récupère un PDF spécifique par son ID"""
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = sqlite3.Row
+        conn = get_connection(DATABASE_PATH)
         cursor = conn.cursor()
         
         cursor.execute('SELECT * FROM library_pdfs WHERE id = ?', (pdf_id,))
         row = cursor.fetchone()
-        conn.close()
         
         if row:
             return {
@@ -370,33 +733,34 @@ def get_library_pdf_by_id(pdf_id):
             }
         return None
     except Exception as e:
+        _rollback()
         print(f"Erreur lors de la récupération du PDF: {e}")
         return None
 
 def update_library_pdf_name(pdf_id, new_name):
     """Met à jour le nom d'un PDF"""
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
+        conn = get_connection(DATABASE_PATH)
         cursor = conn.cursor()
         
         cursor.execute('UPDATE library_pdfs SET original_name = ? WHERE id = ?', (new_name, pdf_id))
         conn.commit()
-        conn.close()
         return True
     except Exception as e:
+        _rollback()
         print(f"Erreur lors de la mise à jour du nom: {e}")
         return False
 
 def delete_library_pdf(pdf_id):
     """Supprime un PDF de la bibliothèque"""
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
+        conn = get_connection(DATABASE_PATH)
         cursor = conn.cursor()
         
         cursor.execute('DELETE FROM library_pdfs WHERE id = ?', (pdf_id,))
         conn.commit()
-        conn.close()
         return True
     except Exception as e:
+        _rollback()
         print(f"Erreur lors de la suppression du PDF: {e}")
         return False
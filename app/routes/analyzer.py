@@ -15,13 +15,16 @@ from app.services.pdf_intelligent_analyzer import (
     analyze_pdfs_from_zip,
     analyze_single_pdf
 )
-from app.utils.storage import cleanup_temp_file
+from app.utils.storage import cleanup_temp_file, track_temp
+from app.utils.jobs import job_queue, register_job
+from app.utils.registry import SharedRegistry
+from app.routes.jobs import job_response, is_async_request
 from app.models import add_log
 from config import Config
 
 bp = Blueprint('analyzer', __name__, url_prefix='/analyzer')
 
-analysis_registry = {}
+analysis_registry = SharedRegistry('analyzer.analyses')
 
 @bp.route('/')
 def index():
@@ -31,6 +34,67 @@ def index():
         return render_template('error_api_key.html', service='analyse intelligente')
     return render_template('analyzer.html')
 
+def analyze_job_cleanup(payload):
+    """Supprime le fichier déposé une fois l'analyse enregistrée (ou abandonnée)"""
+    cleanup_temp_file(payload['input_path'])
+
+def analyze_job_failed(payload, error):
+    add_log(
+        'analyzer',
+        f'Exception lors de l\'analyse IA: {error}',
+        status='error'
+    )
+    analyze_job_cleanup(payload)
+
+@register_job('analyzer.analyze', cleanup=analyze_job_cleanup, on_failure=analyze_job_failed)
+def analyze_job(payload):
+    """Analyse IA d'un CSV d'URLs, d'un ZIP ou d'un PDF déposé (exécutée par un worker de la file de jobs)
+    
+    Une exception relance le job: le fichier déposé n'est supprimé qu'une fois le job terminé.
+    """
+    input_type = payload['input_type']
+    input_path = payload['input_path']
+    if input_type == 'csv':
+        with open(input_path, 'rb') as f:
+            csv_content = f.read()
+        result = analyze_pdfs_from_csv(csv_content, current_app.config['TEMP_FOLDER'])
+    elif input_type == 'zip':
+        result = analyze_pdfs_from_zip(input_path, current_app.config['TEMP_FOLDER'])
+    else:
+        result = analyze_single_pdf(input_path, current_app.config['TEMP_FOLDER'], payload['filename'])
+    
+    if result['success']:
+        track_temp(result['excel_path'])
+        analysis_id = str(uuid.uuid4())
+        analysis_registry[analysis_id] = {
+            'file_path': result['excel_path'],
+            'filename': result['filename']
+        }
+        
+        # Logger le succès
+        add_log(
+            'analyzer',
+            f'Analyse IA terminée: {result["successful"]} PDFs analysés avec succès, {result["failed"]} échecs',
+            status='success'
+        )
+        
+        return {
+            'success': True,
+            'analysis_id': analysis_id,
+            'filename': result['filename'],
+            'total': result['total'],
+            'successful': result['successful'],
+            'failed': result['failed']
+        }
+    else:
+        # Logger l'échec
+        add_log(
+            'analyzer',
+            f'Échec de l\'analyse IA: {result.get("error", "Erreur inconnue")}',
+            status='error'
+        )
+        return {'success': False, 'error': result.get('error', 'Erreur inconnue')}
+
 @bp.route('/process', methods=['POST'])
 def process():
     try:
@@ -55,8 +119,10 @@ def process():
                 status='info'
             )
             
-            csv_content = csv_file.read()
-            result = analyze_pdfs_from_csv(csv_content, current_app.config['TEMP_FOLDER'])
+            # Sauvegarder temporairement le CSV pour le worker
+            input_filename = secure_filename(csv_file.filename or 'upload.csv')
+            input_path = os.path.join(current_app.config['TEMP_FOLDER'], f'{uuid.uuid4()}_{input_filename}')
+            csv_file.save(input_path)
             
         elif input_type == 'zip':
             # Traitement du fichier ZIP
@@ -75,15 +141,9 @@ def process():
             )
             
             # Sauvegarder temporairement le ZIP
-            zip_filename = secure_filename(zip_file.filename or 'upload.zip')
-            zip_path = os.path.join(current_app.config['TEMP_FOLDER'], f'{uuid.uuid4()}_{zip_filename}')
-            zip_file.save(zip_path)
-            
-            result = analyze_pdfs_from_zip(zip_path, current_app.config['TEMP_FOLDER'])
-            
-            # Nettoyer le fichier ZIP temporaire
-            if os.path.exists(zip_path):
-                os.remove(zip_path)
+            input_filename = secure_filename(zip_file.filename or 'upload.zip')
+            input_path = os.path.join(current_app.config['TEMP_FOLDER'], f'{uuid.uuid4()}_{input_filename}')
+            zip_file.save(input_path)
             
         elif input_type == 'single':
             # Traitement d'un seul PDF
@@ -102,49 +162,20 @@ def process():
             )
             
             # Sauvegarder temporairement le PDF
-            pdf_filename = secure_filename(pdf_file.filename or 'upload.pdf')
-            pdf_path = os.path.join(current_app.config['TEMP_FOLDER'], f'{uuid.uuid4()}_{pdf_filename}')
-            pdf_file.save(pdf_path)
-            
-            result = analyze_single_pdf(pdf_path, current_app.config['TEMP_FOLDER'], pdf_filename)
-            
-            # Nettoyer le fichier PDF temporaire
-            if os.path.exists(pdf_path):
-                os.remove(pdf_path)
+            input_filename = secure_filename(pdf_file.filename or 'upload.pdf')
+            input_path = os.path.join(current_app.config['TEMP_FOLDER'], f'{uuid.uuid4()}_{input_filename}')
+            pdf_file.save(input_path)
         
         else:
             return jsonify({'success': False, 'error': 'Type d\'input invalide'}), 400
         
-        if result['success']:
-            analysis_id = str(uuid.uuid4())
-            analysis_registry[analysis_id] = {
-                'file_path': result['excel_path'],
-                'filename': result['filename']
-            }
-            
-            # Logger le succès
-            add_log(
-                'analyzer',
-                f'Analyse IA terminée: {result["successful"]} PDFs analysés avec succès, {result["failed"]} échecs',
-                status='success'
-            )
-            
-            return jsonify({
-                'success': True,
-                'analysis_id': analysis_id,
-                'filename': result['filename'],
-                'total': result['total'],
-                'successful': result['successful'],
-                'failed': result['failed']
-            })
-        else:
-            # Logger l'échec
-            add_log(
-                'analyzer',
-                f'Échec de l\'analyse IA: {result.get("error", "Erreur inconnue")}',
-                status='error'
-            )
-            return jsonify({'success': False, 'error': result.get('error', 'Erreur inconnue')}), 500
+        # L'analyse s'exécute dans la file de jobs; la requête attend son résultat sauf si async=1
+        job_id = job_queue.submit('analyzer.analyze', {
+            'input_type': input_type,
+            'input_path': input_path,
+            'filename': input_filename
+        })
+        return job_response(job_id, wait=not is_async_request(request))
     
     except Exception as e:
         # Logger l'exception
@@ -157,10 +188,10 @@ def process():
 
 @bp.route('/download/<analysis_id>')
 def download(analysis_id):
-    if analysis_id not in analysis_registry:
+    file_info = analysis_registry.get(analysis_id)
+    if not file_info:
         return "Fichier introuvable", 404
     
-    file_info = analysis_registry[analysis_id]
     file_path = file_info['file_path']
     filename = file_info['filename']
     
@@ -172,7 +203,6 @@ def download(analysis_id):
     @response.call_on_close
     def cleanup():
         cleanup_temp_file(file_path)
-        if analysis_id in analysis_registry:
-            del analysis_registry[analysis_id]
+        analysis_registry.pop(analysis_id, None)
     
     return response
@@ -14,16 +14,25 @@ import time
 import threading
 import logging
 from werkzeug.utils import secure_filename
-from app.services.pdf_downloader import download_pdfs_and_zip
-from app.utils.storage import cleanup_temp_file, cleanup_old_temp_files
-from app.utils.progress import progress_manager
+from concurrent.futures import ThreadPoolExecutor
+from app.services.pdf_downloader import download_pdfs_and_zip, load_checkpoint, download_budget, DOWNLOAD_ENGINES
+from app.utils.rate_limit import ConcurrencyBudget
+from app.utils.storage import cleanup_temp_file, run_temp_cleanup, track_temp
+from app.utils.progress import progress_manager, TERMINAL_STATUSES
+from app.utils.archive import copy_zip_members, iter_zip_stream
+from app.utils.journal import SnapshotJournal
+from app.utils.jobs import job_queue, register_job, current_cancel_event, JobCancelled
+from app.utils.registry import SharedRegistry
 from app.models import add_log
+from config import Config
 
 logger = logging.getLogger(__name__)
 bp = Blueprint('downloader', __name__, url_prefix='/downloader')
 
-downloads_registry = {}
-batches_registry = {}
+downloads_registry = SharedRegistry('downloader.downloads')
+# Une entrée par session (résumé) et une par lot (URLs, statut): la fin d'un lot ne
+# réécrit que l'entrée de ce lot
+batches_registry = SharedRegistry('downloader.batches')
 
 @bp.route('/')
 def index():
@@ -31,84 +40,128 @@ def index():
 
 @bp.route('/cleanup', methods=['POST'])
 def cleanup():
-    """Nettoie les fichiers temporaires anciens"""
+    """Nettoie les fichiers temporaires échus (index d'expiration) et les sessions de progression inactives"""
     try:
-        cleaned_count = cleanup_old_temp_files(current_app.config['TEMP_FOLDER'], max_age_seconds=3600)
-        progress_manager.cleanup_old_sessions(max_age=3600)
+        cleaned_count = run_temp_cleanup()
         return jsonify({'success': True, 'cleaned_count': cleaned_count})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-def download_worker(session_id, urls_list, temp_folder, batch_num=None, main_session_id=None):
-    """Worker thread pour le téléchargement en arrière-plan"""
-    try:
-        result = download_pdfs_and_zip(urls_list, temp_folder, session_id=session_id)
+def apply_session_event(session_data, event):
+    """Rejoue un événement du journal de session (mise à jour des champs d'un lot)"""
+    batch = session_data['batches'].get(str(event['batch']))
+    if batch is not None:
+        batch.update(event['update'])
+
+def session_journal(session_folder):
+    """session.json (instantané) + session.events.jsonl (fins de lots ajoutées depuis)"""
+    return SnapshotJournal(os.path.join(session_folder, 'session.json'), apply_session_event,
+                           Config.SESSION_JOURNAL_COMPACT_BYTES)
+
+def batch_checkpoint_dir(session_folder, batch_num):
+    """Dossier de reprise d'un lot: journal par URL et PDFs déjà téléchargés"""
+    return os.path.join(session_folder, f'batch_{batch_num}')
+
+def effective_budget(global_budget):
+    """Concurrence maximale d'une session automatique: son budget, plafonné par celui du processus (0 = illimité)"""
+    limits = [limit for limit in (global_budget, download_budget.limit) if limit]
+    return min(limits) if limits else 0
+
+def batch_key(session_id, batch_num):
+    return f'{session_id}:{batch_num}'
+
+def register_session(session_id, total_urls, batch_size, batches, session_folder):
+    """Charge une session dans batches_registry (entrée de session + une entrée par lot)"""
+    entries = {batch_key(session_id, batch_num): batch for batch_num, batch in batches.items()}
+    entries[session_id] = {
+        'total_urls': total_urls,
+        'batch_size': batch_size,
+        'total_batches': len(batches),
+        'session_folder': session_folder
+    }
+    batches_registry.update(entries)
+
+def update_batch(session_id, batch_num, batch_update):
+    """Applique batch_update à l'entrée du lot, si la session est chargée dans batches_registry"""
+    batches_registry.modify(batch_key(session_id, batch_num), lambda batch: {**batch, **batch_update})
+
+def download_worker(session_id, urls_list, temp_folder, batch_num=None, main_session_id=None, engine=None):
+    """Téléchargement d'une liste d'URLs en arrière-plan (exécuté par un job)
+    
+    Une exception relance le job, qui reprend le lot depuis son journal.
+    """
+    checkpoint_dir = batch_checkpoint_dir(temp_folder, batch_num) if batch_num else None
+    result = download_pdfs_and_zip(urls_list, temp_folder, session_id=session_id, engine=engine,
+                                   checkpoint_dir=checkpoint_dir, cancel_event=current_cancel_event())
+    
+    if result['success']:
+        download_id = str(uuid.uuid4())
+        downloads_registry[download_id] = {
+            'file_path': result['zip_path'],
+            'filename': result['filename'],
+            'session_id': session_id
+        }
+        progress_manager.update(session_id,
+            status='ready',
+            download_id=download_id,
+            filename=result['filename'],
+            failed_urls=result.get('failed_urls', []),
+            connections_reused=result.get('connections_reused', 0),
+            cache_hits=result.get('cache_hits', 0),
+            cache_misses=result.get('cache_misses', 0),
+            cache_uncacheable=result.get('cache_uncacheable', 0),
+            compression=result.get('compression')
+        )
         
-        if result['success']:
-            download_id = str(uuid.uuid4())
-            downloads_registry[download_id] = {
-                'file_path': result['zip_path'],
-                'filename': result['filename'],
-                'session_id': session_id
+        # Si c'est un lot manuel, journaliser les métadonnées ET mettre à jour le registre mémoire
+        if batch_num and main_session_id:
+            batch_update = {
+                'completed': True,
+                'download_id': download_id,
+                'zip_path': result['zip_path'],
+                'zip_filename': result['filename'],
+                'success_count': result.get('success_count', 0),
+                'failed_urls': result.get('failed_urls', [])
             }
-            progress_manager.update(session_id,
-                status='ready',
-                download_id=download_id,
-                filename=result['filename'],
-                failed_urls=result.get('failed_urls', [])
-            )
             
-            # Si c'est un lot manuel, sauvegarder les métadonnées dans session.json ET mettre à jour le registre mémoire
-            if batch_num and main_session_id and main_session_id in batches_registry:
-                session_folder = batches_registry[main_session_id]['session_folder']
-                session_file = os.path.join(session_folder, 'session.json')
-                
-                # Mettre à jour le registre en mémoire (pour cohérence immédiate)
-                batch_data = batches_registry[main_session_id]['batches'].get(batch_num)
-                if batch_data:
-                    batch_data['completed'] = True
-                    batch_data['download_id'] = download_id
-                    batch_data['zip_path'] = result['zip_path']
-                    batch_data['zip_filename'] = result['filename']
-                    batch_data['success_count'] = result.get('success_count', 0)
-                    batch_data['failed_urls'] = result.get('failed_urls', [])
-                
-                # Sauvegarder sur disque (pour persistance)
-                try:
-                    with open(session_file, 'r') as f:
-                        session_info = json.load(f)
-                    session_info['batches'][str(batch_num)]['completed'] = True
-                    session_info['batches'][str(batch_num)]['download_id'] = download_id
-                    session_info['batches'][str(batch_num)]['zip_path'] = result['zip_path']
-                    session_info['batches'][str(batch_num)]['zip_filename'] = result['filename']
-                    session_info['batches'][str(batch_num)]['success_count'] = result.get('success_count', 0)
-                    session_info['batches'][str(batch_num)]['failed_urls'] = result.get('failed_urls', [])
-                    with open(session_file, 'w') as f:
-                        json.dump(session_info, f)
-                    logger.info(f"Métadonnées lot {batch_num} sauvegardées (mémoire + disque)")
-                except Exception as e:
-                    logger.error(f"Erreur sauvegarde métadonnées lot {batch_num}: {str(e)}")
+            # Mettre à jour le registre partagé (pour cohérence immédiate)
+            update_batch(main_session_id, batch_num, batch_update)
             
-            # Logger le succès
-            failed_count = len(result.get('failed_urls', []))
-            success_count = result.get('success_count', 0)
-            add_log(
-                'download',
-                f'Téléchargement ZIP terminé: {success_count} fichiers réussis, {failed_count} échecs',
-                status='success'
-            )
-    except Exception as e:
-        progress_manager.update(session_id,
-            status='error',
-            message=f'Erreur: {str(e)}'
-        )
+            # Ajouter l'événement au journal de session (pour persistance)
+            try:
+                session_journal(temp_folder).append({'batch': batch_num, 'update': batch_update})
+                logger.info(f"Métadonnées lot {batch_num} sauvegardées (registre + disque)")
+            except Exception as e:
+                logger.error(f"Erreur sauvegarde métadonnées lot {batch_num}: {str(e)}")
         
-        # Logger l'erreur
+        # Logger le succès
+        failed_count = len(result.get('failed_urls', []))
+        success_count = result.get('success_count', 0)
         add_log(
             'download',
-            f'Erreur lors du téléchargement: {str(e)}',
-            status='error'
+            f'Téléchargement ZIP terminé: {success_count} fichiers réussis, {failed_count} échecs',
+            status='success'
         )
+        return {'success': True, 'download_id': download_id, 'filename': result['filename']}
+    return {'success': False, 'error': result.get('error', 'Erreur inconnue')}
+
+def download_batch_failed(payload, error):
+    progress_manager.update(payload['batch_session_id'],
+        status='error',
+        message=f'Erreur: {error}'
+    )
+    
+    # Logger l'erreur
+    add_log(
+        'download',
+        f'Erreur lors du téléchargement: {error}',
+        status='error'
+    )
+
+@register_job('downloader.batch', on_failure=download_batch_failed)
+def download_batch_job(payload):
+    return download_worker(payload['batch_session_id'], payload['urls'], payload['session_folder'],
+                           payload['batch_num'], payload['main_session_id'], payload.get('engine'))
 
 @bp.route('/prepare_batches', methods=['POST'])
 def prepare_batches():
@@ -152,24 +205,18 @@ def prepare_batches():
     # Créer un dossier de session persistant
     session_folder = os.path.join(current_app.config['TEMP_FOLDER'], f'session_{session_id}')
     os.makedirs(session_folder, exist_ok=True)
+    track_temp(session_folder)
     
-    batches_registry[session_id] = {
-        'total_urls': len(urls_list),
-        'batch_size': batch_size,
-        'batches': batches,
-        'session_folder': session_folder
-    }
+    register_session(session_id, len(urls_list), batch_size, batches, session_folder)
     
     # Sauvegarder la session sur disque (persistant)
-    session_file = os.path.join(session_folder, 'session.json')
-    with open(session_file, 'w') as f:
-        json.dump({
-            'session_id': session_id,
-            'total_urls': len(urls_list),
-            'batch_size': batch_size,
-            'total_batches': total_batches,
-            'batches': {str(k): {**v, 'urls': v['urls']} for k, v in batches.items()}
-        }, f)
+    session_journal(session_folder).write_snapshot({
+        'session_id': session_id,
+        'total_urls': len(urls_list),
+        'batch_size': batch_size,
+        'total_batches': total_batches,
+        'batches': {str(k): {**v, 'urls': v['urls']} for k, v in batches.items()}
+    })
     
     logger.info(f"Lots préparés: {total_batches} lots pour session {session_id}")
     logger.info(f"Session sauvegardée dans {session_folder}")
@@ -192,16 +239,21 @@ def download_batch():
     data = request.get_json()
     session_id = data.get('session_id')
     batch_num = data.get('batch_num')
+    engine = data.get('engine')
     
-    if not session_id or session_id not in batches_registry:
+    session = batches_registry.get(session_id) if session_id else None
+    if not session:
         return jsonify({'success': False, 'error': 'Session invalide'}), 400
     
-    batch_data = batches_registry[session_id]['batches'].get(batch_num)
+    if engine and engine not in DOWNLOAD_ENGINES:
+        return jsonify({'success': False, 'error': f'Moteur invalide (valeurs possibles: {", ".join(DOWNLOAD_ENGINES)})'}), 400
+    
+    batch_data = batches_registry.get(batch_key(session_id, batch_num))
     if not batch_data:
         return jsonify({'success': False, 'error': 'Lot invalide'}), 400
     
     batch_session_id = str(uuid.uuid4())
-    session_folder = batches_registry[session_id]['session_folder']
+    session_folder = session['session_folder']
     
     logger.info(f"Téléchargement lot {batch_num} de session {session_id}, batch_session {batch_session_id}")
     
@@ -213,188 +265,258 @@ def download_batch():
     )
     
     # Stocker dans le dossier de session
-    thread = threading.Thread(
-        target=download_worker,
-        args=(batch_session_id, batch_data['urls'], session_folder, batch_num, session_id)
-    )
-    thread.daemon = True
-    thread.start()
+    job_id = job_queue.submit('downloader.batch', {
+        'batch_session_id': batch_session_id,
+        'urls': batch_data['urls'],
+        'session_folder': session_folder,
+        'batch_num': batch_num,
+        'main_session_id': session_id,
+        'engine': engine
+    })
     
-    logger.info(f"Thread démarré pour lot {batch_num}")
+    logger.info(f"Job {job_id} mis en file pour lot {batch_num}")
     logger.info("=" * 80)
     
     return jsonify({
         'success': True,
         'batch_session_id': batch_session_id,
-        'batch_num': batch_num
+        'batch_num': batch_num,
+        'job_id': job_id
     })
 
-@bp.route('/start_auto_download', methods=['POST'])
-def start_auto_download():
-    """Lance automatiquement tous les lots séquentiellement"""
-    logger.info("=" * 80)
-    logger.info("NOUVELLE REQUÊTE /downloader/start_auto_download")
+def auto_download_failed(payload, error):
+    logger.error(f"AUTO: Erreur globale: {error}")
+    progress_manager.update(payload['auto_session_id'],
+        status='error',
+        message=f"Erreur: {error}"
+    )
+
+@register_job('downloader.auto', on_failure=auto_download_failed)
+def auto_download_job(payload):
+    """Job qui lance les lots en parallèle avec gestion robuste des erreurs
+    
+    L'échec d'un lot est rapporté sans interrompre les autres; une autre exception
+    relance le job, qui repart des lots non terminés du journal de session.
+    """
+    main_session_id = payload['session_id']
+    auto_sess_id = payload['auto_session_id']
+    engine = payload.get('engine')
+    parallel_batches = payload['parallel_batches']
+    global_budget = payload['global_budget']
+    temp_folder = payload['temp_folder']
+    # Les lots tournent dans d'autres threads: l'événement d'annulation du job leur est transmis
+    cancel_event = current_cancel_event()
+    
+    # Charger la session depuis le disque pour robustesse
+    session_folder = os.path.join(temp_folder, f'session_{main_session_id}')
+    journal = session_journal(session_folder)
+    
+    if not journal.exists():
+        logger.error(f"AUTO: Session {main_session_id} introuvable sur disque")
+        progress_manager.update(auto_sess_id,
+            status='error',
+            message="Session introuvable"
+        )
+        return {'success': False, 'error': 'Session introuvable'}
     
-    data = request.get_json()
-    session_id = data.get('session_id')
+    session_data = journal.load()
     
-    if not session_id or session_id not in batches_registry:
-        return jsonify({'success': False, 'error': 'Session invalide'}), 400
+    batches = session_data['batches']
+    total_batches = len(batches)
     
-    auto_session_id = str(uuid.uuid4())
+    progress_manager.create_session(auto_sess_id)
+    progress_manager.update(auto_sess_id,
+        status='processing',
+        current=0,
+        total=total_batches,
+        message=f"Initialisation du téléchargement automatique de {total_batches} lots..."
+    )
     
-    def auto_download_worker(main_session_id, auto_sess_id):
-        """Worker qui lance séquentiellement tous les lots avec gestion robuste des erreurs"""
-        try:
-            # Charger la session depuis le disque pour robustesse
-            temp_folder = current_app.config['TEMP_FOLDER']
-            session_folder = os.path.join(temp_folder, f'session_{main_session_id}')
-            session_file = os.path.join(session_folder, 'session.json')
-            
-            if not os.path.exists(session_file):
-                logger.error(f"AUTO: Session {main_session_id} introuvable sur disque")
-                progress_manager.update(auto_sess_id,
-                    status='error',
-                    message="Session introuvable"
-                )
-                return
-            
-            with open(session_file, 'r') as f:
-                session_data = json.load(f)
-            
-            batches = session_data['batches']
-            total_batches = len(batches)
-            
-            progress_manager.create_session(auto_sess_id)
+    completed_count = 0
+    failed_batches = []
+    state_lock = threading.Lock()
+    # Tous les lots de la session se partagent ce budget, lui-même pris sur le budget
+    # du processus: la concurrence effective est plafonnée par DOWNLOAD_GLOBAL_BUDGET
+    session_budget = ConcurrencyBudget(global_budget, parent=download_budget)
+    
+    pending_batches = []
+    for batch_num_str in sorted(batches.keys(), key=lambda x: int(x)):
+        # Passer les lots déjà complétés
+        if batches[batch_num_str].get('completed', False):
+            logger.info(f"AUTO: Lot {batch_num_str} déjà complété, passage au suivant")
+            completed_count += 1
+            continue
+        pending_batches.append((int(batch_num_str), batches[batch_num_str]))
+    
+    def run_batch(batch_num, batch_data):
+        nonlocal completed_count
+        if cancel_event is not None and cancel_event.is_set():
+            return
+        
+        # Créer une sous-session pour ce lot (progression propre à chaque lot en parallèle)
+        batch_session_id = str(uuid.uuid4())
+        progress_manager.create_session(batch_session_id)
+        
+        logger.info(f"AUTO: Démarrage lot {batch_num}/{total_batches}")
+        
+        with state_lock:
             progress_manager.update(auto_sess_id,
                 status='processing',
-                current=0,
+                current=completed_count,
                 total=total_batches,
-                message=f"Initialisation du téléchargement automatique de {total_batches} lots..."
+                message=f"Traitement du lot {batch_num}/{total_batches} en cours..."
+            )
+        
+        # Télécharger ce lot avec gestion d'erreur
+        try:
+            result = download_pdfs_and_zip(
+                batch_data['urls'],
+                session_folder,
+                session_id=batch_session_id,
+                engine=engine,
+                checkpoint_dir=batch_checkpoint_dir(session_folder, batch_num),
+                budget=session_budget,
+                cancel_event=cancel_event
             )
             
-            completed_count = 0
-            failed_batches = []
-            
-            for batch_num_str in sorted(batches.keys(), key=lambda x: int(x)):
-                batch_num = int(batch_num_str)
-                batch_data = batches[batch_num_str]
+            if result['success']:
+                download_id = str(uuid.uuid4())
+                downloads_registry[download_id] = {
+                    'file_path': result['zip_path'],
+                    'filename': result['filename'],
+                    'session_id': batch_session_id
+                }
                 
-                # Passer les lots déjà complétés
-                if batch_data.get('completed', False):
-                    logger.info(f"AUTO: Lot {batch_num} déjà complété, passage au suivant")
-                    completed_count += 1
-                    continue
+                batch_update = {
+                    'completed': True,
+                    'download_id': download_id,
+                    'zip_path': result['zip_path'],
+                    'zip_filename': result['filename'],
+                    'success_count': result.get('success_count', 0),
+                    'failed_urls': result.get('failed_urls', [])
+                }
                 
-                # Créer une sous-session pour ce lot
-                batch_session_id = str(uuid.uuid4())
+                # Mettre à jour le registre partagé si la session y est chargée
+                update_batch(main_session_id, batch_num, batch_update)
                 
-                logger.info(f"AUTO: Démarrage lot {batch_num}/{total_batches}")
+                # Sauvegarder sur disque (persistance): une ligne ajoutée au journal
+                journal.append({'batch': batch_num, 'update': batch_update})
                 
-                progress_manager.update(auto_sess_id,
-                    status='processing',
-                    current=completed_count,
-                    total=total_batches,
-                    message=f"Traitement du lot {batch_num}/{total_batches} en cours..."
-                )
-                
-                # Télécharger ce lot avec gestion d'erreur
-                try:
-                    result = download_pdfs_and_zip(
-                        batch_data['urls'],
-                        session_folder,
-                        session_id=batch_session_id
+                with state_lock:
+                    completed_count += 1
+                    progress_manager.update(auto_sess_id,
+                        status='processing',
+                        current=completed_count,
+                        total=total_batches,
+                        message=f"Lot {batch_num}/{total_batches} terminé - {result['filename']}"
                     )
-                    
-                    if result['success']:
-                        download_id = str(uuid.uuid4())
-                        downloads_registry[download_id] = {
-                            'file_path': result['zip_path'],
-                            'filename': result['filename'],
-                            'session_id': batch_session_id
-                        }
-                        
-                        # Mettre à jour le registre mémoire si présent
-                        if main_session_id in batches_registry:
-                            batch_data_mem = batches_registry[main_session_id]['batches'].get(batch_num)
-                            if batch_data_mem:
-                                batch_data_mem['completed'] = True
-                                batch_data_mem['download_id'] = download_id
-                                batch_data_mem['zip_path'] = result['zip_path']
-                                batch_data_mem['zip_filename'] = result['filename']
-                                batch_data_mem['success_count'] = result.get('success_count', 0)
-                                batch_data_mem['failed_urls'] = result.get('failed_urls', [])
-                        
-                        # Sauvegarder sur disque (persistance)
-                        with open(session_file, 'r') as f:
-                            session_info = json.load(f)
-                        session_info['batches'][batch_num_str]['completed'] = True
-                        session_info['batches'][batch_num_str]['download_id'] = download_id
-                        session_info['batches'][batch_num_str]['zip_path'] = result['zip_path']
-                        session_info['batches'][batch_num_str]['zip_filename'] = result['filename']
-                        session_info['batches'][batch_num_str]['success_count'] = result.get('success_count', 0)
-                        session_info['batches'][batch_num_str]['failed_urls'] = result.get('failed_urls', [])
-                        with open(session_file, 'w') as f:
-                            json.dump(session_info, f, indent=2)
-                        
-                        completed_count += 1
-                        
-                        progress_manager.update(auto_sess_id,
-                            status='processing',
-                            current=completed_count,
-                            total=total_batches,
-                            message=f"Lot {batch_num}/{total_batches} terminé - {result['filename']}"
-                        )
-                        
-                        logger.info(f"AUTO: Lot {batch_num} terminé - {result['filename']}")
-                    else:
-                        error_msg = result.get('error', 'Erreur inconnue')
-                        logger.error(f"AUTO: Lot {batch_num} échoué - {error_msg}")
-                        failed_batches.append({'batch_num': batch_num, 'error': error_msg})
-                        
-                except Exception as e:
-                    logger.error(f"AUTO: Erreur lors du traitement du lot {batch_num}: {str(e)}", exc_info=True)
-                    failed_batches.append({'batch_num': batch_num, 'error': str(e)})
-            
-            # Tous les lots traités
-            if failed_batches:
-                failed_str = ', '.join([f"Lot {f['batch_num']}" for f in failed_batches])
-                progress_manager.update(auto_sess_id,
-                    status='ready',
-                    current=completed_count,
-                    total=total_batches,
-                    message=f"Téléchargement terminé: {completed_count}/{total_batches} lots réussis. Échecs: {failed_str}"
-                )
-                logger.warning(f"AUTO: Terminé avec {len(failed_batches)} lots en échec")
+                
+                logger.info(f"AUTO: Lot {batch_num} terminé - {result['filename']}")
             else:
-                progress_manager.update(auto_sess_id,
-                    status='ready',
-                    current=completed_count,
-                    total=total_batches,
-                    message=f"Tous les lots téléchargés avec succès ({completed_count}/{total_batches})"
-                )
-                logger.info(f"AUTO: Tous les lots terminés pour session {main_session_id}")
-            
+                error_msg = result.get('error', 'Erreur inconnue')
+                logger.error(f"AUTO: Lot {batch_num} échoué - {error_msg}")
+                with state_lock:
+                    failed_batches.append({'batch_num': batch_num, 'error': error_msg})
+        
+        except JobCancelled:
+            logger.warning(f"AUTO: Lot {batch_num} interrompu (bail du job perdu)")
         except Exception as e:
-            logger.error(f"AUTO: Erreur globale: {str(e)}", exc_info=True)
-            progress_manager.update(auto_sess_id,
-                status='error',
-                message=f"Erreur: {str(e)}"
-            )
+            logger.error(f"AUTO: Erreur lors du traitement du lot {batch_num}: {str(e)}", exc_info=True)
+            with state_lock:
+                failed_batches.append({'batch_num': batch_num, 'error': str(e)})
+    
+    logger.info(f"AUTO: {len(pending_batches)} lots à traiter, {parallel_batches} en parallèle, "
+                f"budget {global_budget or 'illimité'} (effectif {effective_budget(global_budget) or 'illimité'})")
+    with ThreadPoolExecutor(max_workers=parallel_batches) as executor:
+        for batch_num, batch_data in pending_batches:
+            executor.submit(run_batch, batch_num, batch_data)
+    
+    if cancel_event is not None and cancel_event.is_set():
+        raise JobCancelled(f"Téléchargement automatique de la session {main_session_id} interrompu")
+    
+    # Tous les lots traités
+    if failed_batches:
+        failed_str = ', '.join([f"Lot {f['batch_num']}" for f in sorted(failed_batches, key=lambda f: f['batch_num'])])
+        progress_manager.update(auto_sess_id,
+            status='ready',
+            current=completed_count,
+            total=total_batches,
+            message=f"Téléchargement terminé: {completed_count}/{total_batches} lots réussis. Échecs: {failed_str}"
+        )
+        logger.warning(f"AUTO: Terminé avec {len(failed_batches)} lots en échec")
+    else:
+        progress_manager.update(auto_sess_id,
+            status='ready',
+            current=completed_count,
+            total=total_batches,
+            message=f"Tous les lots téléchargés avec succès ({completed_count}/{total_batches})"
+        )
+        logger.info(f"AUTO: Tous les lots terminés pour session {main_session_id}")
+    
+    return {
+        'success': True,
+        'completed_batches': completed_count,
+        'total_batches': total_batches,
+        'failed_batches': failed_batches
+    }
+
+@bp.route('/start_auto_download', methods=['POST'])
+def start_auto_download():
+    """Lance automatiquement tous les lots, parallel_batches à la fois
+    
+    global_budget: téléchargements en cours pour toute la session (0 = illimité).
+    Il est pris sur le budget du processus (DOWNLOAD_GLOBAL_BUDGET), partagé par toutes
+    les sessions automatiques: une valeur supérieure est ramenée à ce plafond.
+    """
+    logger.info("=" * 80)
+    logger.info("NOUVELLE REQUÊTE /downloader/start_auto_download")
+    
+    data = request.get_json()
+    session_id = data.get('session_id')
+    engine = data.get('engine')
+    parallel_batches = data.get('parallel_batches', Config.AUTO_PARALLEL_BATCHES)
+    global_budget = data.get('global_budget', Config.DOWNLOAD_GLOBAL_BUDGET)
+    
+    if not session_id or session_id not in batches_registry:
+        return jsonify({'success': False, 'error': 'Session invalide'}), 400
+    
+    if engine and engine not in DOWNLOAD_ENGINES:
+        return jsonify({'success': False, 'error': f'Moteur invalide (valeurs possibles: {", ".join(DOWNLOAD_ENGINES)})'}), 400
     
-    thread = threading.Thread(
-        target=auto_download_worker,
-        args=(session_id, auto_session_id)
+    # bool est une sous-classe de int: true/false ne sont pas des nombres valides
+    if not isinstance(parallel_batches, int) or isinstance(parallel_batches, bool) or parallel_batches < 1:
+        return jsonify({'success': False, 'error': 'parallel_batches doit être un entier supérieur ou égal à 1'}), 400
+    
+    if not isinstance(global_budget, int) or isinstance(global_budget, bool) or global_budget < 0:
+        return jsonify({'success': False, 'error': 'global_budget doit être un entier positif (0 = illimité)'}), 400
+    
+    auto_session_id = str(uuid.uuid4())
+    progress_manager.create_session(auto_session_id)
+    progress_manager.update(auto_session_id,
+        status='processing',
+        message="Téléchargement automatique en attente d'un worker..."
     )
-    thread.daemon = True
-    thread.start()
     
-    logger.info(f"Thread automatique démarré pour session {session_id}")
+    job_id = job_queue.submit('downloader.auto', {
+        'session_id': session_id,
+        'auto_session_id': auto_session_id,
+        'engine': engine,
+        'parallel_batches': parallel_batches,
+        'global_budget': global_budget,
+        # Le job n'a pas de requête: le dossier est résolu ici
+        'temp_folder': current_app.config['TEMP_FOLDER']
+    })
+    
+    logger.info(f"Job {job_id} de téléchargement automatique mis en file pour session {session_id}")
     logger.info("=" * 80)
     
     return jsonify({
         'success': True,
         'auto_session_id': auto_session_id,
+        'job_id': job_id,
+        'parallel_batches': parallel_batches,
+        'global_budget': global_budget,
+        'effective_budget': effective_budget(global_budget),
         'message': 'Téléchargement automatique démarré'
     })
 
@@ -408,22 +530,21 @@ def list_sessions():
         for item in os.listdir(temp_folder):
             if item.startswith('session_'):
                 session_folder = os.path.join(temp_folder, item)
-                session_file = os.path.join(session_folder, 'session.json')
+                journal = session_journal(session_folder)
                 
-                if os.path.exists(session_file):
-                    with open(session_file, 'r') as f:
-                        session_data = json.load(f)
-                        
-                        # Compter les lots complétés
-                        completed_count = sum(1 for b in session_data['batches'].values() if b.get('completed', False))
-                        
-                        sessions.append({
-                            'session_id': session_data['session_id'],
-                            'total_urls': session_data['total_urls'],
-                            'total_batches': session_data['total_batches'],
-                            'completed_batches': completed_count,
-                            'batch_size': session_data['batch_size']
-                        })
+                if journal.exists():
+                    session_data = journal.load()
+                    
+                    # Compter les lots complétés
+                    completed_count = sum(1 for b in session_data['batches'].values() if b.get('completed', False))
+                    
+                    sessions.append({
+                        'session_id': session_data['session_id'],
+                        'total_urls': session_data['total_urls'],
+                        'total_batches': session_data['total_batches'],
+                        'completed_batches': completed_count,
+                        'batch_size': session_data['batch_size']
+                    })
         
         return jsonify({'success': True, 'sessions': sessions})
     except Exception as e:
@@ -436,13 +557,12 @@ def load_session(session_id):
     try:
         temp_folder = current_app.config['TEMP_FOLDER']
         session_folder = os.path.join(temp_folder, f'session_{session_id}')
-        session_file = os.path.join(session_folder, 'session.json')
+        journal = session_journal(session_folder)
         
-        if not os.path.exists(session_file):
+        if not journal.exists():
             return jsonify({'success': False, 'error': 'Session introuvable'}), 404
         
-        with open(session_file, 'r') as f:
-            session_data = json.load(f)
+        session_data = journal.load()
         
         # Recharger dans le registre avec métadonnées complètes
         batches = {}
@@ -466,13 +586,14 @@ def load_session(session_id):
                     logger.info(f"Lot {batch_num} rechargé: {zip_filename}")
                 else:
                     logger.warning(f"Lot {batch_num}: fichier ZIP introuvable: {zip_path}")
+            elif not batch_info.get('completed'):
+                # Lot interrompu: les URLs déjà journalisées ne seront pas retéléchargées
+                checkpoint_dir = batch_checkpoint_dir(session_folder, batch_num)
+                if os.path.isdir(checkpoint_dir):
+                    completed_urls, _ = load_checkpoint(checkpoint_dir, batch_info['urls'], restore=False)
+                    batch_info['downloaded_count'] = len(completed_urls)
         
-        batches_registry[session_id] = {
-            'total_urls': session_data['total_urls'],
-            'batch_size': session_data['batch_size'],
-            'batches': batches,
-            'session_folder': session_folder
-        }
+        register_session(session_id, session_data['total_urls'], session_data['batch_size'], batches, session_folder)
         
         logger.info(f"Session {session_id} chargée avec succès")
         
@@ -497,8 +618,10 @@ def merge_batches():
     data = request.get_json()
     session_id = data.get('session_id')
     download_ids = data.get('download_ids', [])
+    stream = data.get('stream', Config.STREAM_ZIP_DOWNLOADS)
     
-    if not session_id or session_id not in batches_registry:
+    session = batches_registry.get(session_id) if session_id else None
+    if not session:
         return jsonify({'success': False, 'error': 'Session invalide'}), 400
     
     if not download_ids:
@@ -512,21 +635,54 @@ def merge_batches():
         final_zip_name = f'pdfs_merged_{final_zip_id}.zip'
         final_zip_path = os.path.join(current_app.config['TEMP_FOLDER'], final_zip_name)
         
+        if stream:
+            # Mode streaming: l'archive fusionnée sera générée à la volée par /download/<id>
+            batch_zip_paths = []
+            total_files = 0
+            for download_id in download_ids:
+                batch_info = downloads_registry.get(download_id)
+                if batch_info:
+                    batch_zip_path = batch_info['file_path']
+                    if os.path.exists(batch_zip_path):
+                        with zipfile.ZipFile(batch_zip_path, 'r') as batch_zipf:
+                            total_files += sum(1 for info in batch_zipf.infolist() if not info.is_dir())
+                        batch_zip_paths.append(batch_zip_path)
+            
+            download_id = str(uuid.uuid4())
+            downloads_registry[download_id] = {
+                'stream_sources': batch_zip_paths,
+                'filename': final_zip_name,
+                'session_id': session_id
+            }
+            
+            logger.info(f"Fusion en streaming préparée: {total_files} fichiers depuis {len(batch_zip_paths)} lots")
+            logger.info("=" * 80)
+            
+            return jsonify({
+                'success': True,
+                'download_id': download_id,
+                'filename': final_zip_name,
+                'total_files': total_files,
+                'total_urls': session['total_urls'],
+                'stream': True
+            })
+        
         total_files = 0
+        total_bytes = 0
         
-        with zipfile.ZipFile(final_zip_path, 'w', zipfile.ZIP_DEFLATED) as final_zipf:
+        # Copie brute des membres: ni décompression ni recompression, mémoire constante
+        with zipfile.ZipFile(final_zip_path, 'w') as final_zipf:
             for download_id in download_ids:
-                if download_id in downloads_registry:
-                    batch_zip_path = downloads_registry[download_id]['file_path']
+                batch_info = downloads_registry.get(download_id)
+                if batch_info:
+                    batch_zip_path = batch_info['file_path']
                     
                     if os.path.exists(batch_zip_path):
-                        logger.info(f"Extraction de {batch_zip_path}")
-                        
-                        with zipfile.ZipFile(batch_zip_path, 'r') as batch_zipf:
-                            for file_info in batch_zipf.filelist:
-                                file_data = batch_zipf.read(file_info.filename)
-                                final_zipf.writestr(file_info.filename, file_data)
-                                total_files += 1
+                        logger.info(f"Copie des membres de {batch_zip_path}")
+                        copied, bytes_copied = copy_zip_members(batch_zip_path, final_zipf)
+                        total_files += copied
+                        total_bytes += bytes_copied
+        track_temp(final_zip_path)
         
         download_id = str(uuid.uuid4())
         downloads_registry[download_id] = {
@@ -549,67 +705,171 @@ def merge_batches():
             'download_id': download_id,
             'filename': final_zip_name,
             'total_files': total_files,
-            'total_urls': batches_registry[session_id]['total_urls']
+            'total_urls': session['total_urls'],
+            'total_bytes': total_bytes
         })
         
     except Exception as e:
         logger.error(f"Erreur fusion: {str(e)}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@bp.route('/progress/stream')
+def progress_stream():
+    """Flux SSE unique pour plusieurs sessions (?sessions=id1,id2) ou toutes les sessions actives
+
+    Le premier événement contient l'état complet des sessions suivies; les suivants
+    ne contiennent, par tick, que les champs modifiés de chaque session.
+    """
+    requested = [sid.strip() for sid in request.args.get('sessions', '').split(',') if sid.strip()]
+    logger.info(f"SSE multiplexé: nouvelle connexion ({len(requested) or 'toutes les'} sessions)")
+    
+    def generate():
+        seq = progress_manager.current_seq()
+        missing = []
+        if requested:
+            sent = {}
+            for sid in requested:
+                data = progress_manager.get(sid)
+                if data:
+                    sent[sid] = data
+                else:
+                    missing.append(sid)
+        else:
+            sent = progress_manager.active_sessions(Config.PROGRESS_ACTIVE_SECONDS)
+        watching = set(sent) if requested else None
+        # Sessions terminées d'une liste explicite (fin du flux); inutile pour « toutes les sessions »
+        done = {sid for sid, data in sent.items() if data.get('status') in TERMINAL_STATUSES} if requested else set()
+        yield f"id: {seq}\ndata: {json.dumps({'seq': seq, 'full': True, 'sessions': sent, 'missing': missing})}\n\n"
+        
+        while True:
+            # Avec une liste explicite, le flux se termine quand toutes les sessions sont terminées
+            if watching is not None and watching <= done:
+                break
+            
+            new_seq = progress_manager.wait_changes(seq, Config.PROGRESS_HEARTBEAT_SECONDS)
+            if new_seq == seq:
+                yield f": heartbeat\n\n"
+                continue
+            
+            seq, changed = progress_manager.changes_since(seq)
+            deltas = {}
+            for sid, data in changed.items():
+                if watching is not None and sid not in watching:
+                    continue
+                previous = sent.get(sid, {})
+                delta = {key: value for key, value in data.items() if previous.get(key) != value}
+                if delta:
+                    deltas[sid] = delta
+                    sent[sid] = data
+                if data.get('status') in TERMINAL_STATUSES:
+                    if watching is None:
+                        # Toutes les sessions: on oublie celles qui sont terminées (mémoire bornée)
+                        sent.pop(sid, None)
+                    else:
+                        done.add(sid)
+            
+            if deltas:
+                yield f"id: {seq}\ndata: {json.dumps({'seq': seq, 'sessions': deltas})}\n\n"
+            
+            # Les écritures arrivées pendant le tick sont envoyées ensemble au prochain événement
+            time.sleep(Config.PROGRESS_STREAM_TICK)
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @bp.route('/progress/<session_id>')
 def progress(session_id):
     """Server-Sent Events endpoint pour la progression en temps réel"""
     logger.info(f"SSE: Nouvelle connexion pour session {session_id}")
     
     def generate():
-        last_data_json = None
-        heartbeat_counter = 0
-        iteration = 0
+        version = None
+        events = 0
         
         while True:
-            iteration += 1
-            data = progress_manager.get(session_id)
+            # Bloque jusqu'à la prochaine écriture de la session (pas de relecture à intervalle fixe)
+            new_version, data = progress_manager.wait(session_id, version, Config.PROGRESS_HEARTBEAT_SECONDS)
             
-            if data:
-                data_json = json.dumps(data)
-                
-                if data_json != last_data_json or heartbeat_counter >= 10:
-                    logger.debug(f"SSE [{session_id}] Iter {iteration}: Envoi données - {data_json[:100]}...")
-                    yield f"data: {data_json}\n\n"
-                    last_data_json = data_json
-                    heartbeat_counter = 0
-                else:
-                    logger.debug(f"SSE [{session_id}] Iter {iteration}: Heartbeat")
-                    yield f": heartbeat\n\n"
-                    heartbeat_counter += 1
-                
-                if data.get('status') in ['completed', 'ready', 'error']:
-                    logger.info(f"SSE [{session_id}] Terminé avec status: {data.get('status')}")
-                    break
-            else:
+            if not data:
                 logger.warning(f"SSE [{session_id}] Session non trouvée!")
                 yield f"data: {json.dumps({'status': 'not_found'})}\n\n"
                 break
             
-            time.sleep(0.3)
+            if new_version != version:
+                version = new_version
+                events += 1
+                yield f"id: {version}\ndata: {json.dumps(data)}\n\n"
+            else:
+                yield f": heartbeat\n\n"
+            
+            if data.get('status') in TERMINAL_STATUSES:
+                logger.info(f"SSE [{session_id}] Terminé avec status: {data.get('status')}")
+                break
         
-        logger.info(f"SSE [{session_id}] Connexion fermée après {iteration} itérations")
+        logger.info(f"SSE [{session_id}] Connexion fermée après {events} événements")
     
     response = Response(stream_with_context(generate()), mimetype='text/event-stream')
     response.headers['Cache-Control'] = 'no-cache'
     response.headers['X-Accel-Buffering'] = 'no'
     return response
 
+@bp.route('/progress/<session_id>/poll')
+def progress_poll(session_id):
+    """Long-poll de la progression (clients derrière un proxy qui bufferise le SSE)
+
+    Le client renvoie la version reçue; la réponse arrive dès que la session change
+    ou après timeout secondes (changed=false).
+    """
+    since_version = request.args.get('version', type=int)
+    timeout = min(request.args.get('timeout', Config.PROGRESS_LONG_POLL_TIMEOUT, type=float),
+                  Config.PROGRESS_LONG_POLL_TIMEOUT)
+    
+    version, data = progress_manager.wait(session_id, since_version, max(timeout, 0))
+    if not data:
+        return jsonify({'success': False, 'error': 'Session introuvable'}), 404
+    
+    response = jsonify({
+        'success': True,
+        'version': version,
+        'changed': version != since_version,
+        'progress': data
+    })
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @bp.route('/download/<download_id>')
 def download(download_id):
-    """Télécharge le ZIP final fusionné (avec suppression)"""
-    if download_id not in downloads_registry:
+    """Télécharge le ZIP final fusionné (avec suppression)
+
+    Une fusion préparée en mode streaming (stream_sources) est générée à la volée;
+    sinon le ZIP déjà écrit sur disque (lot ou fusion classique) est envoyé tel quel.
+    """
+    file_info = downloads_registry.get(download_id)
+    if not file_info:
         return "Fichier introuvable", 404
     
-    file_info = downloads_registry[download_id]
-    file_path = file_info['file_path']
     filename = file_info['filename']
     
+    if 'stream_sources' in file_info:
+        # Archive générée à la volée depuis les ZIPs des lots (conservés)
+        sources = [path for path in file_info['stream_sources'] if os.path.exists(path)]
+        if not sources:
+            return "Fichier introuvable", 404
+        
+        response = Response(iter_zip_stream(zip_sources=sources), mimetype='application/zip')
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response.headers['X-Accel-Buffering'] = 'no'
+        
+        @response.call_on_close
+        def forget():
+            downloads_registry.pop(download_id, None)
+        
+        return response
+    
+    file_path = file_info['file_path']
+    
     if not os.path.exists(file_path):
         return "Fichier introuvable", 404
     
@@ -618,18 +878,17 @@ def download(download_id):
     @response.call_on_close
     def cleanup():
         cleanup_temp_file(file_path)
-        if download_id in downloads_registry:
-            del downloads_registry[download_id]
+        downloads_registry.pop(download_id, None)
     
     return response
 
 @bp.route('/download_batch_zip/<download_id>')
 def download_batch_zip(download_id):
     """Télécharge le ZIP d'un lot individuel (sans suppression pour permettre plusieurs téléchargements)"""
-    if download_id not in downloads_registry:
+    file_info = downloads_registry.get(download_id)
+    if not file_info:
         return "Fichier introuvable", 404
     
-    file_info = downloads_registry[download_id]
     file_path = file_info['file_path']
     filename = file_info['filename']
     
@@ -0,0 +1,52 @@
+"""
+PdfTools
+MOA Digital Agency LLC
+Par : Aisance KALONJI
+Mail : moa@myoneart.com
+www.myoneart.com
+"""
+
+from flask import Blueprint, jsonify, url_for
+from app.utils.jobs import job_queue
+from config import Config
+
+bp = Blueprint('jobs', __name__, url_prefix='/jobs')
+
+def is_async_request(req):
+    """Le client demande une réponse immédiate (job_id) au lieu d'attendre le résultat"""
+    value = req.args.get('async') or req.form.get('async')
+    if value is None and req.is_json:
+        value = (req.get_json(silent=True) or {}).get('async')
+    return str(value).lower() in ('1', 'true', 'on')
+
+def job_response(job_id, wait=True):
+    """Réponse HTTP d'un job: son résultat s'il se termine dans JOB_WAIT_TIMEOUT, sinon 202 + job_id"""
+    job = job_queue.wait(job_id, Config.JOB_WAIT_TIMEOUT) if wait else job_queue.get(job_id)
+    if job['status'] == 'done':
+        result = job['result']
+        return jsonify(result), 200 if result.get('success') else 500
+    if job['status'] == 'failed':
+        return jsonify({'success': False, 'job_id': job_id, 'error': job['error']}), 500
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status': job['status'],
+        'status_url': url_for('jobs.status', job_id=job_id)
+    }), 202
+
+@bp.route('/<job_id>')
+def status(job_id):
+    """État d'un job: queued, running, done ou failed (avec son résultat une fois terminé)"""
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Job introuvable'}), 404
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'kind': job['kind'],
+        'status': job['status'],
+        'attempts': job['attempts'],
+        'max_attempts': job['max_attempts'],
+        'result': job['result'],
+        'error': job['error']
+    })
@@ -11,12 +11,17 @@ import os
 import uuid
 import zipfile
 import shutil
+import logging
 from werkzeug.utils import secure_filename
 from app.services.pdf_jurisprudence_extractor_rule_based import JurisprudenceExtractor
-from app.utils.storage import cleanup_temp_file
+from app.utils.storage import cleanup_temp_file, track_temp
+from app.utils.archive import CompressionPolicy
+from app.utils.jobs import job_queue, register_job
+from app.routes.jobs import job_response, is_async_request
 from app.models import (
     add_log, 
-    save_upload_session, 
+    create_upload_session, 
+    add_upload_session_file, 
     get_upload_session, 
     delete_upload_session,
     save_jurisprudence_session,
@@ -24,6 +29,7 @@ from app.models import (
 )
 from config import Config
 
+logger = logging.getLogger(__name__)
 bp = Blueprint('jurisprudence', __name__, url_prefix='/jurisprudence')
 
 @bp.route('/')
@@ -43,8 +49,9 @@ def create_session():
         session_id = str(uuid.uuid4())
         session_folder = os.path.join(current_app.config['TEMP_FOLDER'], f'session_{session_id}')
         os.makedirs(session_folder, exist_ok=True)
+        track_temp(session_folder)
         
-        save_upload_session(session_id, name, total, 0, session_folder, [])
+        create_upload_session(session_id, name, total, session_folder)
         
         add_log('jurisprudence', f'Session créée: {name} (ID: {session_id}, Target: {total} PDFs)', status='info')
         
@@ -87,7 +94,7 @@ def add_pdf():
         if not session_id:
             return jsonify({'success': False, 'error': 'Session invalide'}), 400
         
-        session = get_upload_session(session_id)
+        session = get_upload_session(session_id, include_files=False)
         if not session:
             return jsonify({'success': False, 'error': 'Session invalide'}), 400
         
@@ -110,25 +117,19 @@ def add_pdf():
         
         pdf_file.save(file_path)
         
-        session['files'].append({
-            'original_name': filename,
-            'stored_name': unique_filename,
-            'path': file_path
-        })
-        session['current_count'] += 1
-        
-        save_upload_session(
-            session_id,
-            session['name'],
-            session['target_total'],
-            session['current_count'],
-            session['folder'],
-            session['files']
-        )
+        # La place est réservée atomiquement: un autre upload a pu remplir la session entre-temps
+        try:
+            result = add_upload_session_file(session_id, filename, unique_filename, file_path)
+        except Exception:
+            os.remove(file_path)
+            raise
+        if not result['success']:
+            os.remove(file_path)
+            return jsonify({'success': False, 'error': result['error']}), 400
         
         return jsonify({
             'success': True,
-            'current_count': session['current_count'],
+            'current_count': result['current_count'],
             'filename': filename
         })
     
@@ -136,6 +137,82 @@ def add_pdf():
         add_log('jurisprudence', f'Erreur ajout PDF: {str(e)}', status='error')
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def analyze_session_cleanup(payload):
+    """Supprime la session d'upload et ses PDFs une fois l'analyse enregistrée"""
+    session = get_upload_session(payload['session_id'], include_files=False)
+    if session and os.path.exists(session['folder']):
+        shutil.rmtree(session['folder'])
+    delete_upload_session(payload['session_id'])
+
+def analyze_session_failed(payload, error):
+    # La session d'upload est conservée: l'analyse peut être relancée
+    add_log('jurisprudence', f'Erreur exception analyse: {error}', status='error')
+
+@register_job('jurisprudence.analyze_session', cleanup=analyze_session_cleanup, on_failure=analyze_session_failed)
+def analyze_session_job(payload):
+    """Extraction jurisprudence des PDFs d'une session d'upload (exécutée par un worker de la file de jobs)
+    
+    Une exception relance le job: la session d'upload n'est supprimée qu'une fois le job terminé.
+    """
+    session_id = payload['session_id']
+    session = get_upload_session(session_id)
+    if not session:
+        return {'success': False, 'error': 'Session invalide'}
+    
+    add_log(
+        'jurisprudence',
+        f'Démarrage analyse session {session["name"]}: {session["current_count"]} PDFs',
+        status='info'
+    )
+    
+    # Nom propre à la tentative: une tentative reprise après un bail perdu peut tourner en même temps
+    zip_path = os.path.join(current_app.config['TEMP_FOLDER'], f'{session_id}_{uuid.uuid4().hex[:8]}_pdfs.zip')
+    
+    policy = CompressionPolicy()
+    with zipfile.ZipFile(zip_path, 'w') as zipf:
+        for file_info in session['files']:
+            policy.write(zipf, file_info['path'], file_info['stored_name'])
+    compression = policy.stats()
+    logger.info(f"ZIP d'analyse {zip_path}: {compression['bytes_saved']} octets économisés, "
+                f"{compression['cpu_seconds']}s CPU de compression")
+    
+    try:
+        result = JurisprudenceExtractor.extract_from_zip_both_formats(zip_path, current_app.config['TEMP_FOLDER'])
+    finally:
+        if os.path.exists(zip_path):
+            os.remove(zip_path)
+    
+    if result['success']:
+        result_session_id = str(uuid.uuid4())
+        save_jurisprudence_session(
+            result_session_id,
+            result['excel_path'],
+            result['csv_path'],
+            result['excel_filename'],
+            result['csv_filename'],
+            result['total'],
+            result['successful'],
+            result['failed']
+        )
+        
+        add_log(
+            'jurisprudence',
+            f'Analyse terminée: {result["successful"]} documents traités avec succès, {result["failed"]} échecs',
+            status='success'
+        )
+        
+        return {
+            'success': True,
+            'session_id': result_session_id,
+            'total': result['total'],
+            'success_count': result['successful'],
+            'failed_count': result['failed']
+        }
+    else:
+        error_msg = result.get('error', 'Erreur lors de l\'extraction')
+        add_log('jurisprudence', f'Échec de l\'analyse: {error_msg}', status='error')
+        return {'success': False, 'error': error_msg}
+
 @bp.route('/analyze_session', methods=['POST'])
 def analyze_session():
     try:
@@ -145,65 +222,15 @@ def analyze_session():
         if not session_id:
             return jsonify({'success': False, 'error': 'Session invalide'}), 400
         
-        session = get_upload_session(session_id)
+        session = get_upload_session(session_id, include_files=False)
         if not session:
             return jsonify({'success': False, 'error': 'Session invalide'}), 400
         
         if session['current_count'] == 0:
             return jsonify({'success': False, 'error': 'Aucun PDF à analyser'}), 400
         
-        add_log(
-            'jurisprudence',
-            f'Démarrage analyse session {session["name"]}: {session["current_count"]} PDFs',
-            status='info'
-        )
-        
-        zip_path = os.path.join(current_app.config['TEMP_FOLDER'], f'{session_id}_pdfs.zip')
-        
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for file_info in session['files']:
-                zipf.write(file_info['path'], arcname=file_info['stored_name'])
-        
-        result = JurisprudenceExtractor.extract_from_zip_both_formats(zip_path, current_app.config['TEMP_FOLDER'])
-        
-        if os.path.exists(zip_path):
-            os.remove(zip_path)
-        
-        if os.path.exists(session['folder']):
-            shutil.rmtree(session['folder'])
-        
-        delete_upload_session(session_id)
-        
-        if result['success']:
-            result_session_id = str(uuid.uuid4())
-            save_jurisprudence_session(
-                result_session_id,
-                result['excel_path'],
-                result['csv_path'],
-                result['excel_filename'],
-                result['csv_filename'],
-                result['total'],
-                result['successful'],
-                result['failed']
-            )
-            
-            add_log(
-                'jurisprudence',
-                f'Analyse terminée: {result["successful"]} documents traités avec succès, {result["failed"]} échecs',
-                status='success'
-            )
-            
-            return jsonify({
-                'success': True,
-                'session_id': result_session_id,
-                'total': result['total'],
-                'success_count': result['successful'],
-                'failed_count': result['failed']
-            })
-        else:
-            error_msg = result.get('error', 'Erreur lors de l\'extraction')
-            add_log('jurisprudence', f'Échec de l\'analyse: {error_msg}', status='error')
-            return jsonify({'success': False, 'error': error_msg}), 500
+        job_id = job_queue.submit('jurisprudence.analyze_session', {'session_id': session_id})
+        return job_response(job_id, wait=not is_async_request(request))
     
     except Exception as e:
         add_log('jurisprudence', f'Erreur exception analyse: {str(e)}', status='error')
@@ -239,6 +266,55 @@ def download(session_id, format_type):
     except Exception as e:
         return f"Erreur: {str(e)}", 500
 
+def process_zip_cleanup(payload):
+    """Supprime le ZIP déposé une fois l'extraction enregistrée (ou abandonnée)"""
+    if os.path.exists(payload['zip_path']):
+        os.remove(payload['zip_path'])
+
+def process_zip_failed(payload, error):
+    add_log('jurisprudence', f'Erreur exception: {error}', status='error')
+    process_zip_cleanup(payload)
+
+@register_job('jurisprudence.process_zip', cleanup=process_zip_cleanup, on_failure=process_zip_failed)
+def process_zip_job(payload):
+    """Extraction jurisprudence d'un ZIP déposé (exécutée par un worker de la file de jobs)
+    
+    Une exception relance le job: le ZIP déposé n'est supprimé qu'une fois le job terminé.
+    """
+    zip_path = payload['zip_path']
+    result = JurisprudenceExtractor.extract_from_zip_both_formats(zip_path, current_app.config['TEMP_FOLDER'])
+    
+    if result['success']:
+        session_id = str(uuid.uuid4())
+        save_jurisprudence_session(
+            session_id,
+            result['excel_path'],
+            result['csv_path'],
+            result['excel_filename'],
+            result['csv_filename'],
+            result['total'],
+            result['successful'],
+            result['failed']
+        )
+        
+        add_log(
+            'jurisprudence',
+            f'Extraction terminée: {result["successful"]} documents traités avec succès, {result["failed"]} échecs',
+            status='success'
+        )
+        
+        return {
+            'success': True,
+            'session_id': session_id,
+            'total': result['total'],
+            'success_count': result['successful'],
+            'failed_count': result['failed']
+        }
+    else:
+        error_msg = result.get('error', 'Erreur lors de l\'extraction')
+        add_log('jurisprudence', f'Échec de l\'extraction: {error_msg}', status='error')
+        return {'success': False, 'error': error_msg}
+
 @bp.route('/process_zip', methods=['POST'])
 def process_zip():
     """Route maintenue pour compatibilité ascendante"""
@@ -260,41 +336,8 @@ def process_zip():
         zip_path = os.path.join(current_app.config['TEMP_FOLDER'], f'{uuid.uuid4()}_{zip_filename}')
         zip_file.save(zip_path)
         
-        result = JurisprudenceExtractor.extract_from_zip_both_formats(zip_path, current_app.config['TEMP_FOLDER'])
-        
-        if os.path.exists(zip_path):
-            os.remove(zip_path)
-        
-        if result['success']:
-            session_id = str(uuid.uuid4())
-            save_jurisprudence_session(
-                session_id,
-                result['excel_path'],
-                result['csv_path'],
-                result['excel_filename'],
-                result['csv_filename'],
-                result['total'],
-                result['successful'],
-                result['failed']
-            )
-            
-            add_log(
-                'jurisprudence',
-                f'Extraction terminée: {result["successful"]} documents traités avec succès, {result["failed"]} échecs',
-                status='success'
-            )
-            
-            return jsonify({
-                'success': True,
-                'session_id': session_id,
-                'total': result['total'],
-                'success_count': result['successful'],
-                'failed_count': result['failed']
-            })
-        else:
-            error_msg = result.get('error', 'Erreur lors de l\'extraction')
-            add_log('jurisprudence', f'Échec de l\'extraction: {error_msg}', status='error')
-            return jsonify({'success': False, 'error': error_msg}), 500
+        job_id = job_queue.submit('jurisprudence.process_zip', {'zip_path': zip_path})
+        return job_response(job_id, wait=not is_async_request(request))
     
     except Exception as e:
         add_log('jurisprudence', f'Erreur exception: {str(e)}', status='error')
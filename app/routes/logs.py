@@ -6,11 +6,18 @@ Mail : moa@myoneart.com
 www.myoneart.com
 """
 
+import time
 from flask import Blueprint, render_template, request, jsonify
-from app.models import get_logs, clear_old_logs
+from app.models import get_logs, clear_old_logs, get_log_stats
 
 bp = Blueprint('logs', __name__, url_prefix='/logs')
 
+# Taille maximale d'une page de /logs/api/logs
+MAX_API_LIMIT = 1000
+
+# Période maximale couverte par /logs/api/stats (en jours)
+MAX_STATS_DAYS = 366
+
 @bp.route('/')
 def index():
     """Affiche la page des logs"""
@@ -24,14 +31,62 @@ def index():
 
 @bp.route('/api/logs')
 def get_logs_api():
-    """API pour récupérer les logs en JSON"""
+    """API pour récupérer les logs en JSON
+    
+    Pagination par curseur: passer le next_cursor de la réponse dans ?cursor= pour
+    obtenir les logs plus anciens; next_cursor vaut null sur la dernière page.
+    """
     type_filter = request.args.get('type')
     status_filter = request.args.get('status')
-    limit = int(request.args.get('limit', 100))
+    limit = min(int(request.args.get('limit', 100)), MAX_API_LIMIT)
+    cursor = request.args.get('cursor', type=int)
     
-    logs = get_logs(limit=limit, type_filter=type_filter, status_filter=status_filter)
+    logs = get_logs(limit=limit, type_filter=type_filter, status_filter=status_filter, before_id=cursor)
+    next_cursor = logs[-1]['id'] if logs and len(logs) == limit else None
+    
+    return jsonify({'success': True, 'logs': logs, 'count': len(logs), 'next_cursor': next_cursor})
+
+@bp.route('/api/stats')
+def get_stats_api():
+    """Volume de logs et taux d'erreur par période, lus dans les compteurs horaires
+    
+    Paramètres: days (30 par défaut), bucket ('day' ou 'hour'), type, status.
+    """
+    days = min(request.args.get('days', 30, type=int), MAX_STATS_DAYS)
+    bucket = 'hour' if request.args.get('bucket') == 'hour' else 'day'
+    type_filter = request.args.get('type')
+    status_filter = request.args.get('status')
+    
+    rows = get_log_stats(int(time.time()) - days * 24 * 3600, bucket=bucket,
+                         type_filter=type_filter, status_filter=status_filter)
+    
+    periods = {}
+    by_type = {}
+    by_status = {}
+    for row in rows:
+        period = periods.setdefault(row['period'], {'period': row['period'], 'total': 0, 'errors': 0, 'by_type': {}})
+        period['total'] += row['count']
+        if row['status'] == 'error':
+            period['errors'] += row['count']
+        period['by_type'][row['type']] = period['by_type'].get(row['type'], 0) + row['count']
+        by_type[row['type']] = by_type.get(row['type'], 0) + row['count']
+        by_status[row['status']] = by_status.get(row['status'], 0) + row['count']
+    
+    series = list(periods.values())
+    for period in series:
+        period['error_rate'] = round(period['errors'] / period['total'], 4) if period['total'] else 0
+    total = sum(by_status.values())
     
-    return jsonify({'success': True, 'logs': logs, 'count': len(logs)})
+    return jsonify({
+        'success': True,
+        'bucket': bucket,
+        'days': days,
+        'series': series,
+        'by_type': by_type,
+        'by_status': by_status,
+        'total': total,
+        'error_rate': round(by_status.get('error', 0) / total, 4) if total else 0
+    })
 
 @bp.route('/clear-old', methods=['POST'])
 def clear_old():
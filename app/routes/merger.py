@@ -6,23 +6,112 @@ Mail : moa@myoneart.com
 www.myoneart.com
 """
 
-from flask import Blueprint, render_template, request, jsonify, send_file, current_app
+from flask import Blueprint, render_template, request, jsonify, send_file, current_app, Response
 import os
 import uuid
 import zipfile
 from werkzeug.utils import secure_filename
 from app.services.pdf_merger import merge_pdfs_from_zip
-from app.utils.storage import cleanup_temp_file
+from app.utils.storage import cleanup_temp_file, track_temp
+from app.utils.archive import CompressionPolicy, iter_zip_stream
+from app.utils.jobs import job_queue, register_job
+from app.utils.registry import SharedRegistry
+from app.routes.jobs import job_response, is_async_request
 from app.models import add_log
+from config import Config
 
 bp = Blueprint('merger', __name__, url_prefix='/merger')
 
-downloads_registry = {}
+downloads_registry = SharedRegistry('merger.downloads')
 
 @bp.route('/')
 def index():
     return render_template('merger.html')
 
+def merge_job_cleanup(payload):
+    """Supprime le ZIP déposé une fois la fusion enregistrée (ou abandonnée)"""
+    cleanup_temp_file(payload['upload_path'])
+
+def merge_job_failed(payload, error):
+    add_log(
+        'merger',
+        f'Exception lors de la fusion: {error}',
+        status='error'
+    )
+    merge_job_cleanup(payload)
+
+@register_job('merger.merge', cleanup=merge_job_cleanup, on_failure=merge_job_failed)
+def merge_job(payload):
+    """Fusion des PDFs d'un ZIP déposé (exécutée par un worker de la file de jobs)
+    
+    Une exception relance le job: le ZIP déposé n'est supprimé qu'une fois le job terminé.
+    """
+    upload_path = payload['upload_path']
+    stream = payload['stream']
+    result = merge_pdfs_from_zip(upload_path, current_app.config['TEMP_FOLDER'])
+    
+    if result['success']:
+        unique_id = str(uuid.uuid4())[:8]
+        zip_filename = f'merged_output_{unique_id}.zip'
+        
+        members = [(result['pdf_path'], result['pdf_filename'])]
+        if result.get('has_analysis') and result.get('excel_path'):
+            members.append((result['excel_path'], result['excel_filename']))
+        
+        compression = None
+        download_id = str(uuid.uuid4())
+        if stream:
+            # Le ZIP sera généré à la volée au téléchargement, sans copie dans TEMP_FOLDER
+            for member_path, _ in members:
+                track_temp(member_path)
+            downloads_registry[download_id] = {
+                'members': members,
+                'zip_filename': zip_filename
+            }
+        else:
+            zip_path = os.path.join(current_app.config['TEMP_FOLDER'], zip_filename)
+            
+            policy = CompressionPolicy()
+            with zipfile.ZipFile(zip_path, 'w') as zipf:
+                for member_path, member_name in members:
+                    policy.write(zipf, member_path, member_name)
+            compression = policy.stats()
+            
+            cleanup_temp_file(result['pdf_path'])
+            if result.get('excel_path'):
+                cleanup_temp_file(result['excel_path'])
+            track_temp(zip_path)
+            
+            downloads_registry[download_id] = {
+                'zip_path': zip_path,
+                'zip_filename': zip_filename
+            }
+        
+        # Logger le succès
+        add_log(
+            'merger',
+            f'Fusion réussie: {result["total_pdfs"]} PDFs fusionnés ({result["total_pages"]} pages)',
+            status='success'
+        )
+        
+        return {
+            'success': True,
+            'download_id': download_id,
+            'zip_filename': zip_filename,
+            'total_pdfs': result['total_pdfs'],
+            'total_pages': result['total_pages'],
+            'compression': compression,
+            'stream': stream
+        }
+    else:
+        # Logger l'échec
+        add_log(
+            'merger',
+            f'Échec de la fusion: {result.get("error", "Erreur inconnue")}',
+            status='error'
+        )
+        return {'success': False, 'error': result.get('error', 'Erreur inconnue')}
+
 @bp.route('/process', methods=['POST'])
 def process():
     if 'zip_file' not in request.files:
@@ -36,6 +125,9 @@ def process():
     if not file.filename.lower().endswith('.zip'):
         return jsonify({'success': False, 'error': 'Le fichier doit être un ZIP'}), 400
     
+    stream_param = request.form.get('stream')
+    stream = Config.STREAM_ZIP_DOWNLOADS if stream_param is None else stream_param in ('1', 'true', 'on')
+    
     try:
         # Logger le démarrage de la fusion
         add_log(
@@ -55,52 +147,9 @@ def process():
                     break
                 f.write(chunk)
         
-        result = merge_pdfs_from_zip(upload_path, current_app.config['TEMP_FOLDER'])
-        
-        cleanup_temp_file(upload_path)
-        
-        if result['success']:
-            unique_id = str(uuid.uuid4())[:8]
-            zip_filename = f'merged_output_{unique_id}.zip'
-            zip_path = os.path.join(current_app.config['TEMP_FOLDER'], zip_filename)
-            
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                zipf.write(result['pdf_path'], result['pdf_filename'])
-                if result.get('has_analysis') and result.get('excel_path'):
-                    zipf.write(result['excel_path'], result['excel_filename'])
-            
-            cleanup_temp_file(result['pdf_path'])
-            if result.get('excel_path'):
-                cleanup_temp_file(result['excel_path'])
-            
-            download_id = str(uuid.uuid4())
-            downloads_registry[download_id] = {
-                'zip_path': zip_path,
-                'zip_filename': zip_filename
-            }
-            
-            # Logger le succès
-            add_log(
-                'merger',
-                f'Fusion réussie: {result["total_pdfs"]} PDFs fusionnés ({result["total_pages"]} pages)',
-                status='success'
-            )
-            
-            return jsonify({
-                'success': True,
-                'download_id': download_id,
-                'zip_filename': zip_filename,
-                'total_pdfs': result['total_pdfs'],
-                'total_pages': result['total_pages']
-            })
-        else:
-            # Logger l'échec
-            add_log(
-                'merger',
-                f'Échec de la fusion: {result.get("error", "Erreur inconnue")}',
-                status='error'
-            )
-            return jsonify({'success': False, 'error': result.get('error', 'Erreur inconnue')}), 500
+        # La fusion s'exécute dans la file de jobs; la requête attend son résultat sauf si async=1
+        job_id = job_queue.submit('merger.merge', {'upload_path': upload_path, 'stream': stream})
+        return job_response(job_id, wait=not is_async_request(request))
             
     except Exception as e:
         # Logger l'exception
@@ -113,13 +162,31 @@ def process():
 
 @bp.route('/download/<download_id>')
 def download(download_id):
-    if download_id not in downloads_registry:
+    file_info = downloads_registry.get(download_id)
+    if not file_info:
         return "Fichier introuvable", 404
     
-    file_info = downloads_registry[download_id]
-    zip_path = file_info['zip_path']
     zip_filename = file_info['zip_filename']
     
+    if 'members' in file_info:
+        members = file_info['members']
+        if not all(os.path.exists(member_path) for member_path, _ in members):
+            return "Fichier introuvable", 404
+        
+        response = Response(iter_zip_stream(files=members), mimetype='application/zip')
+        response.headers['Content-Disposition'] = f'attachment; filename="{zip_filename}"'
+        response.headers['X-Accel-Buffering'] = 'no'
+        
+        @response.call_on_close
+        def cleanup_members():
+            for member_path, _ in members:
+                cleanup_temp_file(member_path)
+            downloads_registry.pop(download_id, None)
+        
+        return response
+    
+    zip_path = file_info['zip_path']
+    
     if not os.path.exists(zip_path):
         return "Fichier introuvable", 404
     
@@ -7,11 +7,11 @@ www.myoneart.com
 """
 
 import os
-import requests
 import logging
 from pypdf import PdfReader
 from openpyxl import Workbook
 from openpyxl.styles import Font, PatternFill, Alignment
+from app.utils.http import get_http_session
 from config import Config
 
 logging.basicConfig(level=logging.INFO)
@@ -71,7 +71,7 @@ Si certaines informations ne sont pas disponibles, utilisez "N/A"."""
             "max_tokens": 2000
         }
         
-        response = requests.post(
+        response = get_http_session().post(
             "https://openrouter.ai/api/v1/chat/completions",
             headers=headers,
             json=data,
@@ -7,84 +7,306 @@ www.myoneart.com
 """
 
 import os
+import re
 import requests
-import zipfile
 import uuid
 import time
+import hashlib
+import shutil
 import logging
 from datetime import datetime
 from werkzeug.utils import secure_filename
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import deque, defaultdict, OrderedDict
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from app.utils.progress import progress_manager
+from app.utils.http import get_http_session, connections_opened
+from app.utils.rate_limit import HostLimiter, ConcurrencyBudget, parse_retry_after
+from app.utils.download_cache import download_cache
+from app.utils.archive import StreamingZipWriter
+from app.utils.journal import AppendOnlyJournal
+from app.utils.jobs import JobCancelled
+from config import Config
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def download_single_pdf(url, idx, temp_dir, max_retries=3):
-    """Télécharge un seul PDF avec retry logic et gestion robuste des erreurs"""
+DOWNLOAD_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+    'Accept': 'application/pdf,*/*'
+}
+DOWNLOAD_ENGINES = ('threads', 'async')
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 60
+CHUNK_SIZE = 32768
+MIN_PDF_SIZE = 100
+THROTTLE_STATUSES = (429, 503)
+BUDGET_POLL_INTERVAL = 0.05
+PART_SUFFIX = '.part'
+CHECKPOINT_JOURNAL = 'journal.jsonl'
+PDF_MAGIC = b'%PDF-'
+SNIFF_SIZE = 1024  # la signature peut être précédée de quelques octets parasites
+
+# Limiteur partagé par tous les téléchargements du processus
+host_limiter = HostLimiter(
+    max_in_flight=Config.HOST_MAX_IN_FLIGHT,
+    rate=Config.HOST_RATE_LIMIT,
+    burst=Config.HOST_RATE_BURST
+)
+
+# Plafond de téléchargements en cours pour toutes les sessions de téléchargement
+# automatique du processus (parent de leurs budgets de session)
+download_budget = ConcurrencyBudget(Config.DOWNLOAD_GLOBAL_BUDGET)
+
+def url_host(url):
+    return urlsplit(url).netloc.lower()
+
+def retry_delay(attempt):
+    """Délai d'attente avant la tentative suivante (backoff exponentiel plafonné)"""
+    return min(2 ** attempt, 10)
+
+def is_pdf_response(url, content_type):
+    return 'pdf' in content_type or url.lower().endswith('.pdf')
+
+def build_pdf_filename(url, idx):
+    """Nom du fichier dans le ZIP: préfixe d'index + nom tiré de l'URL"""
+    filename = f'document_{str(idx).zfill(6)}.pdf'
+    if url.split('/')[-1]:
+        try:
+            url_filename = url.split('/')[-1].split('?')[0]
+            if url_filename:
+                filename = secure_filename(url_filename)
+                if not filename.lower().endswith('.pdf'):
+                    filename += '.pdf'
+                filename = f"{str(idx).zfill(6)}_{filename}"
+        except Exception as e:
+            logger.debug(f"Nom de fichier par défaut pour {idx}: {e}")
+    return filename
+
+class PdfRejected(Exception):
+    """Réponse qui n'est pas un PDF exploitable: inutile de réessayer"""
+
+class PdfBodyGuard:
+    """Contrôles appliqués au fil du flux, avant d'avoir lu tout le corps
+    
+    La taille annoncée (Content-Length) et la taille reçue sont bornées par max_bytes,
+    et les premiers octets doivent contenir la signature %PDF-: une page d'erreur HTML
+    servie en .pdf est ainsi rejetée dès le premier bloc et la connexion fermée.
+    """
+    
+    def __init__(self, max_bytes=None, resume_from=0):
+        self.max_bytes = Config.DOWNLOAD_MAX_PDF_BYTES if max_bytes is None else max_bytes
+        self.head = b''
+        # Reprise d'un fichier partiel: la signature a déjà été vérifiée au premier passage
+        self.sniffed = resume_from > 0
+        self.size = resume_from
+    
+    def check_headers(self, headers):
+        content_length = headers.get('Content-Length')
+        if self.max_bytes and content_length and content_length.isdigit() and self.size + int(content_length) > self.max_bytes:
+            raise PdfRejected(f'Fichier trop volumineux ({self.size + int(content_length)} octets, maximum {self.max_bytes})')
+    
+    def feed(self, chunk):
+        """Retourne les octets à écrire (vide tant que la signature n'est pas vérifiée)"""
+        self.size += len(chunk)
+        if self.max_bytes and self.size > self.max_bytes:
+            raise PdfRejected(f'Fichier trop volumineux (plus de {self.max_bytes} octets)')
+        if self.sniffed:
+            return chunk
+        self.head += chunk
+        if len(self.head) < SNIFF_SIZE:
+            return b''
+        return self._release()
+    
+    def finish(self):
+        """Fin du flux: retourne les octets encore retenus (corps plus court que SNIFF_SIZE)"""
+        if self.sniffed:
+            return b''
+        return self._release()
+    
+    def _release(self):
+        if PDF_MAGIC not in self.head[:SNIFF_SIZE]:
+            preview = self.head[:40].decode('latin-1').strip()
+            raise PdfRejected(f'Contenu non-PDF (début: {preview!r})')
+        self.sniffed = True
+        data, self.head = self.head, b''
+        return data
+
+def cleanup_partial_file(temp_dir, url, idx):
+    file_path = os.path.join(temp_dir, build_pdf_filename(url, idx))
+    for path in (file_path, file_path + PART_SUFFIX):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def resume_validator(headers):
+    """Validateur à renvoyer en If-Range si le serveur accepte les requêtes partielles, sinon None"""
+    if headers.get('Accept-Ranges', '').lower() != 'bytes':
+        return None
+    etag = headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    # Un ETag faible est refusé en If-Range: repli sur Last-Modified
+    return headers.get('Last-Modified')
+
+def range_start(headers):
+    """Premier octet d'une réponse 206 (Content-Range: bytes N-M/T), None si absent"""
+    match = re.match(r'bytes (\d+)-', headers.get('Content-Range', ''))
+    return int(match.group(1)) if match else None
+
+def hash_file(file_path):
+    hasher = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(block)
+    return hasher
+
+def store_in_cache(url, file_path, sha256, response_headers):
+    """Enregistre un PDF téléchargé dans le cache
+
+    Retourne 'miss', 'uncacheable' si la réponse n'a ni ETag ni Last-Modified (rien
+    n'est stocké, elle ne compte pas dans le taux de miss) ou None si le cache est désactivé.
+    """
+    if not download_cache:
+        return None
+    try:
+        if not download_cache.store(url, file_path, sha256,
+                                    etag=response_headers.get('ETag'),
+                                    last_modified=response_headers.get('Last-Modified')):
+            return 'uncacheable'
+    except Exception as e:
+        logger.warning(f"Impossible de mettre en cache {url}: {e}")
+    return 'miss'
+
+def download_single_pdf(url, idx, temp_dir, max_retries=3, http_session=None, defer_throttled=False):
+    """Télécharge un seul PDF avec retry logic et gestion robuste des erreurs
+    
+    Avec defer_throttled, une réponse 429/503 n'est pas réessayée ici après une pause:
+    le résultat est marqué 'throttled' pour que l'ordonnanceur remette l'URL en file
+    et occupe le worker avec l'URL d'un autre hôte.
+    
+    Le corps est écrit dans un fichier .part: si une tentative est interrompue et que
+    le serveur annonce Accept-Ranges, la suivante ne demande que la fin du fichier
+    (Range + If-Range sur l'ETag ou Last-Modified) au lieu de tout retélécharger.
+    """
+    session = http_session or get_http_session()
+    filename = build_pdf_filename(url, idx)
+    file_path = os.path.join(temp_dir, filename)
+    part_path = file_path + PART_SUFFIX
+    # Validateur (ETag/Last-Modified) de la dernière réponse complète, si le serveur accepte les Range
+    validator = None
     for attempt in range(max_retries):
         response = None
         try:
             logger.info(f"[PDF {idx}] Début téléchargement: {url} (tentative {attempt + 1}/{max_retries})")
             
-            response = requests.get(
+            resume_from = os.path.getsize(part_path) if validator and os.path.exists(part_path) else 0
+            cached = download_cache.lookup(url) if download_cache and not resume_from else None
+            headers = dict(DOWNLOAD_HEADERS)
+            if resume_from:
+                headers['Range'] = f'bytes={resume_from}-'
+                headers['If-Range'] = validator
+            elif cached:
+                headers.update(download_cache.conditional_headers(cached))
+            
+            opened_before = connections_opened()
+            response = session.get(
                 url, 
-                timeout=(10, 60),
+                timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
                 stream=True,
-                headers={
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                    'Accept': 'application/pdf,*/*'
-                },
+                headers=headers,
                 allow_redirects=True
             )
             
-            logger.info(f"[PDF {idx}] Code HTTP: {response.status_code}")
+            connection_reused = connections_opened() == opened_before
+            logger.info(f"[PDF {idx}] Code HTTP: {response.status_code} (connexion {'réutilisée' if connection_reused else 'nouvelle'})")
             logger.debug(f"[PDF {idx}] Headers reçus: {dict(response.headers)}")
             
+            if defer_throttled and response.status_code in THROTTLE_STATUSES:
+                logger.warning(f"[PDF {idx}] Hôte surchargé (HTTP {response.status_code}), URL remise en file")
+                return {
+                    'success': False,
+                    'url': url,
+                    'error': f'Erreur HTTP {response.status_code}: serveur surchargé',
+                    'throttled': True,
+                    'retry_after': parse_retry_after(response.headers.get('Retry-After'))
+                }
+            
+            if cached and response.status_code == 304:
+                download_cache.copy_to(cached, file_path)
+                logger.info(f"Téléchargement {idx} servi depuis le cache (304): {filename} ({cached['size']} bytes)")
+                return {'success': True, 'url': url, 'filename': filename, 'size': cached['size'],
+                        'sha256': cached['sha256'], 'connection_reused': connection_reused, 'cache': 'hit'}
+            
+            if response.status_code == 416:
+                # Fichier partiel inexploitable: la prochaine tentative repart de zéro
+                validator = None
             response.raise_for_status()
             
             content_type = response.headers.get('content-type', '').lower()
-            if 'pdf' not in content_type and not url.lower().endswith('.pdf'):
+            if not is_pdf_response(url, content_type):
                 logger.warning(f"Document {idx} n'est pas un PDF (type: {content_type})")
                 return {'success': False, 'url': url, 'error': f'Type non-PDF: {content_type}'}
             
-            filename = f'document_{str(idx).zfill(6)}.pdf'
-            if url.split('/')[-1]:
-                try:
-                    url_filename = url.split('/')[-1].split('?')[0]
-                    if url_filename:
-                        filename = secure_filename(url_filename)
-                        if not filename.lower().endswith('.pdf'):
-                            filename += '.pdf'
-                        filename = f"{str(idx).zfill(6)}_{filename}"
-                except Exception as e:
-                    logger.debug(f"Nom de fichier par défaut pour {idx}: {e}")
+            if response.status_code == 206:
+                if range_start(response.headers) != resume_from:
+                    validator = None
+                    raise requests.exceptions.RequestException(f"Content-Range inattendu: {response.headers.get('Content-Range')}")
+                logger.info(f"[PDF {idx}] Reprise du téléchargement à l'octet {resume_from}")
+                mode = 'ab'
+                hasher = hash_file(part_path)
+            else:
+                # Réponse complète (Range ignoré ou ressource modifiée): réécriture depuis l'octet 0
+                resume_from = 0
+                validator = resume_validator(response.headers)
+                mode = 'wb'
+                hasher = hashlib.sha256()
             
-            file_path = os.path.join(temp_dir, filename)
+            guard = PdfBodyGuard(resume_from=resume_from)
+            guard.check_headers(response.headers)
             
-            total_size = 0
-            with open(file_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=32768):
-                    if chunk:
-                        f.write(chunk)
-                        total_size += len(chunk)
+            total_size = resume_from
+            with open(part_path, mode) as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    data = guard.feed(chunk) if chunk else b''
+                    if data:
+                        f.write(data)
+                        hasher.update(data)
+                        total_size += len(data)
+                data = guard.finish()
+                f.write(data)
+                hasher.update(data)
+                total_size += len(data)
+            os.replace(part_path, file_path)
             
-            if total_size < 100:
+            if total_size < MIN_PDF_SIZE:
                 os.remove(file_path)
                 return {'success': False, 'url': url, 'error': 'Fichier trop petit (probablement vide)'}
             
+            sha256 = hasher.hexdigest()
+            cache_status = store_in_cache(url, file_path, sha256, response.headers)
+            
             logger.info(f"Téléchargement {idx} réussi: {filename} ({total_size} bytes)")
-            return {'success': True, 'url': url, 'filename': filename, 'size': total_size}
+            return {'success': True, 'url': url, 'filename': filename, 'size': total_size,
+                    'sha256': sha256, 'connection_reused': connection_reused, 'cache': cache_status}
+            
+        except PdfRejected as e:
+            # Flux interrompu: la connexion est fermée sans lire le reste du corps
+            logger.warning(f"[PDF {idx}] REJETÉ - URL: {url} - {str(e)}")
+            cleanup_partial_file(temp_dir, url, idx)
+            return {'success': False, 'url': url, 'error': str(e), 'rejected': True}
             
         except requests.exceptions.Timeout as e:
             error_msg = f'Timeout de connexion: {str(e)}'
             logger.error(f"[PDF {idx}] TIMEOUT - URL: {url} - Détails: {str(e)}")
             if attempt < max_retries - 1:
-                wait_time = min(2 ** attempt, 10)
+                wait_time = retry_delay(attempt)
                 logger.info(f"[PDF {idx}] Nouvelle tentative dans {wait_time}s")
                 time.sleep(wait_time)
             else:
                 logger.error(f"[PDF {idx}] ÉCHEC FINAL après {max_retries} tentatives - {error_msg}")
+                cleanup_partial_file(temp_dir, url, idx)
                 return {'success': False, 'url': url, 'error': error_msg}
                 
         except requests.exceptions.HTTPError as e:
@@ -94,30 +316,33 @@ def download_single_pdf(url, idx, temp_dir, max_retries=3):
             if e.response:
                 logger.debug(f"[PDF {idx}] Contenu réponse: {e.response.text[:200]}")
             if attempt < max_retries - 1:
-                wait_time = min(2 ** attempt, 10)
+                wait_time = retry_delay(attempt)
                 time.sleep(wait_time)
             else:
                 logger.error(f"[PDF {idx}] ÉCHEC FINAL - {error_msg}")
+                cleanup_partial_file(temp_dir, url, idx)
                 return {'success': False, 'url': url, 'error': error_msg}
                 
         except requests.exceptions.RequestException as e:
             error_msg = f'Erreur réseau: {str(e)}'
             logger.error(f"[PDF {idx}] ERREUR RÉSEAU - URL: {url} - Détails: {str(e)}")
             if attempt < max_retries - 1:
-                wait_time = min(2 ** attempt, 10)
+                wait_time = retry_delay(attempt)
                 time.sleep(wait_time)
             else:
                 logger.error(f"[PDF {idx}] ÉCHEC FINAL - {error_msg}")
+                cleanup_partial_file(temp_dir, url, idx)
                 return {'success': False, 'url': url, 'error': error_msg}
                 
         except Exception as e:
             error_msg = f'Erreur inattendue: {str(e)}'
             logger.error(f"[PDF {idx}] ERREUR INATTENDUE - URL: {url} - Type: {type(e).__name__} - Détails: {str(e)}", exc_info=True)
             if attempt < max_retries - 1:
-                wait_time = min(2 ** attempt, 10)
+                wait_time = retry_delay(attempt)
                 time.sleep(wait_time)
             else:
                 logger.error(f"[PDF {idx}] ÉCHEC FINAL - {error_msg}")
+                cleanup_partial_file(temp_dir, url, idx)
                 return {'success': False, 'url': url, 'error': error_msg}
         finally:
             if response:
@@ -125,14 +350,228 @@ def download_single_pdf(url, idx, temp_dir, max_retries=3):
     
     return {'success': False, 'url': url, 'error': 'Max retries atteint'}
 
-def download_pdfs_and_zip(urls, temp_folder, max_workers=5, batch_size=20, session_id=None):
-    """Télécharge des PDFs en parallèle avec batching optimisé pour 1000+ documents"""
-    temp_dir = os.path.join(temp_folder, str(uuid.uuid4()))
+class DownloadQueue:
+    """File des URLs restant à lancer, regroupées par hôte
+    
+    next_item parcourt les hôtes à tour de rôle et ne retourne qu'une URL dont l'hôte
+    a un créneau libre dans le limiteur; les hôtes saturés ou en pause sont sautés.
+    Avec un budget (lots d'un téléchargement automatique), chaque URL lancée prend
+    aussi un créneau de ce budget partagé entre lots.
+    Utilisée depuis un seul thread (l'ordonnanceur), seul le limiteur est partagé.
+    """
+    
+    def __init__(self, urls, start_idx=1, limiter=None, max_deferrals=None, skip=(), budget=None):
+        self.limiter = limiter or host_limiter
+        self.budget = budget
+        self.max_deferrals = Config.HOST_MAX_DEFERRALS if max_deferrals is None else max_deferrals
+        self.by_host = OrderedDict()
+        self.dispatched_hosts = {}
+        self.deferrals = defaultdict(int)
+        self.remaining = 0
+        # Délai avant qu'un hôte en attente redevienne disponible (None: attendre une fin de téléchargement)
+        self.retry_hint = None
+        for idx, url in enumerate(urls, start_idx):
+            if idx not in skip:
+                self._push(idx, url)
+    
+    def _push(self, idx, url, front=False):
+        pending = self.by_host.setdefault(url_host(url), deque())
+        if front:
+            pending.appendleft((idx, url))
+        else:
+            pending.append((idx, url))
+        self.remaining += 1
+    
+    def __len__(self):
+        return self.remaining
+    
+    def next_item(self):
+        """Retourne le prochain couple (idx, url) lançable maintenant, ou None"""
+        self.retry_hint = None
+        if not self.by_host:
+            return None
+        if self.budget and not self.budget.try_acquire():
+            # Budget global pris par d'autres lots: il peut se libérer sans fin de téléchargement de ce lot
+            self.retry_hint = BUDGET_POLL_INTERVAL
+            return None
+        for host in list(self.by_host):
+            acquired, wait_time = self.limiter.try_acquire(host)
+            if acquired:
+                pending = self.by_host[host]
+                idx, url = pending.popleft()
+                if pending:
+                    self.by_host.move_to_end(host)
+                else:
+                    del self.by_host[host]
+                self.remaining -= 1
+                self.dispatched_hosts[idx] = host
+                return idx, url
+            if wait_time is not None and (self.retry_hint is None or wait_time < self.retry_hint):
+                self.retry_hint = wait_time
+        if self.budget:
+            self.budget.release()
+        return None
+    
+    def task_done(self, idx):
+        """Libère le créneau de l'hôte et du budget une fois le téléchargement idx terminé"""
+        host = self.dispatched_hosts.pop(idx, None)
+        if host is not None:
+            self.limiter.release(host)
+            if self.budget:
+                self.budget.release()
+    
+    def defer(self, idx, url, retry_after=None):
+        """Remet en tête de file une URL refusée par un hôte surchargé et met l'hôte en pause
+        
+        Retourne False quand l'URL a déjà été reportée max_deferrals fois.
+        """
+        self.deferrals[idx] += 1
+        if self.deferrals[idx] > self.max_deferrals:
+            return False
+        delay = retry_after if retry_after is not None else retry_delay(self.deferrals[idx] - 1)
+        self.limiter.pause(url_host(url), delay)
+        self._push(idx, url, front=True)
+        return True
+    
+    def handle_result(self, idx, url, result):
+        """Traite la fin d'un téléchargement; retourne False si l'URL a été remise en file"""
+        self.task_done(idx)
+        if result.get('throttled') and self.defer(idx, url, result.get('retry_after')):
+            return False
+        return True
+
+def load_checkpoint(checkpoint_dir, urls, restore=True):
+    """Relit le journal d'un lot interrompu
+    
+    Retourne ({idx: enregistrement} des URLs déjà téléchargées dont le fichier est
+    toujours présent, ou restauré depuis le cache par son SHA-256; liste des ZIPs
+    laissés inachevés par les exécutions précédentes).
+    
+    restore=False: lecture seule, les fichiers encore en cache sont comptés sans
+    être recopiés dans le dossier du lot.
+    """
+    journal = AppendOnlyJournal(os.path.join(checkpoint_dir, CHECKPOINT_JOURNAL))
+    outcomes = {}
+    stale_zips = []
+    for record in journal.read():
+        if 'zip_path' in record:
+            stale_zips.append(record['zip_path'])
+        elif record.get('idx') is not None:
+            # Le dernier résultat enregistré pour une URL fait foi
+            outcomes[record['idx']] = record
+    
+    completed = {}
+    for idx, record in outcomes.items():
+        if record.get('status') != 'success' or not 1 <= idx <= len(urls) or urls[idx - 1] != record.get('url'):
+            continue
+        file_path = os.path.join(checkpoint_dir, record['file'])
+        if os.path.exists(file_path) and os.path.getsize(file_path) == record.get('size'):
+            completed[idx] = record
+        elif download_cache and record.get('sha256'):
+            if restore:
+                if download_cache.restore(record['sha256'], file_path):
+                    completed[idx] = record
+            elif os.path.exists(download_cache.blob_path(record['sha256'])):
+                completed[idx] = record
+    return completed, stale_zips
+
+def run_thread_engine(download_queue, temp_dir, max_workers, on_dispatch, on_result):
+    """Moteur par threads: garde jusqu'à max_workers téléchargements en cours"""
+    http_session = get_http_session(max_workers)
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = {}
+        
+        def fill_window():
+            # Pas de barrière entre les lots: chaque téléchargement terminé libère une place
+            while len(in_flight) < max_workers:
+                item = download_queue.next_item()
+                if item is None:
+                    return
+                idx, url = item
+                on_dispatch(idx)
+                future = executor.submit(download_single_pdf, url, idx, temp_dir,
+                                         http_session=http_session, defer_throttled=True)
+                in_flight[future] = (idx, url)
+        
+        fill_window()
+        while in_flight or len(download_queue):
+            if not in_flight:
+                # Tous les hôtes restants sont en pause ou saturés par d'autres jobs
+                time.sleep(download_queue.retry_hint or 0.1)
+                fill_window()
+                continue
+            done, _ = wait(in_flight, timeout=download_queue.retry_hint, return_when=FIRST_COMPLETED)
+            for future in done:
+                idx, url = in_flight.pop(future)
+                result = future.result()
+                if download_queue.handle_result(idx, url, result):
+                    on_result(idx, result)
+            fill_window()
+
+def download_pdfs_and_zip(urls, temp_folder, max_workers=None, batch_size=20, session_id=None, engine=None, limiter=None,
+                          checkpoint_dir=None, budget=None, cancel_event=None):
+    """Télécharge des PDFs en parallèle avec une fenêtre glissante de max_workers téléchargements
+    
+    engine: 'threads' (ThreadPoolExecutor) ou 'async' (asyncio, centaines de téléchargements
+    dans un seul thread). Par défaut Config.DOWNLOAD_ENGINE.
+    
+    budget: ConcurrencyBudget partagé avec les lots lancés en parallèle (optionnel:
+    sans budget, seuls max_workers et les limites par hôte s'appliquent).
+    
+    checkpoint_dir: dossier stable du lot. Le résultat de chaque URL y est journalisé
+    (url, statut, fichier, taille, sha256) et les PDFs y sont conservés jusqu'à la
+    finalisation du ZIP: relancé après une interruption, le lot ne télécharge que les
+    URLs qui n'ont pas abouti.
+    
+    cancel_event: levé quand le job a perdu son bail. Le lot s'arrête (JobCancelled)
+    avant de lancer ou de journaliser une autre URL: le worker qui a repris le job
+    est seul à écrire dans checkpoint_dir.
+    """
+    engine = engine or Config.DOWNLOAD_ENGINE
+    if engine not in DOWNLOAD_ENGINES:
+        raise ValueError(f"Moteur de téléchargement inconnu: {engine}")
+    if engine == 'async':
+        from app.services.pdf_downloader_async import AIOHTTP_AVAILABLE
+        if not AIOHTTP_AVAILABLE:
+            logger.warning("aiohttp n'est pas installé, utilisation du moteur par threads")
+            engine = 'threads'
+    if not max_workers:
+        max_workers = Config.ASYNC_MAX_CONCURRENCY if engine == 'async' else Config.DOWNLOAD_MAX_WORKERS
+    
+    temp_dir = checkpoint_dir or os.path.join(temp_folder, str(uuid.uuid4()))
     os.makedirs(temp_dir, exist_ok=True)
     
+    journal = None
+    resumed = {}
+    if checkpoint_dir:
+        resumed, stale_zips = load_checkpoint(checkpoint_dir, urls)
+        for stale_zip in stale_zips:
+            try:
+                os.remove(stale_zip)
+            except FileNotFoundError:
+                pass
+        journal = AppendOnlyJournal(os.path.join(checkpoint_dir, CHECKPOINT_JOURNAL))
+        if resumed:
+            logger.info(f"Reprise du lot: {len(resumed)}/{len(urls)} URLs déjà téléchargées")
+    
+    # Chaque PDF terminé est ajouté au ZIP pendant que les autres téléchargements continuent
+    unique_id = str(uuid.uuid4())[:8]
+    zip_filename = f'pdfs_{unique_id}.zip'
+    zip_path = os.path.join(temp_folder, zip_filename)
+    zip_writer = StreamingZipWriter(zip_path, remove_sources=journal is None)
+    if journal:
+        journal.append({'zip_path': zip_path})
+    
     successful = 0
     failed = 0
     failed_urls = []
+    zip_members = {}
+    connections_reused = 0
+    cache_hits = 0
+    cache_misses = 0
+    cache_uncacheable = 0
+    rejected = 0
     total_urls = len(urls)
     total_batches = (total_urls + batch_size - 1) // batch_size
     
@@ -144,46 +583,93 @@ def download_pdfs_and_zip(urls, temp_folder, max_workers=5, batch_size=20, sessi
             message=f'Téléchargement de {total_urls} PDFs en {total_batches} lots de {batch_size}...'
         )
     
-    logger.info(f"Début du téléchargement de {total_urls} PDFs avec {max_workers} workers, batch_size={batch_size}")
+    logger.info(f"Début du téléchargement de {total_urls} PDFs avec {max_workers} workers (moteur {engine}), batch_size={batch_size}")
     logger.info(f"Traitement en {total_batches} batchs")
     
-    for batch_start in range(0, total_urls, batch_size):
-        batch_end = min(batch_start + batch_size, total_urls)
-        batch_urls = urls[batch_start:batch_end]
-        batch_num = batch_start // batch_size + 1
+    dispatched = 0
+    
+    def check_cancelled():
+        if cancel_event is not None and cancel_event.is_set():
+            raise JobCancelled(f"Téléchargement interrompu: {successful + failed}/{total_urls} URLs traitées")
+    
+    def on_dispatch(idx):
+        # Les URLs sont lancées hôte par hôte: les lots de progression suivent l'ordre de lancement
+        nonlocal dispatched
+        check_cancelled()
+        if dispatched % batch_size == 0:
+            batch_num = dispatched // batch_size + 1
+            batch_end = min(dispatched + batch_size, total_urls)
+            if session_id:
+                progress_manager.update(session_id,
+                    batch_current=batch_num,
+                    message=f'Traitement du lot {batch_num}/{total_batches} (URLs {dispatched + 1} à {batch_end})'
+                )
+            logger.info(f"Traitement batch {batch_num}: URLs {dispatched + 1} à {batch_end}")
+        dispatched += 1
+    
+    def on_result(idx, result):
+        nonlocal successful, failed, connections_reused, cache_hits, cache_misses, cache_uncacheable, rejected
+        check_cancelled()
+        if result.get('connection_reused'):
+            connections_reused += 1
+        if result.get('cache') == 'hit':
+            cache_hits += 1
+        elif result.get('cache') == 'miss':
+            cache_misses += 1
+        elif result.get('cache') == 'uncacheable':
+            cache_uncacheable += 1
+        if journal and not result.get('resumed'):
+            journal.append({
+                'idx': idx,
+                'url': result['url'],
+                'status': 'success' if result['success'] else 'failed',
+                'file': result.get('filename'),
+                'size': result.get('size'),
+                'sha256': result.get('sha256'),
+                'error': result.get('error')
+            })
+        if result['success']:
+            successful += 1
+            zip_members[result['filename']] = (idx, result['url'])
+            zip_writer.add(os.path.join(temp_dir, result['filename']), result['filename'])
+        else:
+            failed += 1
+            if result.get('rejected'):
+                rejected += 1
+            failed_urls.append({'url': result['url'], 'error': result.get('error', 'Unknown error')})
         
         if session_id:
             progress_manager.update(session_id,
-                batch_current=batch_num,
-                message=f'Traitement du lot {batch_num}/{total_batches} (URLs {batch_start+1} à {batch_end})'
+                current=successful + failed,
+                successful=successful,
+                failed=failed
             )
         
-        logger.info(f"Traitement batch {batch_num}: URLs {batch_start+1} à {batch_end}")
-        
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_url = {
-                executor.submit(download_single_pdf, url, idx, temp_dir): (url, idx) 
-                for idx, url in enumerate(batch_urls, batch_start + 1)
-            }
-            
-            for future in as_completed(future_to_url):
-                result = future.result()
-                if result['success']:
-                    successful += 1
-                else:
-                    failed += 1
-                    failed_urls.append({'url': result['url'], 'error': result.get('error', 'Unknown error')})
-                
-                if session_id:
-                    progress_manager.update(session_id,
-                        current=successful + failed,
-                        successful=successful,
-                        failed=failed
-                    )
-        
-        logger.info(f"Batch terminé: {successful} succès, {failed} échecs sur {batch_end} URLs traitées")
+        processed = successful + failed
+        if processed % batch_size == 0 or processed == total_urls:
+            logger.info(f"Batch terminé: {successful} succès, {failed} échecs sur {processed} URLs traitées")
+    
+    for idx, record in sorted(resumed.items()):
+        on_result(idx, {'success': True, 'url': record['url'], 'filename': record['file'],
+                   'size': record['size'], 'sha256': record.get('sha256'), 'resumed': True})
+    
+    download_queue = DownloadQueue(urls, limiter=limiter, skip=resumed, budget=budget)
+    try:
+        if engine == 'async':
+            from app.services.pdf_downloader_async import run_async_engine
+            run_async_engine(download_queue, temp_dir, max_workers, on_dispatch, on_result)
+        else:
+            run_thread_engine(download_queue, temp_dir, max_workers, on_dispatch, on_result)
+        check_cancelled()
+    except Exception:
+        zip_writer.abort()
+        if not checkpoint_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
     
     if successful == 0:
+        zip_writer.abort()
+        shutil.rmtree(temp_dir, ignore_errors=True)
         if session_id:
             progress_manager.update(session_id,
                 status='error',
@@ -197,26 +683,43 @@ def download_pdfs_and_zip(urls, temp_folder, max_workers=5, batch_size=20, sessi
     if session_id:
         progress_manager.update(session_id,
             status='compressing',
-            message=f'Compression de {successful} PDFs en fichier ZIP...'
+            message=f'Finalisation du fichier ZIP ({successful} PDFs)...'
         )
     
-    unique_id = str(uuid.uuid4())[:8]
-    zip_filename = f'pdfs_{unique_id}.zip'
-    zip_path = os.path.join(temp_folder, zip_filename)
+    zip_writer.close()
+    
+    # Un PDF compté en succès mais absent du ZIP (erreur d'écriture) passe en échec,
+    # y compris dans le journal pour être retéléchargé à la reprise du lot
+    for error in zip_writer.errors:
+        idx, url = zip_members[error['file']]
+        successful -= 1
+        failed += 1
+        failed_urls.append({'url': url, 'error': f"Erreur d'ajout au ZIP: {error['error']}"})
+        if journal:
+            journal.append({'idx': idx, 'url': url, 'status': 'failed', 'error': error['error']})
     
-    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for root, dirs, files in os.walk(temp_dir):
-            for file in files:
-                file_path = os.path.join(root, file)
-                arcname = os.path.basename(file_path)
-                zipf.write(file_path, arcname)
+    if zip_writer.errors:
+        logger.error(f"{len(zip_writer.errors)} PDFs n'ont pas pu être ajoutés au ZIP {zip_path}")
+        if session_id:
+            progress_manager.update(session_id, current=successful + failed, successful=successful, failed=failed)
+    
+    if successful == 0:
+        try:
+            os.remove(zip_path)
+        except OSError:
+            pass
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        if session_id:
+            progress_manager.update(session_id,
+                status='error',
+                message=f'Aucun PDF ajouté au fichier ZIP. {failed} échecs.'
+            )
+        return {
+            'success': False,
+            'error': f'Aucun PDF ajouté au fichier ZIP. {failed} échecs.'
+        }
     
-    for root, dirs, files in os.walk(temp_dir, topdown=False):
-        for file in files:
-            os.remove(os.path.join(root, file))
-        for dir in dirs:
-            os.rmdir(os.path.join(root, dir))
-    os.rmdir(temp_dir)
+    shutil.rmtree(temp_dir, ignore_errors=True)
     
     if session_id:
         progress_manager.update(session_id,
@@ -231,5 +734,13 @@ def download_pdfs_and_zip(urls, temp_folder, max_workers=5, batch_size=20, sessi
         'total': len(urls),
         'successful': successful,
         'failed': failed,
-        'failed_urls': failed_urls
+        'failed_urls': failed_urls,
+        'connections_reused': connections_reused,
+        'cache_hits': cache_hits,
+        'cache_misses': cache_misses,
+        'cache_uncacheable': cache_uncacheable,
+        'rejected': rejected,
+        'resumed': len(resumed),
+        'compression': zip_writer.policy.stats(),
+        'engine': engine
     }
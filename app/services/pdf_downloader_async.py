@@ -0,0 +1,226 @@
+"""
+PdfTools
+MOA Digital Agency LLC
+Par : Aisance KALONJI
+Mail : moa@myoneart.com
+www.myoneart.com
+"""
+
+import os
+import asyncio
+import hashlib
+import logging
+from app.utils.rate_limit import parse_retry_after
+from app.services.pdf_downloader import (
+    DOWNLOAD_HEADERS,
+    CONNECT_TIMEOUT,
+    READ_TIMEOUT,
+    CHUNK_SIZE,
+    MIN_PDF_SIZE,
+    THROTTLE_STATUSES,
+    PART_SUFFIX,
+    PdfRejected,
+    PdfBodyGuard,
+    retry_delay,
+    is_pdf_response,
+    build_pdf_filename,
+    cleanup_partial_file,
+    resume_validator,
+    range_start,
+    hash_file,
+    store_in_cache
+)
+from app.utils.download_cache import download_cache
+
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    aiohttp = None
+    AIOHTTP_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Taille des blocs écrits sur disque hors de la boucle d'événements
+WRITE_BUFFER_SIZE = 256 * 1024
+
+def _write_block(f, hasher, data):
+    f.write(data)
+    hasher.update(data)
+
+def _part_size(part_path):
+    try:
+        return os.path.getsize(part_path)
+    except FileNotFoundError:
+        return 0
+
+async def _on_connection_reuse(session, trace_config_ctx, params):
+    if trace_config_ctx.trace_request_ctx is not None:
+        trace_config_ctx.trace_request_ctx['reused'] = True
+
+async def download_single_pdf_async(session, url, idx, temp_dir, max_retries=3, defer_throttled=False):
+    """Équivalent asyncio de download_single_pdf (mêmes retries, contrôles et nommage)
+
+    Tous les accès disque et SQLite (cache, taille d'une reprise, écriture par blocs de
+    WRITE_BUFFER_SIZE, hachage, renommage et suppression des fichiers) passent par le
+    pool de threads de la boucle pour ne pas la bloquer.
+    """
+    loop = asyncio.get_running_loop()
+    filename = build_pdf_filename(url, idx)
+    file_path = os.path.join(temp_dir, filename)
+    part_path = file_path + PART_SUFFIX
+    validator = None
+    for attempt in range(max_retries):
+        trace_ctx = {'reused': False}
+        try:
+            logger.info(f"[PDF {idx}] Début téléchargement async: {url} (tentative {attempt + 1}/{max_retries})")
+
+            resume_from = await loop.run_in_executor(None, _part_size, part_path) if validator else 0
+            cached = await loop.run_in_executor(None, download_cache.lookup, url) if download_cache and not resume_from else None
+            headers = dict(DOWNLOAD_HEADERS)
+            if resume_from:
+                headers['Range'] = f'bytes={resume_from}-'
+                headers['If-Range'] = validator
+            elif cached:
+                headers.update(download_cache.conditional_headers(cached))
+
+            async with session.get(url, headers=headers, allow_redirects=True, trace_request_ctx=trace_ctx) as response:
+                logger.info(f"[PDF {idx}] Code HTTP: {response.status} (connexion {'réutilisée' if trace_ctx['reused'] else 'nouvelle'})")
+
+                if defer_throttled and response.status in THROTTLE_STATUSES:
+                    logger.warning(f"[PDF {idx}] Hôte surchargé (HTTP {response.status}), URL remise en file")
+                    return {
+                        'success': False,
+                        'url': url,
+                        'error': f'Erreur HTTP {response.status}: serveur surchargé',
+                        'throttled': True,
+                        'retry_after': parse_retry_after(response.headers.get('Retry-After'))
+                    }
+
+                if cached and response.status == 304:
+                    await loop.run_in_executor(None, download_cache.copy_to, cached, file_path)
+                    logger.info(f"Téléchargement {idx} servi depuis le cache (304): {filename} ({cached['size']} bytes)")
+                    return {'success': True, 'url': url, 'filename': filename, 'size': cached['size'],
+                            'sha256': cached['sha256'], 'connection_reused': trace_ctx['reused'], 'cache': 'hit'}
+
+                if response.status == 416:
+                    validator = None
+                response.raise_for_status()
+
+                content_type = response.headers.get('content-type', '').lower()
+                if not is_pdf_response(url, content_type):
+                    logger.warning(f"Document {idx} n'est pas un PDF (type: {content_type})")
+                    return {'success': False, 'url': url, 'error': f'Type non-PDF: {content_type}'}
+
+                if response.status == 206:
+                    if range_start(response.headers) != resume_from:
+                        validator = None
+                        raise aiohttp.ClientPayloadError(f"Content-Range inattendu: {response.headers.get('Content-Range')}")
+                    logger.info(f"[PDF {idx}] Reprise du téléchargement à l'octet {resume_from}")
+                    mode = 'ab'
+                    hasher = await loop.run_in_executor(None, hash_file, part_path)
+                else:
+                    resume_from = 0
+                    validator = resume_validator(response.headers)
+                    mode = 'wb'
+                    hasher = hashlib.sha256()
+
+                guard = PdfBodyGuard(resume_from=resume_from)
+                guard.check_headers(response.headers)
+
+                total_size = resume_from
+                f = await loop.run_in_executor(None, open, part_path, mode)
+                try:
+                    buffer = bytearray()
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        data = guard.feed(chunk)
+                        if data:
+                            buffer += data
+                            total_size += len(data)
+                            if len(buffer) >= WRITE_BUFFER_SIZE:
+                                await loop.run_in_executor(None, _write_block, f, hasher, bytes(buffer))
+                                buffer.clear()
+                    data = guard.finish()
+                    buffer += data
+                    total_size += len(data)
+                    await loop.run_in_executor(None, _write_block, f, hasher, bytes(buffer))
+                finally:
+                    await loop.run_in_executor(None, f.close)
+                await loop.run_in_executor(None, os.replace, part_path, file_path)
+                response_headers = response.headers
+
+            if total_size < MIN_PDF_SIZE:
+                await loop.run_in_executor(None, os.remove, file_path)
+                return {'success': False, 'url': url, 'error': 'Fichier trop petit (probablement vide)'}
+
+            sha256 = hasher.hexdigest()
+            cache_status = await loop.run_in_executor(None, store_in_cache, url, file_path, sha256, response_headers)
+
+            logger.info(f"Téléchargement {idx} réussi: {filename} ({total_size} bytes)")
+            return {'success': True, 'url': url, 'filename': filename, 'size': total_size,
+                    'sha256': sha256, 'connection_reused': trace_ctx['reused'], 'cache': cache_status}
+
+        except PdfRejected as e:
+            logger.warning(f"[PDF {idx}] REJETÉ - URL: {url} - {str(e)}")
+            await loop.run_in_executor(None, cleanup_partial_file, temp_dir, url, idx)
+            return {'success': False, 'url': url, 'error': str(e), 'rejected': True}
+        except asyncio.TimeoutError as e:
+            error_msg = f'Timeout de connexion: {str(e)}'
+            logger.error(f"[PDF {idx}] TIMEOUT - URL: {url} - Détails: {str(e)}")
+        except aiohttp.ClientResponseError as e:
+            error_msg = f'Erreur HTTP {e.status}: {e.message}'
+            logger.error(f"[PDF {idx}] ERREUR HTTP {e.status} - URL: {url} - Détails: {e.message}")
+        except aiohttp.ClientError as e:
+            error_msg = f'Erreur réseau: {str(e)}'
+            logger.error(f"[PDF {idx}] ERREUR RÉSEAU - URL: {url} - Détails: {str(e)}")
+        except Exception as e:
+            error_msg = f'Erreur inattendue: {str(e)}'
+            logger.error(f"[PDF {idx}] ERREUR INATTENDUE - URL: {url} - Type: {type(e).__name__} - Détails: {str(e)}", exc_info=True)
+
+        if attempt < max_retries - 1:
+            wait_time = retry_delay(attempt)
+            logger.info(f"[PDF {idx}] Nouvelle tentative dans {wait_time}s")
+            await asyncio.sleep(wait_time)
+        else:
+            logger.error(f"[PDF {idx}] ÉCHEC FINAL après {max_retries} tentatives - {error_msg}")
+            await loop.run_in_executor(None, cleanup_partial_file, temp_dir, url, idx)
+            return {'success': False, 'url': url, 'error': error_msg}
+
+    return {'success': False, 'url': url, 'error': 'Max retries atteint'}
+
+async def _run_async_engine(download_queue, temp_dir, max_concurrency, on_dispatch, on_result):
+    timeout = aiohttp.ClientTimeout(sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT)
+    connector = aiohttp.TCPConnector(limit=max_concurrency)
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_reuseconn.append(_on_connection_reuse)
+
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector, trace_configs=[trace_config]) as session:
+        in_flight = {}
+
+        def fill_window():
+            while len(in_flight) < max_concurrency:
+                item = download_queue.next_item()
+                if item is None:
+                    return
+                idx, url = item
+                on_dispatch(idx)
+                task = asyncio.create_task(download_single_pdf_async(session, url, idx, temp_dir, defer_throttled=True))
+                in_flight[task] = (idx, url)
+
+        fill_window()
+        while in_flight or len(download_queue):
+            if not in_flight:
+                await asyncio.sleep(download_queue.retry_hint or 0.1)
+                fill_window()
+                continue
+            done, _ = await asyncio.wait(in_flight, timeout=download_queue.retry_hint, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                idx, url = in_flight.pop(task)
+                result = task.result()
+                if download_queue.handle_result(idx, url, result):
+                    on_result(idx, result)
+            fill_window()
+
+def run_async_engine(download_queue, temp_dir, max_concurrency, on_dispatch, on_result):
+    """Moteur asyncio: max_concurrency téléchargements en streaming dans un seul thread"""
+    asyncio.run(_run_async_engine(download_queue, temp_dir, max_concurrency, on_dispatch, on_result))
@@ -7,7 +7,6 @@ www.myoneart.com
 """
 
 import os
-import requests
 import base64
 import zipfile
 import csv
@@ -19,6 +18,7 @@ from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import tempfile
 from app.utils.progress import progress_manager
+from app.utils.http import get_http_session
 from config import Config
 
 logging.basicConfig(level=logging.INFO)
@@ -125,7 +125,7 @@ Assurez-vous d'extraire TOUTES les tables et TOUTES les données structurées pr
             ]
         }
         
-        response = requests.post(OPENROUTER_API_URL, headers=headers, json=payload, timeout=300)
+        response = get_http_session().post(OPENROUTER_API_URL, headers=headers, json=payload, timeout=300)
         response.raise_for_status()
         
         result = response.json()
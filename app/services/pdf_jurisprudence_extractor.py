@@ -7,7 +7,6 @@ www.myoneart.com
 """
 
 import os
-import requests
 import logging
 import json
 import uuid
@@ -18,6 +17,7 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 import zipfile
 import csv
 import io
+from app.utils.http import get_http_session
 from config import Config
 
 logging.basicConfig(level=logging.INFO)
@@ -88,7 +88,7 @@ IMPORTANT: Retourne UNIQUEMENT le JSON, sans texte avant ou après, sans ```json
             "max_tokens": 3000
         }
         
-        response = requests.post(
+        response = get_http_session().post(
             "https://openrouter.ai/api/v1/chat/completions",
             headers=headers,
             json=data,
@@ -0,0 +1,326 @@
+"""
+PdfTools
+MOA Digital Agency LLC
+Par : Aisance KALONJI
+Mail : moa@myoneart.com
+www.myoneart.com
+"""
+
+import os
+import sys
+import time
+import zlib
+import queue
+import struct
+import zipfile
+import threading
+import logging
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class CompressionPolicy:
+    """Choisit membre par membre entre stockage (ZIP_STORED) et deflate
+
+    Un échantillon du fichier (début et milieu) est compressé: si le gain est inférieur
+    à min_gain (cas de la plupart des PDFs, déjà compressés), le membre est stocké tel
+    quel; sinon il est compressé au niveau configuré. Les octets économisés et le temps
+    CPU passé à compresser sont cumulés pour être rapportés avec le résultat du job.
+    """
+
+    def __init__(self, level=None, min_gain=None, sample_size=None):
+        self.level = Config.ZIP_DEFLATE_LEVEL if level is None else level
+        self.min_gain = Config.ZIP_MIN_DEFLATE_GAIN if min_gain is None else min_gain
+        self.sample_size = Config.ZIP_SAMPLE_SIZE if sample_size is None else sample_size
+        self.lock = threading.Lock()
+        self.bytes_saved = 0
+        self.cpu_seconds = 0.0
+        self.members_stored = 0
+        self.members_deflated = 0
+
+    def read_sample(self, file_path):
+        half = self.sample_size // 2
+        with open(file_path, 'rb') as f:
+            head = f.read(half)
+            size = os.fstat(f.fileno()).st_size
+            if size <= self.sample_size:
+                return head + f.read(half)
+            f.seek(size // 2)
+            return head + f.read(half)
+
+    def choose(self, sample):
+        """Retourne (compress_type, compresslevel) pour un membre dont sample est un extrait"""
+        if not sample:
+            return zipfile.ZIP_STORED, None
+        start = time.thread_time()
+        compressed_size = len(zlib.compress(sample, self.level))
+        with self.lock:
+            self.cpu_seconds += time.thread_time() - start
+        gain = 1 - compressed_size / len(sample)
+        if gain < self.min_gain:
+            return zipfile.ZIP_STORED, None
+        return zipfile.ZIP_DEFLATED, self.level
+
+    def _record(self, zinfo, cpu_seconds):
+        with self.lock:
+            self.cpu_seconds += cpu_seconds
+            self.bytes_saved += zinfo.file_size - zinfo.compress_size
+            if zinfo.compress_type == zipfile.ZIP_STORED:
+                self.members_stored += 1
+            else:
+                self.members_deflated += 1
+
+    def write(self, zipf, file_path, arcname):
+        """Équivalent de zipf.write(file_path, arcname) avec la méthode choisie pour ce membre"""
+        compress_type, compresslevel = self.choose(self.read_sample(file_path))
+        start = time.thread_time()
+        zipf.write(file_path, arcname, compress_type=compress_type, compresslevel=compresslevel)
+        self._record(zipf.filelist[-1], time.thread_time() - start)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'bytes_saved': self.bytes_saved,
+                'cpu_seconds': round(self.cpu_seconds, 3),
+                'members_stored': self.members_stored,
+                'members_deflated': self.members_deflated
+            }
+
+COPY_CHUNK_SIZE = 1024 * 1024
+_ZIP64_EXTRA_ID = 0x0001
+
+# La copie brute des membres dépend d'internes non documentés de zipfile: structFileHeader,
+# _FH_FILENAME_LENGTH et _FH_EXTRA_FIELD_LENGTH pour lire l'en-tête local source, et l'état
+# de ZipFile (fp, filelist, NameToInfo, start_dir, _didModify) pour écrire le membre comme
+# le fait ZipFile.write. Vérifiée sur CPython 3.11 à 3.13; sur une autre version, les
+# membres sont décompressés puis recompressés par l'API publique (plus lent, même résultat).
+RAW_COPY_SUPPORTED = (
+    (3, 11) <= sys.version_info[:2] <= (3, 13)
+    and all(hasattr(zipfile, name) for name in ('structFileHeader', '_FH_FILENAME_LENGTH', '_FH_EXTRA_FIELD_LENGTH'))
+)
+_LOCAL_HEADER_SIZE = struct.calcsize(zipfile.structFileHeader) if RAW_COPY_SUPPORTED else None
+
+def unique_arcname(name, used_names):
+    """Retourne name, ou 'nom (2).ext', 'nom (3).ext'... s'il est déjà présent dans used_names"""
+    if name not in used_names:
+        return name
+    base, ext = os.path.splitext(name)
+    counter = 2
+    while f'{base} ({counter}){ext}' in used_names:
+        counter += 1
+    return f'{base} ({counter}){ext}'
+
+def _strip_zip64_extra(extra):
+    """Retire le champ extra ZIP64 du membre source (FileHeader ajoute le sien si nécessaire)"""
+    kept = b''
+    pos = 0
+    while pos + 4 <= len(extra):
+        field_id, field_size = struct.unpack('<HH', extra[pos:pos + 4])
+        if field_id != _ZIP64_EXTRA_ID:
+            kept += extra[pos:pos + 4 + field_size]
+        pos += 4 + field_size
+    return kept
+
+def _member_data_offset(src_fp, zinfo):
+    src_fp.seek(zinfo.header_offset)
+    header = struct.unpack(zipfile.structFileHeader, src_fp.read(_LOCAL_HEADER_SIZE))
+    name_length = header[zipfile._FH_FILENAME_LENGTH]
+    extra_length = header[zipfile._FH_EXTRA_FIELD_LENGTH]
+    return zinfo.header_offset + _LOCAL_HEADER_SIZE + name_length + extra_length
+
+def _iter_recompress_zip_members(src_path, dest_zipf, totals):
+    """Repli sans internes de zipfile: chaque membre est décompressé puis recompressé par blocs"""
+    used_names = set(dest_zipf.namelist())
+    with zipfile.ZipFile(src_path, 'r') as src_zipf:
+        for src_info in src_zipf.infolist():
+            if src_info.is_dir():
+                continue
+            zinfo = zipfile.ZipInfo(unique_arcname(src_info.filename, used_names), src_info.date_time)
+            zinfo.compress_type = src_info.compress_type
+            zinfo.create_system = src_info.create_system
+            zinfo.external_attr = src_info.external_attr
+            zinfo.comment = src_info.comment
+            used_names.add(zinfo.filename)
+            with src_zipf.open(src_info) as src, dest_zipf.open(zinfo, 'w', force_zip64=src_info.file_size >= zipfile.ZIP64_LIMIT) as dest:
+                while True:
+                    chunk = src.read(COPY_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dest.write(chunk)
+                    yield
+            
+            totals['members'] += 1
+            totals['bytes'] += zinfo.compress_size
+
+def _iter_copy_zip_members(src_path, dest_zipf, totals):
+    """Copie brute des membres de src_path vers dest_zipf; rend la main après chaque bloc écrit"""
+    if not RAW_COPY_SUPPORTED:
+        yield from _iter_recompress_zip_members(src_path, dest_zipf, totals)
+        return
+    with zipfile.ZipFile(src_path, 'r') as src_zipf, open(src_path, 'rb') as src_fp:
+        for src_info in src_zipf.infolist():
+            if src_info.is_dir():
+                continue
+            zinfo = zipfile.ZipInfo(unique_arcname(src_info.filename, dest_zipf.NameToInfo), src_info.date_time)
+            zinfo.compress_type = src_info.compress_type
+            zinfo.CRC = src_info.CRC
+            zinfo.compress_size = src_info.compress_size
+            zinfo.file_size = src_info.file_size
+            # CRC et tailles sont connus: plus besoin du data descriptor après les données
+            zinfo.flag_bits = src_info.flag_bits & ~0x08
+            zinfo.create_system = src_info.create_system
+            zinfo.external_attr = src_info.external_attr
+            zinfo.extra = _strip_zip64_extra(src_info.extra)
+            zinfo.comment = src_info.comment
+
+            data_offset = _member_data_offset(src_fp, src_info)
+            src_fp.seek(data_offset)
+
+            # Écriture directe dans le flux de l'archive, comme le fait ZipFile.write
+            zinfo.header_offset = dest_zipf.fp.tell()
+            dest_zipf.fp.write(zinfo.FileHeader())
+            remaining = src_info.compress_size
+            while remaining > 0:
+                chunk = src_fp.read(min(COPY_CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise zipfile.BadZipFile(f"Membre tronqué dans {src_path}: {src_info.filename}")
+                dest_zipf.fp.write(chunk)
+                remaining -= len(chunk)
+                yield
+            dest_zipf.filelist.append(zinfo)
+            dest_zipf.NameToInfo[zinfo.filename] = zinfo
+            dest_zipf.start_dir = dest_zipf.fp.tell()
+            dest_zipf._didModify = True
+
+            totals['members'] += 1
+            totals['bytes'] += src_info.compress_size
+
+def copy_zip_members(src_path, dest_zipf):
+    """Copie les membres de src_path dans dest_zipf sans les décompresser ni les recompresser
+
+    Les octets compressés sont recopiés tels quels par blocs (mémoire constante); seuls
+    l'en-tête local et l'entrée du répertoire central sont réécrits (ZIP64 compris,
+    décidé par ZipInfo.FileHeader selon les tailles). Les noms déjà présents dans
+    dest_zipf sont renommés 'nom (2).pdf'. Retourne (nombre de membres, octets copiés).
+    Hors des versions de CPython vérifiées (RAW_COPY_SUPPORTED), les membres sont
+    recompressés par blocs.
+    """
+    totals = {'members': 0, 'bytes': 0}
+    for _ in _iter_copy_zip_members(src_path, dest_zipf, totals):
+        pass
+    return totals['members'], totals['bytes']
+
+class _StreamSink:
+    """Flux d'écriture non seekable: ZipFile y écrit, le générateur vide les octets accumulés"""
+
+    def __init__(self):
+        self.chunks = []
+        self.offset = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def iter_zip_stream(files=(), zip_sources=(), policy=None):
+    """Génère une archive ZIP à la volée, bloc par bloc, pour une réponse HTTP en streaming
+
+    files: couples (chemin, nom dans l'archive), compressés selon la politique.
+    zip_sources: ZIPs existants dont les membres sont recopiés sans recompression.
+    Rien n'est écrit sur disque: le client reçoit les premiers octets immédiatement.
+    """
+    policy = policy or CompressionPolicy()
+    sink = _StreamSink()
+    # tell() sans seek(): ZipFile passe en mode non seekable (data descriptors après chaque membre)
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=policy.level) as zipf:
+        for file_path, arcname in files:
+            arcname = unique_arcname(arcname, zipf.NameToInfo)
+            compress_type, _ = policy.choose(policy.read_sample(file_path))
+            if compress_type == zipfile.ZIP_STORED:
+                member = zipfile.ZipInfo.from_file(file_path, arcname)
+                member.compress_type = zipfile.ZIP_STORED
+            else:
+                # Ouvert par son nom: deflate au niveau de la politique (compresslevel de ZipFile)
+                member = arcname
+            with open(file_path, 'rb') as src, zipf.open(member, 'w') as dest:
+                while True:
+                    chunk = src.read(COPY_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dest.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            yield sink.drain()
+
+        totals = {'members': 0, 'bytes': 0}
+        for zip_path in zip_sources:
+            for _ in _iter_copy_zip_members(zip_path, zipf, totals):
+                yield sink.drain()
+    yield sink.drain()
+
+class StreamingZipWriter:
+    """Ajoute des fichiers à un ZIP au fil de l'eau depuis un thread d'écriture dédié
+
+    Les producteurs (threads de téléchargement) appellent add() dès qu'un fichier est
+    prêt; le fichier source est supprimé une fois copié dans l'archive, si bien que
+    le disque ne contient que le ZIP et les fichiers encore en attente.
+    """
+
+    def __init__(self, zip_path, policy=None, remove_sources=True):
+        self.zip_path = zip_path
+        self.policy = policy or CompressionPolicy()
+        self.remove_sources = remove_sources
+        self.queue = queue.Queue()
+        self.written = 0
+        self.errors = []
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def add(self, file_path, arcname):
+        self.queue.put((file_path, arcname))
+
+    def _run(self):
+        with zipfile.ZipFile(self.zip_path, 'w') as zipf:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+                file_path, arcname = item
+                try:
+                    self.policy.write(zipf, file_path, arcname)
+                    self.written += 1
+                except Exception as e:
+                    logger.error(f"Erreur d'ajout de {arcname} au ZIP {self.zip_path}: {e}")
+                    self.errors.append({'file': arcname, 'error': str(e)})
+                finally:
+                    if self.remove_sources:
+                        try:
+                            os.remove(file_path)
+                        except OSError:
+                            pass
+
+    def close(self):
+        """Attend l'écriture des fichiers en file puis finalise le ZIP (répertoire central)"""
+        self.queue.put(None)
+        self.thread.join()
+        return self.written
+
+    def abort(self):
+        """Finalise puis supprime l'archive (aucun fichier utile)"""
+        self.close()
+        try:
+            os.remove(self.zip_path)
+        except OSError:
+            pass
@@ -0,0 +1,221 @@
+"""
+PdfTools
+MOA Digital Agency LLC
+Par : Aisance KALONJI
+Mail : moa@myoneart.com
+www.myoneart.com
+"""
+
+import os
+import time
+import shutil
+import threading
+import logging
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from app.utils.sqlite import get_connection
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+def normalize_url(url):
+    """Clé de cache: schéma/hôte en minuscules, sans port par défaut ni fragment, paramètres triés"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f'{host}:{parts.port}'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, parts.path or '/', query, ''))
+
+class DownloadCache:
+    """Cache disque des PDFs téléchargés, adressé par contenu (SHA-256)
+
+    Les corps sont stockés une seule fois dans objects/<sha[:2]>/<sha>.pdf, l'index
+    SQLite associe chaque URL normalisée à son contenu et à ses validateurs HTTP
+    (ETag, Last-Modified) pour une revalidation conditionnelle (304 sans corps).
+    Au-delà de max_bytes, les entrées les moins récemment utilisées sont évincées.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        self.db_path = os.path.join(cache_dir, 'index.db')
+        self.max_bytes = max_bytes
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._init_db()
+
+    def _init_db(self):
+        conn = get_connection(self.db_path)
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS entries (
+                url_key TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries (last_access);
+            CREATE INDEX IF NOT EXISTS idx_entries_sha256 ON entries (sha256);
+            CREATE TABLE IF NOT EXISTS blobs (
+                sha256 TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                refcount INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS cache_stats (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                total_bytes INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO cache_stats (id, total_bytes) VALUES (1, 0);
+        ''')
+        conn.commit()
+
+    def blob_path(self, sha256):
+        return os.path.join(self.objects_dir, sha256[:2], f'{sha256}.pdf')
+
+    def lookup(self, url):
+        """Retourne l'entrée de cache de url (avec son chemin de blob) ou None"""
+        conn = get_connection(self.db_path)
+        row = conn.execute('''
+            SELECT e.url_key, e.sha256, e.etag, e.last_modified, b.size
+            FROM entries e JOIN blobs b ON b.sha256 = e.sha256
+            WHERE e.url_key = ?
+        ''', (normalize_url(url),)).fetchone()
+        if not row:
+            return None
+        path = self.blob_path(row['sha256'])
+        if not os.path.exists(path):
+            return None
+        return {
+            'url_key': row['url_key'],
+            'sha256': row['sha256'],
+            'etag': row['etag'],
+            'last_modified': row['last_modified'],
+            'size': row['size'],
+            'path': path
+        }
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def copy_to(self, entry, dest_path):
+        """Copie le contenu en cache vers dest_path (lien physique si possible) et rafraîchit l'entrée"""
+        try:
+            os.link(entry['path'], dest_path)
+        except OSError:
+            shutil.copyfile(entry['path'], dest_path)
+        conn = get_connection(self.db_path)
+        conn.execute('UPDATE entries SET last_access = ? WHERE url_key = ?', (time.time(), entry['url_key']))
+        conn.commit()
+
+    def restore(self, sha256, dest_path):
+        """Recopie le contenu d'empreinte sha256 vers dest_path s'il est encore en cache"""
+        blob = self.blob_path(sha256)
+        try:
+            os.link(blob, dest_path)
+        except FileNotFoundError:
+            return False
+        except OSError:
+            try:
+                shutil.copyfile(blob, dest_path)
+            except FileNotFoundError:
+                return False
+        return True
+
+    def store(self, url, file_path, sha256, etag=None, last_modified=None):
+        """Ajoute (ou remplace) le contenu de url dans le cache"""
+        if not etag and not last_modified:
+            # Sans validateur, une revalidation conditionnelle est impossible
+            return False
+        size = os.path.getsize(file_path)
+        blob = self.blob_path(sha256)
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            tmp_blob = f'{blob}.{os.getpid()}.{threading.get_ident()}.tmp'
+            try:
+                os.link(file_path, tmp_blob)
+            except OSError:
+                shutil.copyfile(file_path, tmp_blob)
+            os.replace(tmp_blob, blob)
+
+        url_key = normalize_url(url)
+        orphaned = []
+        conn = get_connection(self.db_path)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT sha256 FROM entries WHERE url_key = ?', (url_key,)).fetchone()
+            old_sha = row['sha256'] if row else None
+            if old_sha != sha256:
+                added = conn.execute('INSERT OR IGNORE INTO blobs (sha256, size, refcount) VALUES (?, ?, 0)', (sha256, size)).rowcount
+                if added:
+                    conn.execute('UPDATE cache_stats SET total_bytes = total_bytes + ? WHERE id = 1', (size,))
+                conn.execute('UPDATE blobs SET refcount = refcount + 1 WHERE sha256 = ?', (sha256,))
+                if old_sha:
+                    orphaned += self._release_blob(conn, old_sha)
+            conn.execute('''
+                INSERT OR REPLACE INTO entries (url_key, sha256, etag, last_modified, last_access)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (url_key, sha256, etag, last_modified, time.time()))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        self._remove_blobs(orphaned)
+        self.evict()
+        return True
+
+    def _release_blob(self, conn, sha256):
+        conn.execute('UPDATE blobs SET refcount = refcount - 1 WHERE sha256 = ?', (sha256,))
+        row = conn.execute('SELECT size, refcount FROM blobs WHERE sha256 = ?', (sha256,)).fetchone()
+        if row and row['refcount'] <= 0:
+            conn.execute('DELETE FROM blobs WHERE sha256 = ?', (sha256,))
+            conn.execute('UPDATE cache_stats SET total_bytes = total_bytes - ? WHERE id = 1', (row['size'],))
+            return [sha256]
+        return []
+
+    def _remove_blobs(self, sha256_list):
+        for sha256 in sha256_list:
+            try:
+                os.remove(self.blob_path(sha256))
+            except FileNotFoundError:
+                pass
+
+    def total_bytes(self):
+        conn = get_connection(self.db_path)
+        return conn.execute('SELECT total_bytes FROM cache_stats WHERE id = 1').fetchone()['total_bytes']
+
+    def evict(self):
+        """Évince les entrées les moins récemment utilisées jusqu'à repasser sous max_bytes"""
+        evicted = 0
+        conn = get_connection(self.db_path)
+        while self.total_bytes() > self.max_bytes:
+            orphaned = []
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                rows = conn.execute('SELECT url_key, sha256 FROM entries ORDER BY last_access LIMIT 50').fetchall()
+                if not rows:
+                    conn.commit()
+                    break
+                for row in rows:
+                    conn.execute('DELETE FROM entries WHERE url_key = ?', (row['url_key'],))
+                    orphaned += self._release_blob(conn, row['sha256'])
+                    evicted += 1
+                    if conn.execute('SELECT total_bytes FROM cache_stats WHERE id = 1').fetchone()['total_bytes'] <= self.max_bytes:
+                        break
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            self._remove_blobs(orphaned)
+        if evicted:
+            logger.info(f"Cache de téléchargement: {evicted} entrées évincées")
+        return evicted
+
+download_cache = DownloadCache(Config.DOWNLOAD_CACHE_DIR, Config.DOWNLOAD_CACHE_MAX_BYTES) if Config.DOWNLOAD_CACHE_ENABLED else None
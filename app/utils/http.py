@@ -0,0 +1,101 @@
+"""
+PdfTools
+MOA Digital Agency LLC
+Par : Aisance KALONJI
+Mail : moa@myoneart.com
+www.myoneart.com
+"""
+
+import threading
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Compteur des connexions TCP ouvertes, par thread, pour savoir si une requête
+# a réutilisé une connexion keep-alive du pool
+_thread_stats = threading.local()
+
+def _record_new_connection():
+    _thread_stats.opened = getattr(_thread_stats, 'opened', 0) + 1
+
+def connections_opened():
+    """Nombre de connexions ouvertes par le thread courant depuis son démarrage"""
+    return getattr(_thread_stats, 'opened', 0)
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        _record_new_connection()
+        return super()._new_conn()
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        _record_new_connection()
+        return super()._new_conn()
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter dont les pools comptent les nouvelles connexions"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _CountingHTTPConnectionPool,
+            'https': _CountingHTTPSConnectionPool
+        }
+
+class HttpClient:
+    """Session HTTP partagée (keep-alive) pour tous les appels sortants"""
+
+    def __init__(self, pool_connections, pool_maxsize):
+        self.lock = threading.Lock()
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.session = self._build_session(pool_maxsize)
+
+    def _build_session(self, pool_maxsize):
+        session = requests.Session()
+        adapter = PooledHTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=pool_maxsize
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def get_session(self, max_workers=None):
+        """Retourne la session partagée, en agrandissant le pool par hôte si nécessaire"""
+        if max_workers and max_workers > self.pool_maxsize:
+            with self.lock:
+                if max_workers > self.pool_maxsize:
+                    logger.info(f"Pool HTTP agrandi: {self.pool_maxsize} -> {max_workers} connexions par hôte")
+                    self.pool_maxsize = max_workers
+                    self._resize_pools(max_workers)
+        return self.session
+
+    def _resize_pools(self, pool_maxsize):
+        """Agrandit les pools de la session en place (la session reste la même)
+
+        Les pools par hôte existants sont fermés puis recréés à la nouvelle taille à
+        la prochaine requête: leurs connexions libres sont fermées tout de suite, celles
+        en cours d'utilisation le sont quand leur requête les rend.
+        """
+        for adapter in set(self.session.adapters.values()):
+            manager = adapter.poolmanager
+            old_pools = [pool for pool in (manager.pools.get(key) for key in manager.pools.keys()) if pool]
+            adapter._pool_maxsize = pool_maxsize
+            manager.connection_pool_kw['maxsize'] = pool_maxsize
+            manager.clear()
+            # urllib3 2.x ne ferme pas les pools retirés par clear()
+            for pool in old_pools:
+                pool.close()
+
+http_client = HttpClient(
+    pool_connections=Config.HTTP_POOL_CONNECTIONS,
+    pool_maxsize=Config.HTTP_POOL_MAXSIZE
+)
+
+def get_http_session(max_workers=None):
+    return http_client.get_session(max_workers)
@@ -0,0 +1,325 @@
+"""
+PdfTools
+MOA Digital Agency LLC
+Par : Aisance KALONJI
+Mail : moa@myoneart.com
+www.myoneart.com
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import threading
+import logging
+from app.utils.sqlite import get_connection
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Fonctions exécutant chaque type de job: handler(payload) -> résultat sérialisable en JSON
+job_handlers = {}
+# Appelées une fois le job terminé (done): cleanup(payload)
+job_cleanups = {}
+# Appelées quand le job est abandonné après sa dernière tentative: on_failure(payload, error)
+job_failure_handlers = {}
+
+_local = threading.local()
+
+class JobCancelled(Exception):
+    """Le job a perdu son bail: un autre worker l'a repris, cette exécution doit s'arrêter"""
+
+def current_cancel_event():
+    """Événement levé quand le job exécuté par ce thread perd son bail (None hors d'un job)
+
+    Les jobs longs qui écrivent dans un état partagé entre tentatives (dossier de
+    reprise, journal de session) le consultent et lèvent JobCancelled.
+    """
+    return getattr(_local, 'cancel_event', None)
+
+def register_job(kind, cleanup=None, on_failure=None):
+    """Décorateur: associe un type de job à la fonction qui l'exécute
+
+    Le handler lève une exception pour une erreur transitoire (le job est relancé avec
+    backoff jusqu'à max_attempts tentatives) et retourne {'success': False, ...} pour
+    un échec définitif. Une tentative peut être rejouée: le handler ne doit pas
+    supprimer ses fichiers d'entrée, c'est le rôle de cleanup, appelé une fois le
+    résultat enregistré.
+    """
+    def decorator(func):
+        job_handlers[kind] = func
+        if cleanup:
+            job_cleanups[kind] = cleanup
+        if on_failure:
+            job_failure_handlers[kind] = on_failure
+        return func
+    return decorator
+
+class JobQueue:
+    """File de jobs persistante (SQLite WAL) partagée par tous les workers gunicorn
+
+    Un job réclamé est loué pour lease_seconds; le pool renouvelle le bail tant que le
+    job tourne. Si le processus meurt, le bail expire et un autre worker reprend le job;
+    le worker qui a perdu le bail est prévenu par current_cancel_event().
+    Une exception relance le job (backoff exponentiel) jusqu'à max_attempts tentatives.
+    """
+
+    def __init__(self, db_path, lease_seconds=60, max_attempts=3):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._init_db()
+
+    def _init_db(self):
+        conn = get_connection(self.db_path)
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                lease_owner TEXT,
+                lease_expires REAL,
+                available_at REAL NOT NULL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status_available ON jobs (status, available_at);
+            CREATE INDEX IF NOT EXISTS idx_jobs_status_lease ON jobs (status, lease_expires);
+        ''')
+        conn.commit()
+
+    def submit(self, kind, payload, max_attempts=None):
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        conn = get_connection(self.db_path)
+        conn.execute('''
+            INSERT INTO jobs (id, kind, payload, status, max_attempts, available_at, created_at, updated_at)
+            VALUES (?, ?, ?, 'queued', ?, ?, ?, ?)
+        ''', (job_id, kind, json.dumps(payload), max_attempts or self.max_attempts, now, now, now))
+        conn.commit()
+        logger.info(f"Job {job_id} ({kind}) mis en file")
+        return job_id
+
+    def claim(self, owner):
+        """Réserve le plus ancien job disponible (ou dont le bail a expiré); retourne le job ou None
+
+        Un bail expiré sans plus aucune tentative disponible est réservé avec
+        job['lease_expired'] = True: le worker l'abandonne par fail() et exécute
+        on_failure, comme pour un échec de sa dernière tentative.
+        """
+        now = time.time()
+        conn = get_connection(self.db_path)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('''
+                SELECT id, status, attempts, max_attempts FROM jobs
+                WHERE (status = 'queued' AND available_at <= ?) OR (status = 'running' AND lease_expires < ?)
+                ORDER BY created_at LIMIT 1
+            ''', (now, now)).fetchone()
+            if not row:
+                conn.commit()
+                return None
+            lease_expired = row['status'] == 'running' and row['attempts'] >= row['max_attempts']
+            conn.execute('''
+                UPDATE jobs SET status = 'running', attempts = attempts + ?, lease_owner = ?, lease_expires = ?, updated_at = ?
+                WHERE id = ?
+            ''', (0 if lease_expired else 1, owner, now + self.lease_seconds, now, row['id']))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        job = self.get(row['id'])
+        job['lease_expired'] = lease_expired
+        return job
+
+    def heartbeat(self, job_id, owner):
+        """Prolonge le bail; retourne False si le job a été repris par un autre worker"""
+        now = time.time()
+        conn = get_connection(self.db_path)
+        updated = conn.execute('''
+            UPDATE jobs SET lease_expires = ?, updated_at = ?
+            WHERE id = ? AND lease_owner = ? AND status = 'running'
+        ''', (now + self.lease_seconds, now, job_id, owner)).rowcount
+        conn.commit()
+        return bool(updated)
+
+    def complete(self, job_id, owner, result):
+        now = time.time()
+        conn = get_connection(self.db_path)
+        updated = conn.execute('''
+            UPDATE jobs SET status = 'done', result = ?, error = NULL, lease_owner = NULL, updated_at = ?
+            WHERE id = ? AND lease_owner = ?
+        ''', (json.dumps(result), now, job_id, owner)).rowcount
+        conn.commit()
+        return bool(updated)
+
+    def fail(self, job_id, owner, error, retry=True):
+        """Remet le job en file après un délai, ou le marque en échec s'il n'a plus de tentatives
+
+        Retourne le nouveau statut ('queued' ou 'failed'), None si le job a été repris par un autre worker.
+        """
+        now = time.time()
+        conn = get_connection(self.db_path)
+        row = conn.execute('SELECT attempts, max_attempts FROM jobs WHERE id = ? AND lease_owner = ?',
+                           (job_id, owner)).fetchone()
+        if not row:
+            return None
+        if retry and row['attempts'] < row['max_attempts']:
+            delay = min(2 ** row['attempts'], 60)
+            conn.execute('''
+                UPDATE jobs SET status = 'queued', error = ?, lease_owner = NULL, available_at = ?, updated_at = ?
+                WHERE id = ?
+            ''', (error, now + delay, now, job_id))
+            status = 'queued'
+        else:
+            conn.execute('''
+                UPDATE jobs SET status = 'failed', error = ?, lease_owner = NULL, updated_at = ?
+                WHERE id = ?
+            ''', (error, now, job_id))
+            status = 'failed'
+        conn.commit()
+        return status
+
+    def get(self, job_id):
+        conn = get_connection(self.db_path)
+        row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if not row:
+            return None
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def wait(self, job_id, timeout, poll_interval=0.25):
+        """Attend la fin du job (done/failed) au plus timeout secondes; retourne le job"""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job['status'] in ('done', 'failed') or time.monotonic() >= deadline:
+                return job
+            time.sleep(poll_interval)
+
+class JobWorkerPool:
+    """Threads qui exécutent les jobs de la file dans le contexte de l'application
+
+    Chaque processus gunicorn démarre son propre pool: les jobs sont répartis entre
+    tous les workers, quel que soit celui qui a reçu la requête HTTP.
+    """
+
+    def __init__(self, app, queue, size, poll_interval=0.5):
+        self.app = app
+        self.queue = queue
+        self.size = size
+        self.poll_interval = poll_interval
+        self.prefix = f'{socket.gethostname()}:{os.getpid()}'
+        self.running = {}
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def start(self):
+        for n in range(self.size):
+            threading.Thread(target=self._run, args=(f'{self.prefix}:{n}',), daemon=True).start()
+        threading.Thread(target=self._heartbeat, daemon=True).start()
+        logger.info(f"Pool de jobs démarré: {self.size} workers ({self.prefix})")
+
+    def stop(self):
+        self.stopping.set()
+
+    def _run(self, owner):
+        while not self.stopping.is_set():
+            try:
+                job = self.queue.claim(owner)
+            except Exception as e:
+                logger.error(f"Erreur de réservation de job: {e}")
+                job = None
+            if job is None:
+                self.stopping.wait(self.poll_interval)
+                continue
+            try:
+                self._execute(job, owner)
+            except Exception as e:
+                # Résultat non enregistré (base indisponible): le bail expirera et le job sera repris
+                logger.error(f"Job {job['id']} ({job['kind']}): erreur d'enregistrement: {e}", exc_info=True)
+
+    def _execute(self, job, owner):
+        if job['lease_expired']:
+            # Dernière tentative interrompue (worker arrêté): même finalisation qu'un échec
+            error = 'Bail expiré (worker arrêté)'
+            logger.error(f"Job {job['id']} ({job['kind']}): {error}")
+            if self.queue.fail(job['id'], owner, error, retry=False) == 'failed':
+                self._run_hook(job, job_failure_handlers.get(job['kind']), error)
+            return
+        handler = job_handlers.get(job['kind'])
+        if handler is None:
+            self.queue.fail(job['id'], owner, f"Type de job inconnu: {job['kind']}", retry=False)
+            return
+        cancel_event = threading.Event()
+        with self.lock:
+            self.running[job['id']] = (owner, cancel_event)
+        logger.info(f"Job {job['id']} ({job['kind']}) démarré, tentative {job['attempts']}/{job['max_attempts']}")
+        error = None
+        _local.cancel_event = cancel_event
+        try:
+            with self.app.app_context():
+                result = handler(job['payload'])
+        except JobCancelled:
+            # Le job a été repris par un autre worker, qui le finalisera
+            logger.warning(f"Job {job['id']} ({job['kind']}) interrompu: bail perdu")
+            status = None
+        except Exception as e:
+            logger.error(f"Job {job['id']} ({job['kind']}) en erreur: {e}", exc_info=True)
+            error = str(e)
+            status = self.queue.fail(job['id'], owner, error)
+        else:
+            # False: bail perdu, le job a été repris et sera finalisé par l'autre worker
+            status = 'done' if self.queue.complete(job['id'], owner, result) else None
+        finally:
+            _local.cancel_event = None
+            with self.lock:
+                self.running.pop(job['id'], None)
+        
+        if status == 'done':
+            logger.info(f"Job {job['id']} ({job['kind']}) terminé")
+            self._run_hook(job, job_cleanups.get(job['kind']))
+        elif status == 'queued':
+            logger.info(f"Job {job['id']} ({job['kind']}) remis en file pour une nouvelle tentative")
+        elif status == 'failed':
+            self._run_hook(job, job_failure_handlers.get(job['kind']), error)
+
+    def _run_hook(self, job, hook, *args):
+        if hook is None:
+            return
+        try:
+            with self.app.app_context():
+                hook(job['payload'], *args)
+        except Exception as e:
+            logger.error(f"Job {job['id']} ({job['kind']}): erreur de finalisation: {e}", exc_info=True)
+
+    def _heartbeat(self):
+        while not self.stopping.wait(self.queue.lease_seconds / 3):
+            with self.lock:
+                running = list(self.running.items())
+            for job_id, (owner, cancel_event) in running:
+                try:
+                    if not self.queue.heartbeat(job_id, owner):
+                        # Le job s'arrête à son prochain point de contrôle (voir current_cancel_event)
+                        logger.warning(f"Job {job_id}: bail perdu (repris par un autre worker), arrêt demandé")
+                        cancel_event.set()
+                except Exception as e:
+                    logger.error(f"Erreur de renouvellement du bail du job {job_id}: {e}")
+
+job_queue = JobQueue(Config.JOBS_DB_PATH, lease_seconds=Config.JOB_LEASE_SECONDS, max_attempts=Config.JOB_MAX_ATTEMPTS)
+
+def start_job_workers(app):
+    """Démarre le pool de jobs du processus (JOB_WORKERS = 0 pour le désactiver)"""
+    if Config.JOB_WORKERS <= 0:
+        return None
+    pool = JobWorkerPool(app, job_queue, Config.JOB_WORKERS)
+    pool.start()
+    return pool
@@ -0,0 +1,153 @@
+"""
+PdfTools
+MOA Digital Agency LLC
+Par : Aisance KALONJI
+Mail : moa@myoneart.com
+www.myoneart.com
+"""
+
+import os
+import json
+import threading
+import logging
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_path_locks = {}
+_path_locks_guard = threading.Lock()
+
+@contextmanager
+def file_lock(lock_path):
+    """Verrou exclusif entre threads (verrou par chemin) et entre processus (flock)"""
+    with _path_locks_guard:
+        thread_lock = _path_locks.setdefault(lock_path, threading.Lock())
+    with thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def write_json_atomic(path, data):
+    """Écrit data dans un fichier temporaire puis le renomme: le fichier n'est jamais vu à moitié écrit"""
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class AppendOnlyJournal:
+    """Journal JSON Lines en ajout seul: une ligne par enregistrement, jamais réécrite
+
+    Chaque append() est écrit et vidé immédiatement, si bien qu'un arrêt brutal du
+    processus ne perd au plus que l'enregistrement en cours (ligne tronquée, ignorée
+    à la relecture). Le premier append() d'une instance commence par un saut de ligne
+    si le fichier se termine par une telle ligne, pour ne pas s'y coller.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.tail_checked = False
+
+    def _ends_with_partial_line(self):
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() == 0:
+                    return False
+                f.seek(-1, os.SEEK_END)
+                return f.read(1) != b'\n'
+        except FileNotFoundError:
+            return False
+
+    def append(self, record):
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self.lock:
+            if not self.tail_checked:
+                if self._ends_with_partial_line():
+                    logger.warning(f"Journal {self.path}: dernière ligne tronquée, isolée avant l'ajout")
+                    line = '\n' + line
+                self.tail_checked = True
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+
+    def read(self):
+        """Retourne les enregistrements dans l'ordre d'écriture"""
+        records = []
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.warning(f"Journal {self.path}: ligne {line_number} illisible ignorée")
+        return records
+
+class SnapshotJournal:
+    """État JSON = dernier instantané + événements ajoutés depuis
+
+    append() ne coûte qu'une ligne quelle que soit la taille de l'état; quand le journal
+    dépasse compact_bytes, l'état rejoué est réécrit atomiquement dans l'instantané et le
+    journal est vidé. Ajouts et compactions sont sérialisés par un verrou de fichier,
+    y compris entre workers gunicorn.
+    """
+
+    def __init__(self, snapshot_path, apply_event, compact_bytes):
+        self.snapshot_path = snapshot_path
+        self.events = AppendOnlyJournal(f'{os.path.splitext(snapshot_path)[0]}.events.jsonl')
+        self.lock_path = f'{snapshot_path}.lock'
+        self.apply_event = apply_event
+        self.compact_bytes = compact_bytes
+
+    def exists(self):
+        return os.path.exists(self.snapshot_path)
+
+    def _replay(self):
+        with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        for event in self.events.read():
+            self.apply_event(state, event)
+        return state
+
+    def load(self):
+        with file_lock(self.lock_path):
+            return self._replay()
+
+    def write_snapshot(self, state):
+        """Remplace l'état complet (création ou compaction) et vide le journal"""
+        with file_lock(self.lock_path):
+            self._write_snapshot(state)
+
+    def _write_snapshot(self, state):
+        write_json_atomic(self.snapshot_path, state)
+        # L'instantané contient désormais tous les événements: le journal peut être vidé
+        # (un arrêt entre les deux rejoue des événements déjà appliqués: ils doivent être idempotents)
+        open(self.events.path, 'w').close()
+
+    def append(self, event):
+        with file_lock(self.lock_path):
+            self.events.append(event)
+            if os.path.getsize(self.events.path) >= self.compact_bytes:
+                self._write_snapshot(self._replay())
+                logger.info(f"Journal compacté dans {self.snapshot_path}")
+
+    def compact(self):
+        with file_lock(self.lock_path):
+            self._write_snapshot(self._replay())
@@ -6,87 +6,274 @@ Mail : moa@myoneart.com
 www.myoneart.com
 """
 
+import os
 import time
 import json
-import os
-from datetime import datetime
-from pathlib import Path
 import threading
 import logging
+from app.utils.sqlite import get_connection
+from config import Config
 
 logger = logging.getLogger(__name__)
 
+# Statuts après lesquels une session n'évolue plus
+TERMINAL_STATUSES = ('completed', 'ready', 'error')
+
 class ProgressManager:
-    def __init__(self, storage_dir='tmp/progress'):
-        self.storage_dir = Path(storage_dir)
-        self.storage_dir.mkdir(parents=True, exist_ok=True)
+    """Progression des sessions: mémoire du processus + SQLite (WAL) partagé entre workers
+
+    update() ne fait que fusionner les champs dans un dict en attente; un thread
+    d'écriture les reporte en base toutes les flush_interval secondes, en une seule
+    transaction pour toutes les sessions modifiées. Les changements de statut et la
+    création d'une session sont écrits immédiatement, pour que les autres processus
+    voient sans délai le début et la fin d'une tâche. get() relit la base et y
+    superpose les champs pas encore écrits par ce processus.
+
+    Chaque écriture incrémente la version de la session et réveille les abonnés du
+    processus (wait()); ceux des autres processus relisent la version toutes les
+    wait_poll_interval secondes. Une séquence globale (seq) numérote en plus toutes
+    les écritures, pour suivre plusieurs sessions à la fois (changes_since()). Elle
+    est tirée d'un compteur dédié (progress_seq) et ne revient jamais en arrière,
+    même quand la session la plus récente est supprimée.
+    """
+
+    def __init__(self, db_path, flush_interval=0.25, wait_poll_interval=0.5):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.wait_poll_interval = wait_poll_interval
+        self.changed = threading.Condition()
+        self.generation = 0
         self.lock = threading.Lock()
-        logger.info(f"ProgressManager initialisé avec stockage persistant: {self.storage_dir}")
-    
-    def _get_session_file(self, session_id):
-        return self.storage_dir / f"{session_id}.json"
-    
+        self.pending = {}
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.flusher = None
+        self.flusher_pid = None
+        self._init_db()
+        logger.info(f"ProgressManager initialisé avec stockage persistant: {self.db_path}")
+
+    def _init_db(self):
+        conn = get_connection(self.db_path)
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS progress (
+                session_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                last_update REAL NOT NULL,
+                version INTEGER NOT NULL DEFAULT 0,
+                seq INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_progress_last_update ON progress (last_update);
+        ''')
+        columns = [row['name'] for row in conn.execute('PRAGMA table_info(progress)')]
+        if 'version' not in columns:
+            conn.execute('ALTER TABLE progress ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+        if 'seq' not in columns:
+            conn.execute('ALTER TABLE progress ADD COLUMN seq INTEGER NOT NULL DEFAULT 0')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_progress_seq ON progress (seq)')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS progress_seq (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                seq INTEGER NOT NULL
+            )
+        ''')
+        conn.execute('INSERT OR IGNORE INTO progress_seq (id, seq) SELECT 1, COALESCE(MAX(seq), 0) FROM progress')
+        conn.commit()
+
+    @staticmethod
+    def _next_seq(conn):
+        """Incrémente le compteur global; à appeler dans la transaction d'écriture"""
+        conn.execute('UPDATE progress_seq SET seq = seq + 1 WHERE id = 1')
+        return conn.execute('SELECT seq FROM progress_seq WHERE id = 1').fetchone()['seq']
+
+    def _notify(self):
+        with self.changed:
+            self.generation += 1
+            self.changed.notify_all()
+
+    def _ensure_flusher(self):
+        # Un thread par processus (après un fork gunicorn, le thread du parent n'existe plus)
+        if self.flusher is not None and self.flusher_pid == os.getpid() and self.flusher.is_alive():
+            return
+        with self.lock:
+            if self.flusher is None or self.flusher_pid != os.getpid() or not self.flusher.is_alive():
+                self.flusher_pid = os.getpid()
+                self.flusher = threading.Thread(target=self._flush_loop, daemon=True)
+                self.flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Erreur d'écriture de la progression: {e}")
+
+    def flush(self, session_ids=None):
+        """Écrit en base les champs en attente (de toutes les sessions, ou de session_ids)"""
+        with self.flush_lock:
+            with self.lock:
+                if session_ids is None:
+                    batch, self.pending = self.pending, {}
+                else:
+                    batch = {sid: self.pending.pop(sid) for sid in session_ids if sid in self.pending}
+            if not batch:
+                return 0
+            conn = get_connection(self.db_path)
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                for session_id, fields in batch.items():
+                    row = conn.execute('SELECT data FROM progress WHERE session_id = ?', (session_id,)).fetchone()
+                    if not row:
+                        logger.warning(f"Tentative de mise à jour d'une session inexistante: {session_id}")
+                        continue
+                    session_data = json.loads(row['data'])
+                    session_data.update(fields)
+                    conn.execute('''
+                        UPDATE progress SET data = ?, last_update = ?, version = version + 1, seq = ?
+                        WHERE session_id = ?
+                    ''', (json.dumps(session_data), session_data['last_update'], self._next_seq(conn), session_id))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                # Les champs non écrits seront retentés au prochain passage (sans écraser les plus récents)
+                with self.lock:
+                    for session_id, fields in batch.items():
+                        self.pending[session_id] = {**fields, **self.pending.get(session_id, {})}
+                raise
+            self._notify()
+            return len(batch)
+
     def create_session(self, session_id):
+        now = time.time()
+        session_data = {
+            'status': 'initializing',
+            'total': 0,
+            'current': 0,
+            'batch_current': 0,
+            'batch_total': 0,
+            'successful': 0,
+            'failed': 0,
+            'message': 'Initialisation...',
+            'start_time': now,
+            'last_update': now
+        }
         with self.lock:
-            session_data = {
-                'status': 'initializing',
-                'total': 0,
-                'current': 0,
-                'batch_current': 0,
-                'batch_total': 0,
-                'successful': 0,
-                'failed': 0,
-                'message': 'Initialisation...',
-                'start_time': time.time(),
-                'last_update': time.time()
-            }
-            session_file = self._get_session_file(session_id)
-            with open(session_file, 'w') as f:
-                json.dump(session_data, f)
-            logger.info(f"Session créée et sauvegardée: {session_id}")
-    
+            self.pending.pop(session_id, None)
+        conn = get_connection(self.db_path)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('''
+                INSERT INTO progress (session_id, data, last_update, version, seq)
+                VALUES (?, ?, ?, 1, ?)
+                ON CONFLICT (session_id) DO UPDATE SET data = excluded.data, last_update = excluded.last_update,
+                                                       version = progress.version + 1, seq = excluded.seq
+            ''', (session_id, json.dumps(session_data), now, self._next_seq(conn)))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        self._notify()
+        logger.info(f"Session créée et sauvegardée: {session_id}")
+
     def update(self, session_id, **kwargs):
         with self.lock:
-            session_file = self._get_session_file(session_id)
-            if session_file.exists():
-                with open(session_file, 'r') as f:
-                    session_data = json.load(f)
-                session_data.update(kwargs)
-                session_data['last_update'] = time.time()
-                with open(session_file, 'w') as f:
-                    json.dump(session_data, f)
-            else:
-                logger.warning(f"Tentative de mise à jour d'une session inexistante: {session_id}")
-    
+            fields = self.pending.setdefault(session_id, {})
+            fields.update(kwargs)
+            fields['last_update'] = time.time()
+        if 'status' in kwargs:
+            self.flush([session_id])
+        else:
+            self._ensure_flusher()
+
     def get(self, session_id):
+        return self.get_versioned(session_id)[1]
+
+    def get_versioned(self, session_id):
+        """Retourne (version, données); (0, {}) si la session n'existe pas"""
+        conn = get_connection(self.db_path)
+        row = conn.execute('SELECT data, version FROM progress WHERE session_id = ?', (session_id,)).fetchone()
+        if not row:
+            return 0, {}
+        session_data = json.loads(row['data'])
         with self.lock:
-            session_file = self._get_session_file(session_id)
-            if session_file.exists():
-                with open(session_file, 'r') as f:
-                    return json.load(f)
-            return {}
-    
+            fields = self.pending.get(session_id)
+            if fields:
+                session_data.update(fields)
+        return row['version'], session_data
+
+    def wait(self, session_id, since_version, timeout):
+        """Attend que la version de la session dépasse since_version (au plus timeout secondes)
+
+        Retourne (version, données) dès qu'elle a changé, ou l'état courant à l'expiration
+        du délai; (0, {}) si la session n'existe pas.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self.changed:
+                generation = self.generation
+            version, session_data = self.get_versioned(session_id)
+            remaining = deadline - time.monotonic()
+            if not session_data or version != since_version or remaining <= 0:
+                return version, session_data
+            with self.changed:
+                # Réveil par une écriture de ce processus, sinon relecture périodique (autres workers)
+                self.changed.wait_for(lambda: self.generation != generation,
+                                      min(remaining, self.wait_poll_interval))
+
+    def current_seq(self):
+        conn = get_connection(self.db_path)
+        return conn.execute('SELECT seq FROM progress_seq WHERE id = 1').fetchone()['seq']
+
+    def changes_since(self, since_seq):
+        """Sessions écrites après since_seq: retourne (dernière seq, {session_id: données})"""
+        conn = get_connection(self.db_path)
+        rows = conn.execute('SELECT session_id, data, seq FROM progress WHERE seq > ? ORDER BY seq',
+                            (since_seq,)).fetchall()
+        if not rows:
+            return since_seq, {}
+        return rows[-1]['seq'], {row['session_id']: json.loads(row['data']) for row in rows}
+
+    def active_sessions(self, max_age):
+        """Sessions non terminées mises à jour depuis moins de max_age secondes"""
+        conn = get_connection(self.db_path)
+        rows = conn.execute('SELECT session_id, data FROM progress WHERE last_update > ?',
+                            (time.time() - max_age,)).fetchall()
+        sessions = {row['session_id']: json.loads(row['data']) for row in rows}
+        return {sid: data for sid, data in sessions.items() if data.get('status') not in TERMINAL_STATUSES}
+
+    def wait_changes(self, since_seq, timeout):
+        """Attend une écriture sur n'importe quelle session après since_seq; retourne la seq courante"""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self.changed:
+                generation = self.generation
+            seq = self.current_seq()
+            remaining = deadline - time.monotonic()
+            if seq != since_seq or remaining <= 0:
+                return seq
+            with self.changed:
+                self.changed.wait_for(lambda: self.generation != generation,
+                                      min(remaining, self.wait_poll_interval))
+
     def delete(self, session_id):
         with self.lock:
-            session_file = self._get_session_file(session_id)
-            if session_file.exists():
-                session_file.unlink()
-                logger.info(f"Session supprimée: {session_id}")
-    
+            self.pending.pop(session_id, None)
+        conn = get_connection(self.db_path)
+        deleted = conn.execute('DELETE FROM progress WHERE session_id = ?', (session_id,)).rowcount
+        conn.commit()
+        if deleted:
+            self._notify()
+            logger.info(f"Session supprimée: {session_id}")
+
     def cleanup_old_sessions(self, max_age=3600):
-        with self.lock:
-            current_time = time.time()
-            deleted_count = 0
-            for session_file in self.storage_dir.glob("*.json"):
-                try:
-                    with open(session_file, 'r') as f:
-                        data = json.load(f)
-                    if current_time - data.get('last_update', 0) > max_age:
-                        session_file.unlink()
-                        deleted_count += 1
-                except Exception as e:
-                    logger.error(f"Erreur lors du nettoyage de {session_file}: {e}")
-            logger.info(f"Nettoyage: {deleted_count} sessions supprimées")
-            return deleted_count
-
-progress_manager = ProgressManager()
+        self.flush()
+        conn = get_connection(self.db_path)
+        deleted_count = conn.execute('DELETE FROM progress WHERE last_update < ?',
+                                     (time.time() - max_age,)).rowcount
+        conn.commit()
+        logger.info(f"Nettoyage: {deleted_count} sessions supprimées")
+        return deleted_count
+
+progress_manager = ProgressManager(Config.PROGRESS_DB_PATH, flush_interval=Config.PROGRESS_FLUSH_INTERVAL,
+                                   wait_poll_interval=Config.PROGRESS_WAIT_POLL_INTERVAL)
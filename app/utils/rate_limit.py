@@ -0,0 +1,116 @@
+"""
+PdfTools
+MOA Digital Agency LLC
+Par : Aisance KALONJI
+Mail : moa@myoneart.com
+www.myoneart.com
+"""
+
+import time
+import threading
+import logging
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
+
+logger = logging.getLogger(__name__)
+
+def parse_retry_after(value):
+    """Convertit un en-tête Retry-After (secondes ou date HTTP) en secondes, ou None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class HostLimiter:
+    """Limite par hôte: nombre maximum de requêtes en cours + token bucket (requêtes/seconde)
+
+    try_acquire ne bloque jamais: l'ordonnanceur passe à l'URL d'un autre hôte
+    quand celui-ci est saturé ou en pause après un 429/503.
+    """
+
+    def __init__(self, max_in_flight=4, rate=5.0, burst=5):
+        self.max_in_flight = max_in_flight
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.lock = threading.Lock()
+        self.in_flight = defaultdict(int)
+        self.tokens = {}
+        self.last_refill = {}
+        self.paused_until = {}
+
+    def _refill(self, host, now):
+        if host not in self.tokens:
+            self.tokens[host] = float(self.burst)
+        else:
+            elapsed = now - self.last_refill[host]
+            self.tokens[host] = min(float(self.burst), self.tokens[host] + elapsed * self.rate)
+        self.last_refill[host] = now
+
+    def try_acquire(self, host):
+        """Réserve un créneau pour host. Retourne (True, 0) ou (False, délai d'attente en secondes)
+
+        Le délai vaut None quand seul le nombre de requêtes en cours bloque:
+        l'hôte redevient disponible dès qu'une requête se termine.
+        """
+        with self.lock:
+            now = time.monotonic()
+            paused_until = self.paused_until.get(host, 0)
+            if paused_until > now:
+                return False, paused_until - now
+            if self.max_in_flight and self.in_flight[host] >= self.max_in_flight:
+                return False, None
+            if self.rate > 0:
+                self._refill(host, now)
+                if self.tokens[host] < 1:
+                    return False, (1 - self.tokens[host]) / self.rate
+                self.tokens[host] -= 1
+            self.in_flight[host] += 1
+            return True, 0
+
+    def release(self, host):
+        with self.lock:
+            if self.in_flight[host] > 0:
+                self.in_flight[host] -= 1
+
+    def pause(self, host, delay):
+        """Suspend les nouvelles requêtes vers host pendant delay secondes (429, 503, Retry-After)"""
+        with self.lock:
+            until = time.monotonic() + delay
+            if until > self.paused_until.get(host, 0):
+                self.paused_until[host] = until
+        logger.info(f"Hôte {host} en pause pendant {delay:.1f}s")
+
+class ConcurrencyBudget:
+    """Nombre maximum de téléchargements en cours partagé par plusieurs lots (0 = illimité)
+
+    Un budget peut avoir un parent (budget de session sous le budget du processus):
+    un créneau n'est accordé que s'il est disponible à tous les niveaux.
+    """
+
+    def __init__(self, limit, parent=None):
+        self.limit = limit
+        self.parent = parent
+        self.lock = threading.Lock()
+        self.in_flight = 0
+
+    def try_acquire(self):
+        with self.lock:
+            if self.limit and self.in_flight >= self.limit:
+                return False
+            if self.parent and not self.parent.try_acquire():
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            if self.in_flight > 0:
+                self.in_flight -= 1
+        if self.parent:
+            self.parent.release()
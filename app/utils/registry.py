@@ -0,0 +1,199 @@
+"""
+PdfTools
+MOA Digital Agency LLC
+Par : Aisance KALONJI
+Mail : moa@myoneart.com
+www.myoneart.com
+"""
+
+import json
+import time
+import threading
+import logging
+from app.utils.sqlite import get_connection
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Intervalle minimal entre deux purges des entrées expirées
+PURGE_INTERVAL = 60
+
+class MemoryRegistryBackend:
+    """Stockage en mémoire du processus (un seul worker, ou tests manuels)"""
+
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, namespace, key, now):
+        with self.lock:
+            entry = self.entries.get((namespace, key))
+            if entry is None or entry[1] <= now:
+                return None
+            return json.loads(entry[0])
+
+    def set(self, namespace, key, value, expires_at):
+        with self.lock:
+            self.entries[(namespace, key)] = (json.dumps(value), expires_at)
+
+    def set_many(self, namespace, items, expires_at):
+        with self.lock:
+            for key, value in items:
+                self.entries[(namespace, key)] = (json.dumps(value), expires_at)
+
+    def delete(self, namespace, key):
+        with self.lock:
+            return self.entries.pop((namespace, key), None) is not None
+
+    def modify(self, namespace, key, func, now, expires_at):
+        with self.lock:
+            entry = self.entries.get((namespace, key))
+            if entry is None or entry[1] <= now:
+                return None
+            value = func(json.loads(entry[0]))
+            self.entries[(namespace, key)] = (json.dumps(value), expires_at)
+            return value
+
+    def purge(self, now):
+        with self.lock:
+            expired = [k for k, (_, expires_at) in self.entries.items() if expires_at <= now]
+            for k in expired:
+                del self.entries[k]
+            return len(expired)
+
+class SQLiteRegistryBackend:
+    """Stockage SQLite (WAL) partagé par tous les workers gunicorn d'une même machine"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._init_db()
+
+    def _init_db(self):
+        conn = get_connection(self.db_path)
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS registry (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            );
+            CREATE INDEX IF NOT EXISTS idx_registry_expires ON registry (expires_at);
+        ''')
+        conn.commit()
+
+    def get(self, namespace, key, now):
+        conn = get_connection(self.db_path)
+        row = conn.execute('SELECT value FROM registry WHERE namespace = ? AND key = ? AND expires_at > ?',
+                           (namespace, key, now)).fetchone()
+        return json.loads(row['value']) if row else None
+
+    def set(self, namespace, key, value, expires_at):
+        conn = get_connection(self.db_path)
+        conn.execute('INSERT OR REPLACE INTO registry (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)',
+                     (namespace, key, json.dumps(value), expires_at))
+        conn.commit()
+
+    def set_many(self, namespace, items, expires_at):
+        conn = get_connection(self.db_path)
+        conn.executemany('INSERT OR REPLACE INTO registry (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)',
+                         [(namespace, key, json.dumps(value), expires_at) for key, value in items])
+        conn.commit()
+
+    def delete(self, namespace, key):
+        conn = get_connection(self.db_path)
+        deleted = conn.execute('DELETE FROM registry WHERE namespace = ? AND key = ?', (namespace, key)).rowcount
+        conn.commit()
+        return bool(deleted)
+
+    def modify(self, namespace, key, func, now, expires_at):
+        conn = get_connection(self.db_path)
+        try:
+            # Lecture-modification-écriture atomique entre processus
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT value FROM registry WHERE namespace = ? AND key = ? AND expires_at > ?',
+                               (namespace, key, now)).fetchone()
+            if not row:
+                conn.commit()
+                return None
+            value = func(json.loads(row['value']))
+            conn.execute('UPDATE registry SET value = ?, expires_at = ? WHERE namespace = ? AND key = ?',
+                         (json.dumps(value), expires_at, namespace, key))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return value
+
+    def purge(self, now):
+        conn = get_connection(self.db_path)
+        purged = conn.execute('DELETE FROM registry WHERE expires_at <= ?', (now,)).rowcount
+        conn.commit()
+        return purged
+
+REGISTRY_BACKENDS = {
+    'sqlite': lambda: SQLiteRegistryBackend(Config.REGISTRY_DB_PATH),
+    'memory': MemoryRegistryBackend
+}
+
+class SharedRegistry:
+    """Registre clé -> dict JSON avec expiration, visible de tous les workers
+
+    S'utilise comme un dict (in, [], get, pop, del). Les valeurs sont copiées à la
+    lecture: une modification en place n'est pas enregistrée, il faut réaffecter la
+    clé ou passer par modify() pour une mise à jour atomique. Chaque écriture repousse
+    l'expiration de ttl secondes; les entrées expirées sont purgées au fil des écritures.
+    """
+
+    def __init__(self, namespace, backend=None, ttl=None):
+        self.namespace = namespace
+        self.backend = backend or registry_backend
+        self.ttl = Config.REGISTRY_TTL_SECONDS if ttl is None else ttl
+        self._last_purge = 0.0
+
+    def _expires_at(self, now):
+        if time.time() - self._last_purge >= PURGE_INTERVAL:
+            self._last_purge = time.time()
+            purged = self.backend.purge(now)
+            if purged:
+                logger.info(f"Registre {self.namespace}: {purged} entrées expirées purgées")
+        return now + self.ttl
+
+    def get(self, key, default=None):
+        value = self.backend.get(self.namespace, str(key), time.time())
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __setitem__(self, key, value):
+        now = time.time()
+        self.backend.set(self.namespace, str(key), value, self._expires_at(now))
+
+    def update(self, entries):
+        """Écrit plusieurs clés en une seule transaction"""
+        now = time.time()
+        items = [(str(key), value) for key, value in entries.items()]
+        self.backend.set_many(self.namespace, items, self._expires_at(now))
+
+    def __delitem__(self, key):
+        if not self.backend.delete(self.namespace, str(key)):
+            raise KeyError(key)
+
+    def pop(self, key, default=None):
+        value = self.get(key)
+        self.backend.delete(self.namespace, str(key))
+        return default if value is None else value
+
+    def modify(self, key, func):
+        """Applique func(valeur) -> nouvelle valeur de façon atomique; None si la clé est absente"""
+        now = time.time()
+        return self.backend.modify(self.namespace, str(key), func, now, self._expires_at(now))
+
+registry_backend = REGISTRY_BACKENDS[Config.REGISTRY_BACKEND]()
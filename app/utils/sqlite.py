@@ -0,0 +1,39 @@
+"""
+PdfTools
+MOA Digital Agency LLC
+Par : Aisance KALONJI
+Mail : moa@myoneart.com
+www.myoneart.com
+"""
+
+import os
+import sqlite3
+import threading
+from config import Config
+
+_local = threading.local()
+
+def get_connection(db_path):
+    """Connexion SQLite réutilisée par thread pour db_path
+
+    Mode WAL (lecteurs et écrivain concurrents), synchronous=NORMAL, attente des
+    verrous (busy_timeout) au lieu d'un échec immédiat « database is locked »,
+    lecture par mmap et cache des requêtes préparées de la connexion.
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None or _local.pid != os.getpid():
+        # Après un fork (gunicorn --preload), les connexions du parent ne sont pas réutilisées
+        connections = _local.connections = {}
+        _local.pid = os.getpid()
+    conn = connections.get(db_path)
+    if conn is None:
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        conn = sqlite3.connect(db_path, timeout=Config.SQLITE_BUSY_TIMEOUT_MS / 1000,
+                               cached_statements=Config.SQLITE_CACHED_STATEMENTS)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={Config.SQLITE_BUSY_TIMEOUT_MS}')
+        conn.execute(f'PRAGMA mmap_size={Config.SQLITE_MMAP_SIZE}')
+        connections[db_path] = conn
+    return conn
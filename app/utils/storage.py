@@ -9,6 +9,12 @@ www.myoneart.com
 import os
 import time
 import shutil
+import threading
+import logging
+from app.utils.sqlite import get_connection
+from config import Config
+
+logger = logging.getLogger(__name__)
 
 def cleanup_temp_file(file_path):
     try:
@@ -19,33 +25,138 @@ def cleanup_temp_file(file_path):
         print(f"Error cleaning up file {file_path}: {e}")
     return False
 
-def cleanup_old_temp_files(temp_folder, max_age_seconds=3600):
-    """Nettoie les fichiers temporaires plus vieux que max_age_seconds (défaut: 1 heure)"""
-    cleaned_count = 0
-    try:
-        current_time = time.time()
-        
-        if not os.path.exists(temp_folder):
-            return cleaned_count
-            
-        for item in os.listdir(temp_folder):
-            item_path = os.path.join(temp_folder, item)
-            
+class TempExpiryIndex:
+    """Index SQLite des entrées de TEMP_FOLDER par date d'expiration
+
+    purge_expired() ne consulte que les entrées échues (index sur expires_at) au lieu
+    de lister et stater tout le dossier. Une entrée modifiée depuis son inscription
+    (mtime plus récent) est reprogrammée à mtime + ttl plutôt que supprimée, comme le
+    faisait le nettoyage par âge. adopt_untracked() inscrit, lors d'un passage de fond
+    peu fréquent, les entrées créées sans passer par track().
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._init_db()
+
+    def _init_db(self):
+        conn = get_connection(self.db_path)
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS temp_entries (
+                path TEXT PRIMARY KEY,
+                ttl REAL NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_temp_entries_expires ON temp_entries (expires_at);
+        ''')
+        conn.commit()
+
+    def track(self, path, ttl):
+        """Inscrit path (fichier ou dossier) pour suppression dans ttl secondes"""
+        conn = get_connection(self.db_path)
+        conn.execute('INSERT OR REPLACE INTO temp_entries (path, ttl, expires_at) VALUES (?, ?, ?)',
+                     (path, ttl, time.time() + ttl))
+        conn.commit()
+
+    def purge_expired(self, limit=500):
+        """Supprime les entrées échues (au plus limit); retourne le nombre d'entrées supprimées du disque"""
+        now = time.time()
+        conn = get_connection(self.db_path)
+        rows = conn.execute('SELECT path, ttl, expires_at FROM temp_entries WHERE expires_at <= ? ORDER BY expires_at LIMIT ?',
+                            (now, limit)).fetchall()
+        cleaned_count = 0
+        forgotten = []
+        rescheduled = []
+        for row in rows:
+            path = row['path']
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                forgotten.append((path,))
+                continue
+            if mtime + row['ttl'] > now:
+                rescheduled.append((mtime + row['ttl'], path))
+                continue
             try:
-                if os.path.isfile(item_path):
-                    file_age = current_time - os.path.getmtime(item_path)
-                    if file_age > max_age_seconds:
-                        os.remove(item_path)
-                        cleaned_count += 1
-                elif os.path.isdir(item_path):
-                    dir_age = current_time - os.path.getmtime(item_path)
-                    if dir_age > max_age_seconds:
-                        shutil.rmtree(item_path)
-                        cleaned_count += 1
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+                cleaned_count += 1
+            except FileNotFoundError:
+                pass
             except Exception as e:
-                print(f"Error cleaning {item_path}: {e}")
-                
+                logger.error(f"Erreur de nettoyage de {path}: {e}")
+                rescheduled.append((now + row['ttl'], path))
+                continue
+            forgotten.append((path,))
+        conn.executemany('DELETE FROM temp_entries WHERE path = ?', forgotten)
+        conn.executemany('UPDATE temp_entries SET expires_at = ? WHERE path = ?', rescheduled)
+        conn.commit()
+        return cleaned_count
+
+    def adopt_untracked(self, temp_folder, ttl_for):
+        """Inscrit les entrées de temp_folder absentes de l'index (expiration = mtime + ttl_for(nom))"""
+        if not os.path.isdir(temp_folder):
+            return 0
+        entries = []
+        with os.scandir(temp_folder) as it:
+            for entry in it:
+                try:
+                    ttl = ttl_for(entry.name)
+                    entries.append((entry.path, ttl, entry.stat(follow_symlinks=False).st_mtime + ttl))
+                except OSError:
+                    continue
+        conn = get_connection(self.db_path)
+        adopted = conn.executemany('INSERT OR IGNORE INTO temp_entries (path, ttl, expires_at) VALUES (?, ?, ?)',
+                                   entries).rowcount
+        conn.commit()
+        return adopted
+
+def temp_entry_ttl(name):
+    """Durée de vie d'une entrée de TEMP_FOLDER: plus longue pour les sessions de lots (reprenables)"""
+    if name.startswith('session_'):
+        return Config.TEMP_SESSION_MAX_AGE
+    return Config.TEMP_MAX_AGE
+
+temp_index = TempExpiryIndex(Config.TEMP_INDEX_DB_PATH)
+
+def track_temp(path):
+    """Inscrit une entrée de TEMP_FOLDER dans l'index d'expiration"""
+    try:
+        temp_index.track(path, temp_entry_ttl(os.path.basename(path)))
     except Exception as e:
-        print(f"Error cleaning temp folder: {e}")
-    
+        logger.error(f"Erreur d'inscription de {path} dans l'index d'expiration: {e}")
+
+def run_temp_cleanup():
+    """Un passage de nettoyage: entrées temporaires échues et sessions de progression inactives"""
+    from app.utils.progress import progress_manager
+    cleaned_count = temp_index.purge_expired()
+    progress_manager.cleanup_old_sessions(max_age=Config.TEMP_MAX_AGE)
     return cleaned_count
+
+def start_temp_janitor(app):
+    """Thread de fond qui nettoie TEMP_FOLDER et la progression (TEMP_CLEANUP_INTERVAL = 0 pour le désactiver)"""
+    if Config.TEMP_CLEANUP_INTERVAL <= 0:
+        return None
+    temp_folder = app.config['TEMP_FOLDER']
+
+    def run():
+        last_adopt = 0.0
+        while True:
+            try:
+                if time.time() - last_adopt >= Config.TEMP_RESCAN_INTERVAL:
+                    last_adopt = time.time()
+                    adopted = temp_index.adopt_untracked(temp_folder, temp_entry_ttl)
+                    if adopted:
+                        logger.info(f"Index d'expiration: {adopted} entrées non inscrites ajoutées")
+                cleaned_count = run_temp_cleanup()
+                if cleaned_count:
+                    logger.info(f"Nettoyage de fond: {cleaned_count} entrées temporaires supprimées")
+            except Exception as e:
+                logger.error(f"Erreur du nettoyage de fond: {e}")
+            time.sleep(Config.TEMP_CLEANUP_INTERVAL)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,86 @@
+"""
+PdfTools
+MOA Digital Agency LLC
+Par : Aisance KALONJI
+Mail : moa@myoneart.com
+www.myoneart.com
+
+Benchmark des moteurs de téléchargement ('threads' vs 'async') contre un
+serveur HTTP local qui simule la latence d'un serveur d'archives.
+
+Usage : python benchmark_download_engines.py [--urls 500] [--latency 0.2] [--size 50000]
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 0.2
+    body = b''
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/pdf')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+class _StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+def start_stand_in_server(latency, size):
+    _StandInHandler.latency = latency
+    _StandInHandler.body = b'%PDF-1.4\n' + os.urandom(size) + b'\n%%EOF\n'
+    server = _StandInServer(('127.0.0.1', 0), _StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--urls', type=int, default=500, help="nombre d'URLs à télécharger")
+    parser.add_argument('--latency', type=float, default=0.2, help='latence simulée par requête (s)')
+    parser.add_argument('--size', type=int, default=50000, help='taille de chaque PDF (octets)')
+    parser.add_argument('--threads', type=int, default=5, help='workers du moteur threads')
+    parser.add_argument('--concurrency', type=int, default=200, help='concurrence du moteur async')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    from app.services.pdf_downloader import download_pdfs_and_zip
+    from app.utils.rate_limit import HostLimiter, ConcurrencyBudget
+
+    server = start_stand_in_server(args.latency, args.size)
+    host, port = server.server_address
+    urls = [f'http://{host}:{port}/decision_{i}.pdf' for i in range(args.urls)]
+
+    print(f"{args.urls} URLs, latence {args.latency}s, {args.size} octets par PDF")
+    for engine, workers in (('threads', args.threads), ('async', args.concurrency)):
+        temp_folder = tempfile.mkdtemp(prefix='bench_')
+        try:
+            start = time.perf_counter()
+            # Un seul hôte local: limites par hôte et budget global désactivés pour mesurer les moteurs eux-mêmes
+            result = download_pdfs_and_zip(urls, temp_folder, max_workers=workers, engine=engine,
+                                           limiter=HostLimiter(max_in_flight=0, rate=0),
+                                           budget=ConcurrencyBudget(0))
+            elapsed = time.perf_counter() - start
+            print(f"  {result.get('engine', engine):8s} workers={workers:<4d} "
+                  f"{elapsed:7.2f}s  {args.urls / elapsed:8.1f} PDF/s  "
+                  f"succès={result.get('successful', 0)} échecs={result.get('failed', 0)}")
+        finally:
+            shutil.rmtree(temp_folder, ignore_errors=True)
+
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
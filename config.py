@@ -20,6 +20,77 @@ class Config:
     TEMP_FOLDER = os.path.join(os.getcwd(), 'tmp')
     MAX_CONTENT_LENGTH = 500 * 1024 * 1024  # 500 MB max upload size
     
+    # Pool de connexions HTTP sortantes (keep-alive partagé)
+    HTTP_POOL_CONNECTIONS = int(os.environ.get('HTTP_POOL_CONNECTIONS', 20))  # hôtes gardés en cache
+    HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', 10))  # connexions par hôte
+    
+    # Téléchargement de PDFs: moteur 'threads' ou 'async' (asyncio + aiohttp)
+    DOWNLOAD_ENGINE = os.environ.get('DOWNLOAD_ENGINE', 'threads')
+    DOWNLOAD_MAX_WORKERS = int(os.environ.get('DOWNLOAD_MAX_WORKERS', 5))
+    ASYNC_MAX_CONCURRENCY = int(os.environ.get('ASYNC_MAX_CONCURRENCY', 200))
+    # Téléchargement automatique: lots traités en parallèle, plafond de téléchargements en cours pour toutes
+    # les sessions automatiques du processus (plafonne aussi le global_budget demandé par session)
+    AUTO_PARALLEL_BATCHES = int(os.environ.get('AUTO_PARALLEL_BATCHES', 2))
+    DOWNLOAD_GLOBAL_BUDGET = int(os.environ.get('DOWNLOAD_GLOBAL_BUDGET', 20))  # 0 = illimité
+    DOWNLOAD_MAX_PDF_BYTES = int(os.environ.get('DOWNLOAD_MAX_PDF_MB', 500)) * 1024 * 1024  # 0 = sans limite
+    # File de jobs persistante (téléchargements, fusions, extractions) partagée par les workers gunicorn
+    JOBS_DB_PATH = os.path.join(os.getcwd(), 'instance', 'jobs.db')
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 4))  # threads d'exécution par processus (0 = aucun)
+    JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 60))
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+    JOB_WAIT_TIMEOUT = int(os.environ.get('JOB_WAIT_TIMEOUT', 540))  # attente max d'une route synchrone (< timeout gunicorn)
+    # Registres des résultats (download_id, sessions de lots, analyses): 'sqlite' (partagé entre workers) ou 'memory'
+    REGISTRY_BACKEND = os.environ.get('REGISTRY_BACKEND', 'sqlite')
+    REGISTRY_DB_PATH = os.path.join(os.getcwd(), 'instance', 'registry.db')
+    REGISTRY_TTL_SECONDS = int(os.environ.get('REGISTRY_TTL_HOURS', 24)) * 3600
+    # Progression des sessions (instance/progress.db): champs regroupés en mémoire et écrits toutes les N ms
+    PROGRESS_DB_PATH = os.path.join(os.getcwd(), 'instance', 'progress.db')
+    PROGRESS_FLUSH_INTERVAL = int(os.environ.get('PROGRESS_FLUSH_MS', 250)) / 1000
+    PROGRESS_WAIT_POLL_INTERVAL = int(os.environ.get('PROGRESS_WAIT_POLL_MS', 500)) / 1000  # relecture des écritures des autres workers
+    PROGRESS_HEARTBEAT_SECONDS = int(os.environ.get('PROGRESS_HEARTBEAT_SECONDS', 15))  # commentaire SSE si rien ne change
+    PROGRESS_LONG_POLL_TIMEOUT = int(os.environ.get('PROGRESS_LONG_POLL_TIMEOUT', 25))  # attente max de /progress/<id>/poll
+    PROGRESS_STREAM_TICK = int(os.environ.get('PROGRESS_STREAM_TICK_MS', 500)) / 1000  # regroupement des deltas de /progress/stream
+    PROGRESS_ACTIVE_SECONDS = int(os.environ.get('PROGRESS_ACTIVE_SECONDS', 3600))  # sessions suivies par /progress/stream sans filtre
+    
+    # Connexions SQLite (une par thread et par base): attente des verrous, lecture mmap, requêtes préparées en cache
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 30000))
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_MB', 64)) * 1024 * 1024
+    SQLITE_CACHED_STATEMENTS = int(os.environ.get('SQLITE_CACHED_STATEMENTS', 256))
+    
+    # Logs (add_log): écrits en arrière-plan par lots de LOG_BATCH_SIZE ou toutes les LOG_FLUSH_MS
+    LOG_ASYNC = os.environ.get('LOG_ASYNC', '1') == '1'
+    LOG_BATCH_SIZE = int(os.environ.get('LOG_BATCH_SIZE', 100))
+    LOG_FLUSH_INTERVAL = int(os.environ.get('LOG_FLUSH_MS', 200)) / 1000
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))  # file pleine: écriture directe
+    
+    # Nettoyage de TEMP_FOLDER par index d'expiration (instance/temp_index.db), en tâche de fond
+    TEMP_INDEX_DB_PATH = os.path.join(os.getcwd(), 'instance', 'temp_index.db')
+    TEMP_MAX_AGE = int(os.environ.get('TEMP_MAX_AGE_MINUTES', 60)) * 60
+    TEMP_SESSION_MAX_AGE = int(os.environ.get('TEMP_SESSION_MAX_AGE_HOURS', 24)) * 3600  # dossiers session_* (lots reprenables)
+    TEMP_CLEANUP_INTERVAL = int(os.environ.get('TEMP_CLEANUP_INTERVAL', 60))  # secondes entre deux passages (0 = désactivé)
+    TEMP_RESCAN_INTERVAL = int(os.environ.get('TEMP_RESCAN_INTERVAL', 900))  # inscription des entrées créées hors index
+    
+    # Sessions de lots: session.json n'est réécrit que lorsque son journal d'événements dépasse cette taille
+    SESSION_JOURNAL_COMPACT_BYTES = int(os.environ.get('SESSION_JOURNAL_COMPACT_KB', 256)) * 1024
+    
+    # Limites par hôte (0 = illimité): requêtes en cours, requêtes/seconde (token bucket)
+    HOST_MAX_IN_FLIGHT = int(os.environ.get('HOST_MAX_IN_FLIGHT', 8))
+    HOST_RATE_LIMIT = float(os.environ.get('HOST_RATE_LIMIT', 20))
+    HOST_RATE_BURST = int(os.environ.get('HOST_RATE_BURST', 20))
+    HOST_MAX_DEFERRALS = int(os.environ.get('HOST_MAX_DEFERRALS', 5))  # reports max d'une URL après 429/503
+    
+    # Cache disque des PDFs téléchargés (revalidation ETag / Last-Modified)
+    DOWNLOAD_CACHE_ENABLED = os.environ.get('DOWNLOAD_CACHE_ENABLED', '1') == '1'
+    DOWNLOAD_CACHE_DIR = os.path.join(os.getcwd(), 'instance', 'download_cache')
+    DOWNLOAD_CACHE_MAX_BYTES = int(os.environ.get('DOWNLOAD_CACHE_MAX_MB', 2048)) * 1024 * 1024
+    
+    # Compression des archives ZIP: un membre n'est compressé que si l'échantillon gagne au moins ZIP_MIN_DEFLATE_GAIN
+    ZIP_DEFLATE_LEVEL = int(os.environ.get('ZIP_DEFLATE_LEVEL', 6))
+    ZIP_MIN_DEFLATE_GAIN = float(os.environ.get('ZIP_MIN_DEFLATE_GAIN', 0.05))
+    ZIP_SAMPLE_SIZE = 64 * 1024
+    # Téléchargements /downloader et /merger: ZIP généré à la volée au lieu d'être construit sur disque
+    STREAM_ZIP_DOWNLOADS = os.environ.get('STREAM_ZIP_DOWNLOADS', '0') == '1'
+    
     @staticmethod
     def init_app(app):
         os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
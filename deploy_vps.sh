@@ -70,13 +70,17 @@ echo "🛑 Arrêt de l'application existante..."
 pkill -f "gunicorn.*main:app" || echo "Aucune application en cours d'exécution"
 sleep 2
 
-# 8. Lancement de l'application avec gunicorn depuis le venv
+# 8. Migration de la base avant le démarrage des workers
+echo "🗄️  Migration de la base de données..."
+venv/bin/python migrate_db.py || { echo "❌ Échec de la migration de la base"; exit 1; }
+
+# 9. Lancement de l'application avec gunicorn depuis le venv
 echo "🚀 Lancement de l'application..."
 echo "   Port: 5003"
-echo "   Workers: 4"
+echo "   Workers: 4 (16 threads chacun)"
 
 # Lancer gunicorn en arrière-plan
-nohup venv/bin/gunicorn --bind 0.0.0.0:5003 --workers 4 --timeout 600 --graceful-timeout 600 --limit-request-line 0 --limit-request-field_size 0 --reuse-port main:app > gunicorn.log 2>&1 &
+nohup venv/bin/gunicorn --bind 0.0.0.0:5003 --workers 4 --threads 16 --timeout 600 --graceful-timeout 600 --limit-request-line 0 --limit-request-field_size 0 --reuse-port main:app > gunicorn.log 2>&1 &
 
 # Attendre que l'application démarre
 sleep 3
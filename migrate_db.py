@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+"""
+PdfTools
+MOA Digital Agency LLC
+Par : Aisance KALONJI
+Mail : moa@myoneart.com
+www.myoneart.com
+
+Crée et migre la base des logs (instance/logs.db) avant le démarrage de gunicorn
+Usage: python3 migrate_db.py
+
+Les workers n'ont plus de migration à appliquer au boot et démarrent immédiatement.
+"""
+
+from app.models import init_db, DATABASE_PATH, SCHEMA_VERSION
+
+if __name__ == '__main__':
+    print(f"🗄️  Migration de {DATABASE_PATH} (schéma v{SCHEMA_VERSION})...")
+    init_db()
+    print("✅ Base de données à jour")
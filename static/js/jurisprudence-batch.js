@@ -1,3 +1,6 @@
+// Nombre d'uploads de PDF envoyés en parallèle
+const UPLOAD_CONCURRENCY = 3;
+
 let currentSession = {
     id: null,
     name: '',
@@ -104,35 +107,48 @@ document.getElementById('uploadForm').addEventListener('submit', async function(
     document.getElementById('uploadStatus').classList.remove('hidden');
     document.getElementById('filesTotalProgress').textContent = files.length;
     
-    for (let i = 0; i < files.length; i++) {
-        const file = files[i];
-        document.getElementById('currentFile').textContent = file.name;
-        document.getElementById('fileProgress').textContent = i + 1;
-        
-        const formData = new FormData();
-        formData.append('pdf_file', file);
-        formData.append('session_id', currentSession.id);
-        
-        try {
-            const response = await fetch(API_URLS.addPdf, {
-                method: 'POST',
-                body: formData
-            });
+    let nextIndex = 0;
+    let started = 0;
+    
+    async function uploadWorker() {
+        while (nextIndex < files.length) {
+            const file = files[nextIndex++];
+            started++;
+            document.getElementById('currentFile').textContent = file.name;
+            document.getElementById('fileProgress').textContent = started;
             
-            const data = await response.json();
+            const formData = new FormData();
+            formData.append('pdf_file', file);
+            formData.append('session_id', currentSession.id);
             
-            if (data.success) {
-                currentSession.currentCount = data.current_count;
-                currentSession.files.push(file.name);
-                updateProgress();
-            } else {
-                console.error(`Erreur upload ${file.name}:`, data.error);
+            try {
+                const response = await fetch(API_URLS.addPdf, {
+                    method: 'POST',
+                    body: formData
+                });
+                
+                const data = await response.json();
+                
+                if (data.success) {
+                    // Les réponses peuvent arriver dans le désordre: garder le compteur le plus élevé
+                    currentSession.currentCount = Math.max(currentSession.currentCount, data.current_count);
+                    currentSession.files.push(file.name);
+                    updateProgress();
+                } else {
+                    console.error(`Erreur upload ${file.name}:`, data.error);
+                }
+            } catch (error) {
+                console.error(`Erreur upload ${file.name}:`, error);
             }
-        } catch (error) {
-            console.error(`Erreur upload ${file.name}:`, error);
         }
     }
     
+    const workers = [];
+    for (let i = 0; i < Math.min(UPLOAD_CONCURRENCY, files.length); i++) {
+        workers.push(uploadWorker());
+    }
+    await Promise.all(workers);
+    
     document.getElementById('uploadBtn').disabled = false;
     document.getElementById('uploadStatus').classList.add('hidden');
     fileInput.value = '';